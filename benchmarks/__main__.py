@@ -0,0 +1,100 @@
+"""Runs the benchmark suite and compares the results with the baselines.
+
+    python -m benchmarks                  # Runs every benchmark
+    python -m benchmarks parse_multiplier # Runs only the specified ones
+    python -m benchmarks --check          # Fails if any benchmark has regressed
+    python -m benchmarks --save           # Saves the results as the new baselines
+
+Baselines depend on the machine, so they should be saved again on the machine
+used to check them"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import timeit
+
+from benchmarks.suite import BENCHMARKS
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+
+def run_benchmark(setup, repeat=5):
+    """Returns the best time of `repeat` runs, in seconds"""
+    times = []
+
+    for _ in range(repeat):
+        # The scrapper and the factories are quite verbose
+        with contextlib.redirect_stdout(io.StringIO()):
+            run = setup()
+            times.append(timeit.Timer(run).timeit(number=1))
+
+    return min(times)
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as baselines_file:
+        return json.load(baselines_file)
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    baselines = load_baselines(path)
+    baselines.update({name: round(seconds, 6) for name, seconds in results.items()})
+
+    with open(path, 'w') as baselines_file:
+        json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        baselines_file.write('\n')
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Runs the benchmark suite')
+    parser.add_argument('names', nargs='*', help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each benchmark; the best one is used')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='times slower than the baseline a benchmark must be to be a regression')
+    parser.add_argument('--check', action='store_true', help='exit with an error if there are regressions')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baselines')
+    arguments = parser.parse_args(arguments)
+
+    unknown_names = [name for name in arguments.names if name not in BENCHMARKS]
+    if unknown_names:
+        parser.error(f'unknown benchmarks: {", ".join(unknown_names)}. Available: {", ".join(BENCHMARKS)}')
+
+    baselines = load_baselines()
+    results = {}
+    regressions = []
+
+    for name in arguments.names or BENCHMARKS:
+        results[name] = run_benchmark(BENCHMARKS[name], repeat=arguments.repeat)
+
+        line = f'{name:>32}: {results[name] * 1000:9.2f} ms'
+        if name in baselines:
+            ratio = results[name] / baselines[name]
+            line += f'  (baseline {baselines[name] * 1000:9.2f} ms, x{ratio:.2f})'
+
+            if ratio > arguments.threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+
+        print(line)
+
+    if arguments.save:
+        save_baselines(results)
+        print(f'Baselines saved in {BASELINES_PATH}')
+
+    if regressions:
+        print(f'{len(regressions)} benchmarks are more than {arguments.threshold} times slower than their baseline: '
+              f'{", ".join(regressions)}')
+
+        if arguments.check:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""Compares parsing a column of multipliers one string at a time, with
+MedalFactory.parse_multiplier, against the batch parser used on bulk ingestion.
+
+Run it with `python -m benchmarks.bench_multiplier`"""
+import random
+import timeit
+
+from khux_medal_finder.exceptions import ParseMultiplierError
+from khux_medal_finder.factories import MedalFactory
+from khux_medal_finder.helpers import parse_multipliers
+
+# Formats found on khuxbot, with a few broken values
+MULTIPLIER_FORMATS = ('x1.5', '1.2~2.4', 'x3.0-4.5', 'x2.10-3.28', '  x3.97~7.12  ', 'x1.99-3.35', '', 'N/A')
+
+
+def multipliers_column(size=20000, seed=0):
+    generator = random.Random(seed)
+    return [generator.choice(MULTIPLIER_FORMATS) for _ in range(size)]
+
+
+def scalar_multipliers(column):
+    multipliers = []
+    for multiplier_string in column:
+        try:
+            multipliers.append(MedalFactory.parse_multiplier(multiplier_string))
+        except ParseMultiplierError:
+            multipliers.append(None)
+
+    return multipliers
+
+
+def main(repeat=5):
+    column = multipliers_column()
+    runs = (
+        ('scalar', lambda: scalar_multipliers(column)),
+        ('batch', lambda: parse_multipliers(column)),
+    )
+
+    for name, run in runs:
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f'{name:>8}: {best * 1000:8.2f} ms for {len(column)} multipliers '
+              f'({best / len(column) * 1e6:.2f} us/multiplier)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compares the keyword tokenizer used by RequirementExtractor and
+requirements_batch with the old approach of looking for every keyword as a
+substring. The extractor row also includes building the RequirementExtractor
+and timing it with the requirements_extraction metric.
+
+Run it with `python -m benchmarks.bench_requirement_extractor`"""
+import random
+import timeit
+
+from khux_medal_finder.comment import TOKENIZER, RequirementExtractor, requirements_batch
+
+FILLER_WORDS = ('the', 'medal', 'deck', 'raid', 'boss', 'guilt', 'I', 'need', 'help', 'with', 'my', 'setup',
+                'which', 'is', 'better', 'for', 'this', 'event', 'any', 'suggestions', 'thanks', 'lol', 'pulled',
+                'powerful', 'multiple', 'randomly', 'keyblade', 'tier', 'SP', 'gauge', 'Sora', 'Kairi')
+KEYWORDS = ('power', 'speed', 'magic', 'PSM', 'single', 'random', 'AoE', 'multi', 'upright', 'reversed')
+
+
+def comments_corpus(size=10000, seed=0):
+    """Returns `size` random comments of 5 to 60 words, half of them asking for medals"""
+    generator = random.Random(seed)
+    comments = []
+
+    for position in range(size):
+        words = [generator.choice(FILLER_WORDS) for _ in range(generator.randint(5, 60))]
+        if position % 2:
+            words += generator.sample(KEYWORDS, generator.randint(1, 4))
+            generator.shuffle(words)
+        comments.append(' '.join(words))
+
+    return comments
+
+
+def substring_requirements(comment):
+    """The previous implementation: one substring scan of the comment per keyword"""
+    comment = comment.lower()
+    elements = [element for element in ('power', 'speed', 'magic') if element in comment]
+    if 'psm' in comment:
+        elements = ['power', 'magic', 'speed']
+    targets = [target for target in ('single', 'random') if target in comment]
+    if any(word in comment for word in ['aoe', 'multi']):
+        targets.append('all')
+    direction = [direction for direction in ('upright', 'reversed') if direction in comment]
+
+    return elements, targets, direction
+
+
+def tokenizer_requirements(comment):
+    """The same work as substring_requirements, with the keyword tokenizer"""
+    return TOKENIZER.requirements(TOKENIZER.find(comment.lower()))
+
+
+def extractor_requirements(comment):
+    extractor = RequirementExtractor(comment)
+    extractor.extract_requirements()
+    return extractor.requirements
+
+
+def main(repeat=5):
+    comments = comments_corpus()
+    runs = (
+        ('substring scans', lambda: [substring_requirements(comment) for comment in comments]),
+        ('tokenizer', lambda: [tokenizer_requirements(comment) for comment in comments]),
+        ('extractor', lambda: [extractor_requirements(comment) for comment in comments]),
+        ('batch', lambda: list(requirements_batch(comments))),
+    )
+
+    for name, run in runs:
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f'{name:>16}: {best * 1000:8.2f} ms for {len(comments)} comments '
+              f'({best / len(comments) * 1e6:.2f} us/comment)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Benchmarks of the hot paths of the bot and the scrapper, run on synthetic
+data. The DB is an in-memory SQLite one and khuxbot is mocked, so they can run
+anywhere without any setup.
+
+Each benchmark is a `setup` function returning the function to time. Setup is
+run again before every repetition, so runs don't affect each other"""
+import random
+import re
+from collections import OrderedDict
+from urllib.parse import unquote
+
+import peewee
+import requests_mock
+
+from benchmarks.bench_multiplier import multipliers_column, scalar_multipliers
+from benchmarks.bench_requirement_extractor import comments_corpus, extractor_requirements
+from khux_medal_finder import helpers
+from khux_medal_finder.api import HttpClient, Scrapper, Search
+from khux_medal_finder.comment import REQUIREMENT_VALUES, Requirements, requirements_batch
+from khux_medal_finder.factories import MedalFactory
+from khux_medal_finder.models import BaseModel, Comment, Medal, PendingReply, Reply, SearchCombination, SyncState
+from khux_medal_finder.precomputed import PrecomputedSearch, precompute_search_combinations
+
+MODELS = [BaseModel, Medal, SyncState, SearchCombination, Comment, Reply, PendingReply]
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def medals_json(size=2000, seed=0):
+    """Returns `size` random combat medals, as returned by khuxbot"""
+    generator = random.Random(seed)
+    multipliers = multipliers_column(size, seed)
+    medals = []
+
+    for medal_id in range(size):
+        medals.append({'cost': generator.randint(1, 6), 'defence': generator.randint(4000, 6000),
+                       'direction': generator.choice(REQUIREMENT_VALUES['direction']),
+                       'element': generator.choice(REQUIREMENT_VALUES['elements']),
+                       'hits': generator.randint(1, 15), 'id': medal_id,
+                       'image_link': f'/static/medal_images//Medal_{medal_id}_6.png',
+                       'multiplier': multipliers[medal_id] or 'x1.50', 'name': f'Medal {medal_id}',
+                       'notes': 'Increases your power attack by two steps for two turns; deals more damage',
+                       'pullable': 'Yes', 'rarity': 6, 'region': 'na', 'strength': generator.randint(4000, 6000),
+                       'targets': generator.choice(REQUIREMENT_VALUES['targets']),
+                       'tier': generator.randint(1, 9), 'type': 'Combat', 'voice_link': None})
+
+    return medals
+
+
+def medals_json_by_name(medals_json):
+    medals = {}
+    for medal_json in medals_json:
+        medals.setdefault(medal_json['name'].lower(), []).append(medal_json)
+
+    return medals
+
+
+def empty_db():
+    """Binds the models to a new in-memory DB, with empty tables"""
+    database = peewee.SqliteDatabase(':memory:')
+    database.bind(MODELS, bind_refs=False, bind_backrefs=False)
+    database.connect()
+    database.create_tables(MODELS)
+
+    return database
+
+
+def mocked_khuxbot(medals_json):
+    """Returns a requests_mock.Mocker answering the search and data endpoints of
+    khuxbot with the medals"""
+    medals_by_name = medals_json_by_name(medals_json)
+    mocker = requests_mock.Mocker()
+
+    def names(request, context):
+        return {'names': list(medals_by_name)}
+
+    def medal_data(request, context):
+        medals = medals_by_name.get(request.qs['medal'][0], [])
+        return {'medal': {str(position): medal for position, medal in enumerate(medals)}} if medals else {'error': ''}
+
+    def search(request, context):
+        filters = dict(re.findall(r'"(\w+)":\s*"?([^",}]+)"?', unquote(request.url)))
+        medals = [medal for medal in medals_json if all(str(medal[name]) == value for name, value in filters.items())]
+        return {'medal': {str(position): medal for position, medal in enumerate(medals)}}
+
+    mocker.get(re.compile(r'.*q=names'), json=names)
+    mocker.get(re.compile(r'.*q=data&medal='), json=medal_data)
+    mocker.get(re.compile(r'.*q=data&filter='), json=search)
+
+    return mocker
+
+
+@benchmark
+def requirement_extractor():
+    comments = comments_corpus(5000)
+    return lambda: [extractor_requirements(comment) for comment in comments]
+
+
+@benchmark
+def requirements_batch_extraction():
+    comments = comments_corpus(5000)
+    return lambda: list(requirements_batch(comments))
+
+
+@benchmark
+def parse_multiplier():
+    column = multipliers_column(10000)
+    return lambda: scalar_multipliers(column)
+
+
+@benchmark
+def parse_multipliers_batch():
+    column = multipliers_column(10000)
+    return lambda: helpers.parse_multipliers(column)
+
+
+@benchmark
+def medal_factory_medal():
+    medals = medals_json(1000)
+    empty_db()
+    return lambda: [MedalFactory.medal(medal_json) for medal_json in medals]
+
+
+@benchmark
+def medal_factory_medals():
+    medals = medals_json(5000)
+    empty_db()
+    return lambda: MedalFactory.medals(medals)
+
+
+def reply_medals():
+    empty_db()
+    MedalFactory.medals(medals_json(2000))
+    return list(Medal.select())
+
+
+@benchmark
+def prepare_reply_body_cold():
+    medals = reply_medals()
+    helpers.clear_rendered_medals()
+    return lambda: [helpers.prepare_reply_body(medals[start:start + 10]) for start in range(0, len(medals), 10)]
+
+
+@benchmark
+def prepare_reply_body_warm():
+    medals = reply_medals()
+    for start in range(0, len(medals), 10):
+        helpers.prepare_reply_body(medals[start:start + 10])
+
+    return lambda: [helpers.prepare_reply_body(medals[start:start + 10]) for start in range(0, len(medals), 10)]
+
+
+@benchmark
+def search_combine_searches():
+    mocker = mocked_khuxbot(medals_json(2000))
+    filters = Requirements(*(tuple(REQUIREMENT_VALUES[field]) for field in Requirements._fields)).filters()
+
+    def run():
+        search = Search(http_client=HttpClient())
+        with mocker:
+            return search.combine_searches(filters)
+
+    return run
+
+
+@benchmark
+def scrapper_scrape_missing_medals():
+    mocker = mocked_khuxbot(medals_json(500))
+    empty_db()
+
+    def run():
+        scrapper = Scrapper(http_client=HttpClient(pool_size=4))
+        with mocker:
+            return scrapper.scrape_missing_medals(workers=4)
+
+    return run
+
+
+@benchmark
+def precomputed_combine_searches():
+    reply_medals()
+    precompute_search_combinations()
+    search = PrecomputedSearch()
+    filters = Requirements(*(tuple(REQUIREMENT_VALUES[field]) for field in Requirements._fields)).filters()
+
+    return lambda: [search.combine_searches(filters[:size], limit=helpers.REPLY_MAX_MEDALS)
+                    for size in range(1, len(filters) + 1)]
@@ -0,0 +1,266 @@
+"""Asyncio versions of the search, the Reddit service and the bot, so a slow
+khuxbot request or Reddit call doesn't stall the rest of the comments.
+
+Blocking work (peewee queries, and the HTTP requests if aiohttp isn't installed)
+is sent to an executor, so it doesn't block the event loop either"""
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from khux_medal_finder import helpers
+from khux_medal_finder.api import Search
+from khux_medal_finder.bot import MedalFinderBot
+from khux_medal_finder.metrics import REGISTRY, count
+from khux_medal_finder.models import MedalRecord
+from khux_medal_finder.reddit import RedditService
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def db_executor():
+    """Executor for the DB writes. A single thread is enough, as they're short,
+    and it keeps them in order"""
+    return ThreadPoolExecutor(max_workers=1)
+
+
+class AsyncSearch:
+    """Asyncio version of Search, sharing its endpoints and cache. At most
+    `concurrency` requests are sent to khuxbot at the same time.
+
+    Requests are sent with aiohttp if it's installed. Otherwise the blocking HTTP
+    client of the search is used from `executor`"""
+
+    def __init__(self, search=None, concurrency=4, executor=None, session=None):
+        self.search = search or Search()
+        self.concurrency = concurrency
+        self.executor = executor
+        self.session = session
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created when it's first used, so it belongs to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        return self._semaphore
+
+    async def medals(self, filters):
+        """Given the filters to search, returns a list with a dict representing each medal"""
+        if self.search.cache_check_due():
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self.executor, self.search.validate_cache)
+
+        cache_key = self.search.cache_key(filters)
+        cached_medals = self.search.cache.get(cache_key)
+        if cached_medals is not None:
+            return list(cached_medals)
+
+        async with self.semaphore:
+            with REGISTRY.time('search_medals'):
+                response_json = await self.get_json(self.search.endpoint(filters))
+
+        medals = self.search.medals_from_json(response_json)
+        self.search.cache.set(cache_key, medals)
+
+        return list(medals)
+
+    async def get_json(self, url):
+        if self.session is None and aiohttp is not None:
+            self.session = aiohttp.ClientSession()
+
+        if self.session is not None:
+            async with self.session.get(url) as response:
+                return await response.json(content_type=None)
+
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(self.executor, self.search.http_client.get, url)
+        return response.json()
+
+    async def combine_searches(self, filters_list, limit=None, records=False):
+        """Same as Search.combine_searches: every search is sent at once, and their
+        results are combined in the same order as the filters"""
+        medals = []
+        medal_ids = set()
+        searches = [asyncio.ensure_future(self.medals(filters)) for filters in filters_list]
+
+        try:
+            for search in searches:
+                for medal in await search:
+                    if medal['id'] not in medal_ids:
+                        medal_ids.add(medal['id'])
+                        medals.append(medal)
+
+                if limit is not None and len(medals) >= limit:
+                    break
+
+        finally:
+            for search in searches:
+                search.cancel()
+
+        if records:
+            return MedalRecord.from_json_list(medals[:limit])
+
+        return medals[:limit]
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncRedditService(RedditService):
+    """Asyncio version of RedditService, based on asyncpraw. The replies are the
+    same ones, but they're saved in the DB from `executor`"""
+
+    def __init__(self, executor=None):
+        # asyncpraw is only needed by the async bot, so it isn't a dependency of the rest
+        import asyncpraw
+
+        self.reddit = asyncpraw.Reddit(user_agent='Medal finder bot by /u/Pawah/',
+                                       client_id=os.environ.get('REDDIT_BOT_TOKEN'),
+                                       client_secret=os.environ.get('REDDIT_BOT_SECRET'),
+                                       username=os.environ.get('REDDIT_BOT_USERNAME'),
+                                       password=os.environ.get('REDDIT_BOT_PASSWORD'))
+        self.executor = executor or db_executor()
+
+        # Authentication can only be validated from the loop, see validate_authentication
+        self.valid = False
+
+    async def validate_authentication(self):
+        try:
+            await self.reddit.user.me()
+            self.valid = True
+
+        except BaseException:
+            self.valid = False
+            raise
+
+    async def subreddit(self, subreddit_name):
+        return await self.reddit.subreddit(subreddit_name)
+
+    async def subreddit_comments_stream(self, subreddit_name, pause_after=None):
+        subreddit = await self.subreddit(subreddit_name)
+
+        async for comment in subreddit.stream.comments(pause_after=pause_after):
+            yield comment
+
+    async def reply(self, comment, medals):
+        reply_body, success = self.reply_body(medals)
+        with REGISTRY.time('reddit_reply'):
+            reply = await comment.reply(reply_body)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.save_reply, self.comment_fields(comment), reply,
+                                          reply_body, success)
+
+    async def close(self):
+        await self.reddit.close()
+
+
+class AsyncMedalFinderBot(MedalFinderBot):
+    """Asyncio version of MedalFinderBot. Every comment asking for medals is
+    answered on its own task, with at most `concurrency` of them at the same time.
+
+    `search` can be an AsyncSearch or any of the objects accepted by MedalFinderBot.
+    As in MedalFinderBot, a comment that can't be answered is logged and skipped"""
+
+    def __init__(self, reddit_service, search, subreddit_name, bot_name, checkpoint_path, seen_size=10000,
+                 concurrency=8, executor=None):
+        super(AsyncMedalFinderBot, self).__init__(reddit_service, search, subreddit_name, bot_name, checkpoint_path,
+                                                  seen_size=seen_size)
+        self.concurrency = concurrency
+        self.executor = executor or db_executor()
+
+        # Comments being answered, in the order they were posted, and whether they're done
+        self.answering = OrderedDict()
+
+    async def run(self):
+        """Processes comments forever. If Reddit fails the stream is opened again"""
+        import asyncprawcore
+
+        while True:
+            try:
+                await self.process(self.reddit_service.subreddit_comments_stream(self.subreddit_name, pause_after=0))
+
+            except asyncprawcore.AsyncPrawcoreException as exception:
+                print(f"Error while reading the comments: {repr(exception)}")
+                await asyncio.sleep(self.RETRY_DELAY)
+
+    async def process(self, comments):
+        """Answers the comments of an async iterable, without waiting for each
+        answer to be sent before reading the next comment"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_event_loop()
+        tasks = set()
+        self.answering.clear()
+
+        async def answer_page(page):
+            # Looking for the comments on the DB is the only blocking part of the filters
+            new_comments = await loop.run_in_executor(self.executor, list, self.new_comments(page))
+            for comment in new_comments:
+                self.answering[comment.id] = False
+
+            for comment, filters in self.requests(new_comments):
+                await semaphore.acquire()
+
+                task = asyncio.ensure_future(self.answer(comment, filters))
+                task.add_done_callback(lambda _: semaphore.release())
+                task.add_done_callback(tasks.discard)
+                tasks.add(task)
+
+        # Comments are looked up on the DB a page at a time: until the stream
+        # pauses (yielding None) or there are LOOKUP_SIZE of them
+        page = []
+        async for comment in comments:
+            page.append(comment)
+
+            if comment is None or len(page) >= self.LOOKUP_SIZE:
+                await answer_page(page)
+                page = []
+
+        await answer_page(page)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def answer(self, comment, filters):
+        try:
+            medals = await self.search_medals(filters) if filters else []
+            await self.reddit_service.reply(comment, medals)
+
+        except Exception as exception:
+            print(f"Error while answering comment {comment.id}: {repr(exception)}")
+            count('answer_errors')
+
+        finally:
+            self.save_checkpoint(comment.id)
+
+    async def search_medals(self, filters):
+        # AsyncSearch returns dicts unless it's asked for records, like api.Search
+        if isinstance(self.search, AsyncSearch):
+            return await self.search.combine_searches(filters, limit=helpers.REPLY_MAX_MEDALS, records=True)
+
+        # Other searches may query the DB, e.g. PrecomputedSearch
+        loop = asyncio.get_event_loop()
+        medals = await loop.run_in_executor(self.executor, super(AsyncMedalFinderBot, self).search_medals, filters)
+        if asyncio.iscoroutine(medals):
+            medals = await medals
+
+        return medals
+
+    def save_checkpoint(self, comment_id):
+        """Moves the checkpoint up to the newest comment we're done with, as long
+        as we're done with all the previous ones too. Otherwise a restart could
+        skip the comments that are still being answered"""
+        self.answering[comment_id] = True
+
+        done_id = None
+        while self.answering and next(iter(self.answering.values())):
+            done_id, _ = self.answering.popitem(last=False)
+
+        if done_id is not None:
+            self.checkpoint.save(done_id)
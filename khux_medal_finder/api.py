@@ -1,14 +1,120 @@
+import hashlib
+import json
 import requests
-from urllib.parse import urlencode
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlparse
 
-from khux_medal_finder.models import Medal
-from khux_medal_finder.factories import MedalFactory
+from peewee import DatabaseError, fn
+
+from khux_medal_finder.cache import ResponseCache
+from khux_medal_finder.models import Medal, MedalRecord, SyncState, is_initialized
+from khux_medal_finder.factories import BulkInsertResult, MedalFactory, UpsertResult
+from khux_medal_finder.metrics import timed
+
+
+class HttpClient:
+    """HTTP layer used for every request sent to khuxbot. It keeps a pool of
+    keep-alive connections, so consecutive requests don't need to go through
+    the TCP and TLS handshakes again"""
+
+    def __init__(self, pool_size=10, timeout=(3.05, 30)):
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, encoded_query=None, headers=None):
+        """Sends a GET request to the URL. If `encoded_query` is specified, it's
+        appended to the URL without being encoded again"""
+        prepared = self.session.prepare_request(requests.Request(method='GET', url=url, params=params, headers=headers))
+        if encoded_query:
+            prepared.url += '?' + encoded_query
+
+        settings = self.session.merge_environment_settings(prepared.url, {}, None, None, None)
+
+        with self.lock:
+            self.requests += 1
+
+        return self.session.send(prepared, timeout=self.timeout, **settings)
+
+    def stats(self):
+        """Returns how many requests have been sent and how many of them could
+        reuse an already open connection"""
+        pools = self.adapter.poolmanager.pools
+        new_connections = sum(pools[key].num_connections for key in pools.keys())
+
+        return {'requests': self.requests,
+                'new_connections': new_connections,
+                'reused_connections': max(self.requests - new_connections, 0)}
+
+
+_default_http_client = None
+
+
+def default_http_client():
+    """Returns the HttpClient shared by every Search and Scrapper that isn't
+    given its own one"""
+    global _default_http_client
+
+    if _default_http_client is None:
+        _default_http_client = HttpClient()
+
+    return _default_http_client
 
 
 class Search:
+    """Searches the medals on khuxbot, caching the responses.
+
+    Once the DB is initialized, the catalogue version on it is checked at most
+    every `check_interval` seconds, and the cache is cleared when it changes, so
+    medals saved by a scrape (even from another process) aren't missing from the
+    cached searches. A `check_interval` of None disables the check"""
+    CHECK_INTERVAL = 60
 
-    def __init__(self):
+    def __init__(self, http_client=None, cache=None, check_interval=CHECK_INTERVAL):
         self.BASE_ENDPOINT = "http://www.khuxbot.com/api/v1/medal?q=data&"
+        self.http_client = http_client or default_http_client()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.check_interval = check_interval
+        self.checked_at = None
+
+    def cache_check_due(self):
+        """Returns whether the catalogue version has to be checked again"""
+        if self.check_interval is None or not is_initialized(SyncState._meta.database):
+            return False
+
+        return self.checked_at is None or time.monotonic() - self.checked_at >= self.check_interval
+
+    def validate_cache(self):
+        """Clears the cache if the catalogue version has changed. Returns whether
+        it has been cleared"""
+        if not self.cache_check_due():
+            return False
+
+        self.checked_at = time.monotonic()
+
+        try:
+            return self.cache.validate(SyncState.catalogue_version())
+
+        # The search still works without the DB, only the cache may be outdated
+        except DatabaseError as e:
+            print(f"Couldn't check the catalogue version: {repr(e)}")
+            return False
+
+    def cache_key(self, filters):
+        """Returns the same key for every set of filters generating the same endpoint,
+        no matter their order or if their values are numbers or strings"""
+        return json.dumps({filter_name: str(filters[filter_name]) for filter_name in filters}, sort_keys=True)
 
     def endpoint(self, filters):
         """Given a dictionary with the filters to use in the search, composes the endpoint URL"""
@@ -23,53 +129,138 @@ class Search:
 
         return self.BASE_ENDPOINT + base_filter
 
+    @timed('search_medals')
     def medals(self, filters):
         """Given the filters to search, returns a list with a dict representing each medal"""
+        self.validate_cache()
+
+        cache_key = self.cache_key(filters)
+        cached_medals = self.cache.get(cache_key)
+        if cached_medals is not None:
+            return list(cached_medals)
+
         endpoint = self.endpoint(filters)
-        server_response = requests.get(endpoint)
+        server_response = self.http_client.get(endpoint)
+
+        medals = self.medals_from_json(server_response.json())
+        self.cache.set(cache_key, medals)
 
-        medals = server_response.json()['medal']
+        return list(medals)
+
+    def medals_from_json(self, response_json):
+        medals = response_json['medal']
 
         # Returning the medals as a list instead of a dict, as it's easier to work with it
         return [medals[key_id] for key_id in medals]
 
-    def combine_searches(self, filters_list):
+    def medal_records(self, filters):
+        """Same as medals, but returning a MedalRecord for each medal"""
+        return MedalRecord.from_json_list(self.medals(filters))
+
+    def combine_searches(self, filters_list, workers=4, limit=None, records=False):
         """Given a list containing sets of filters, executes the necessary searches
-        and combines the results"""
+        concurrently and combines the results, without repeating medals.
+
+        If there is a limit, we stop as soon as the first searches return enough
+        medals, without waiting for the rest of them. With `records` the medals
+        are returned as MedalRecords instead of dicts"""
+        if not filters_list:
+            return []
+
         medals = []
+        medal_ids = set()
 
-        for filters in filters_list:
-            medals += self.medals(filters)
+        executor = ThreadPoolExecutor(max_workers=min(workers, len(filters_list)))
+        searches = [executor.submit(self.medals, filters) for filters in filters_list]
 
-        return medals
+        try:
+            # Results are combined in the same order as the filters, so the
+            # reply doesn't depend on which search finishes first
+            for search in searches:
+                for medal in search.result():
+                    if medal['id'] not in medal_ids:
+                        medal_ids.add(medal['id'])
+                        medals.append(medal)
+
+                if limit is not None and len(medals) >= limit:
+                    break
+
+        finally:
+            for search in searches:
+                search.cancel()
+            executor.shutdown(wait=False)
+
+        if records:
+            return MedalRecord.from_json_list(medals[:limit])
+
+        return medals[:limit]
+
+
+class RateLimiter:
+    """Spaces out the requests sent to each host, so several workers scraping
+    at the same time don't flood khuxbot"""
+
+    def __init__(self, requests_per_second=None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """Blocks until a new request can be sent to the host of the URL"""
+        if not self.interval:
+            return
+
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
 
 
 class Scrapper:
 
-    def __init__(self):
+    def __init__(self, requests_per_second=None, retries=3, backoff=0.5, http_client=None, archive=None):
         self.medal_base_endpoint = 'https://www.khuxbot.com/api/v1/medal'
+        self.http_client = http_client or default_http_client()
+        self.archive = archive
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.retries = retries
+        self.backoff = backoff
+
+        # Functions to call after a scrape creates new medals
+        self.post_scrape_hooks = []
 
     def get_medal_names(self):
-        response = requests.get(self.medal_base_endpoint, params={"q": "names"})
+        response = self.http_client.get(self.medal_base_endpoint, params={"q": "names"})
         return (response.json())['names']
 
     def get_medals(self, medal_name):
         """Returns a list of medals matching the specified search"""
+        response = self.http_client.get(self.medal_base_endpoint, encoded_query=self.medal_query(medal_name))
+        response_json = response.json()
+        self.archive_response(medal_name, response)
+
+        return self.medals_from_json(response_json)
 
-        # We need to prepare the request manually, as we need to encode spaces
+    def archive_response(self, medal_name, response):
+        """Saves the raw response in the archive, if there's one"""
+        if self.archive is not None:
+            self.archive.add(medal_name, response.content)
+
+    def medal_query(self, medal_name):
+        # We need to encode the query manually, as we need to encode spaces
         # as '%20' instead of as the by-default '+'
         params = {"q": "data", "medal": medal_name}
-        encoded_params = urlencode(params).replace('+', '%20')
-        session = requests.Session()
-        request = requests.Request(method='GET', url=self.medal_base_endpoint)
-        prepared = request.prepare()
-        prepared.url += '?' + encoded_params
-        response = session.send(prepared)
-
-        if 'error' in response.json():
+        return urlencode(params).replace('+', '%20')
+
+    def medals_from_json(self, response_json):
+        if 'error' in response_json:
             return []
 
-        medals_dict = response.json()['medal']
+        medals_dict = response_json['medal']
         medals = []
         for _, medal in medals_dict.items():
             medals.append(medal)
@@ -78,25 +269,231 @@ class Scrapper:
 
     def missing_medals(self):
         """Gets the names of all the medals that aren't yet on the DB"""
-        current_medals = set(medal.name.lower() for medal in Medal.select())
-        total_medals = set(self.get_medal_names())
+        missing_medals = set(self.get_medal_names())
+
+        # Only the names are selected, and the rows are iterated without caching
+        # them, so memory doesn't grow with the size of the table
+        current_medals = Medal.select(fn.LOWER(Medal.name)).distinct().tuples()
+        for medal_name, in current_medals.iterator():
+            missing_medals.discard(medal_name)
 
-        return list(total_medals - current_medals)
+        return list(missing_medals)
 
-    def scrape_missing_medals(self):
+    def fetch_medals(self, medal_name):
+        """Same as get_medals, but respecting the rate limit and retrying with an
+        exponential backoff if khuxbot can't be reached or returns garbage"""
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(self.medal_base_endpoint)
+
+            try:
+                return self.get_medals(medal_name)
+
+            # Invalid JSON (e.g. an HTML error page) is raised as a ValueError
+            except (requests.RequestException, ValueError):
+                if attempt == self.retries:
+                    raise
+
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def download_medals(self, medal_names, workers=1):
+        """Yields a (name, medals) tuple for each one of the names, as soon as its
+        medals are downloaded"""
+        return self.run_concurrently(self._download_medal, medal_names, workers)
+
+    def run_concurrently(self, function, items, workers=1):
+        """Yields an (item, result) tuple for each one of the items, as soon as the
+        function returns. If there's more than one worker the calls are made
+        concurrently, keeping at most two calls queued per worker"""
+        if workers <= 1:
+            for item in items:
+                yield item, function(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            items = iter(items)
+            pending = {}
+
+            while True:
+                for item in islice(items, workers * 2 - len(pending)):
+                    pending[executor.submit(function, item)] = item
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+    def _download_medal(self, medal_name):
+        try:
+            return self.fetch_medals(medal_name)
+
+        except (requests.RequestException, ValueError) as e:
+            print(f"Couldn't download medal {medal_name}: {repr(e)}")
+            return []
+
+    def scrape_missing_medals(self, workers=1, batch_size=50):
         """Saves in the DB the medals that aren't there yet"""
         missing_medals_names = self.missing_medals()
         print(f'Missing medals:\n {missing_medals_names}')
 
-        for medal_name in missing_medals_names:
-            matching_medals = self.get_medals(medal_name)
+        return self.scrape_medals(missing_medals_names, workers=workers, batch_size=batch_size)
+
+    def scrape_medals(self, medal_names, workers=1, batch_size=50):
+        """Downloads the medals with the specified names and saves in the DB the
+        ones that aren't there yet.
+
+        Downloads are spread among the workers, but all the DB writes are done from
+        this thread, saving the medals in batches of `batch_size`"""
+        batch = []
+        results = []
+
+        for medal_name, matching_medals in self.download_medals(medal_names, workers=workers):
             print(f"Current medal: {medal_name}")
+            batch += matching_medals
+
+            if len(batch) >= batch_size:
+                results.append(self.save_medals(batch))
+                batch = []
+
+        if batch:
+            results.append(self.save_medals(batch))
+
+        result = BulkInsertResult(created=sum(result.created for result in results),
+                                  skipped=sum(result.skipped for result in results),
+                                  invalid=sum(result.invalid for result in results))
+
+        if result.created:
+            for hook in self.post_scrape_hooks:
+                hook()
+
+        return result
+
+    def save_medals(self, medals):
+        """Saves the medals that aren't yet on the DB, using a single transaction"""
+        result = MedalFactory.medals(medals)
+        print(f"{result.created} medals created, {result.skipped} skipped and {result.invalid} invalid")
+
+        return result
+
+    def replay_archive(self, batch_size=50):
+        """Rebuilds the medals from the newest archived response of each name,
+        without any request to khuxbot. Medals already in the DB are updated, so
+        it can be used to parse them again after fixing the parser"""
+        if self.archive is None:
+            raise ValueError('The scrapper has no archive to replay')
+
+        batch = []
+        results = []
+
+        for medal_name, response_json in self.archive.latest():
+            batch += self.medals_from_json(response_json)
+
+            if len(batch) >= batch_size:
+                results.append(MedalFactory.upsert_medals(batch))
+                batch = []
+
+        if batch:
+            results.append(MedalFactory.upsert_medals(batch))
+
+        result = UpsertResult(created=sum(result.created for result in results),
+                              updated=sum(result.updated for result in results),
+                              invalid=sum(result.invalid for result in results))
+        print(f"{result.created} medals created, {result.updated} updated and {result.invalid} invalid")
+
+        if result.created or result.updated:
+            for hook in self.post_scrape_hooks:
+                hook()
+
+        return result
+
+    def fetch_if_changed(self, state, params=None, encoded_query=None):
+        """Requests a resource sending the validators saved in its SyncState, so
+        khuxbot can answer '304 Not Modified'. If the server ignores them, the hash
+        of the content is compared instead.
+
+        Returns its JSON, or None if it hasn't changed. The state is updated with
+        the new validators, but it isn't saved"""
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+
+        self.rate_limiter.wait(self.medal_base_endpoint)
+        response = self.http_client.get(self.medal_base_endpoint, params=params, encoded_query=encoded_query,
+                                        headers=headers)
+        if response.status_code == 304:
+            return None
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if content_hash == state.content_hash:
+            return None
+
+        state.content_hash = content_hash
+        state.etag = response.headers.get('ETag')
+        state.last_modified = response.headers.get('Last-Modified')
+
+        response_json = response.json()
+        if state.resource.startswith('medal:'):
+            self.archive_response(state.resource[len('medal:'):], response)
+
+        return response_json
+
+    def sync_medals(self, recheck_limit=50, workers=1):
+        """Incremental alternative to scrape_missing_medals that also detects changes
+        on the medals we already have.
+
+        It only downloads the data of the names that have never been synced and of
+        the `recheck_limit` names synced longest ago, and the list of names is only
+        processed if it has changed. The first sync downloads every name, to
+        obtain their initial state"""
+        names_state = SyncState.get_or_none(SyncState.resource == 'names') or SyncState(resource='names')
+        names_json = self.fetch_if_changed(names_state, params={"q": "names"})
+
+        states = {state.resource: state for state in SyncState.select().where(SyncState.resource.startswith('medal:'))}
+
+        new_names = []
+        if names_json is not None:
+            new_names = [name for name in names_json['names'] if f'medal:{name}' not in states]
+
+        recheck_states = sorted(states.values(), key=lambda state: state.synced_at)[:recheck_limit]
+        recheck_names = [state.resource[len('medal:'):] for state in recheck_states]
+        print(f'{len(new_names)} new medal names, rechecking {len(recheck_names)}')
+
+        changed_medals = []
+        synced_states = []
+        for medal_name, (medals, state) in self.run_concurrently(
+                lambda name: self._fetch_medal_if_changed(name, states), new_names + recheck_names, workers):
+            if state is not None:
+                synced_states.append(state)
+            changed_medals += medals
+
+        result = MedalFactory.upsert_medals(changed_medals) if changed_medals else UpsertResult(0, 0, 0)
+        print(f"{result.created} medals created, {result.updated} updated and {result.invalid} invalid")
+
+        # If any name couldn't be downloaded, the list of names has to be processed again next time
+        if len(synced_states) == len(new_names) + len(recheck_names):
+            synced_states.append(names_state)
+        SyncState.save_states(synced_states)
+
+        if result.created or result.updated:
+            for hook in self.post_scrape_hooks:
+                hook()
+
+        return result
+
+    def _fetch_medal_if_changed(self, medal_name, states):
+        """Returns the medals of the name if they have changed, together with the
+        updated state, or None instead of the state if they couldn't be downloaded"""
+        resource = f'medal:{medal_name}'
+        state = SyncState(**states[resource].__data__) if resource in states else SyncState(resource=resource)
+
+        try:
+            medals_json = self.fetch_if_changed(state, encoded_query=self.medal_query(medal_name))
 
-            for medal in matching_medals:
-                if not Medal.get_or_none(Medal.medal_id == medal['id']):
-                    created_medal = MedalFactory.medal(medal)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Couldn't download medal {medal_name}: {repr(e)}")
+            return [], None
 
-                    if created_medal:
-                        print(f"{created_medal.name} - {created_medal.rarity}* was correctly created")
-                    else:
-                        print(f"Couldn't create medal {medal['name']} - {medal['rarity']}*")
+        return self.medals_from_json(medals_json) if medals_json is not None else [], state
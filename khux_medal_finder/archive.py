@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class MedalArchive:
+    """Local archive with the raw responses returned by khuxbot for each medal
+    name, compressed and stored in a SQLite file.
+
+    Every response is kept together with the time it was fetched, so the medals
+    can be rebuilt from the archive (e.g. after fixing the parser) without
+    downloading them again"""
+
+    def __init__(self, path):
+        # Responses are added from the scrapper workers, so the connection is
+        # shared between threads and its use is serialized with the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        with self.lock, self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS response ('
+                                    'id INTEGER PRIMARY KEY, medal_name TEXT NOT NULL, '
+                                    'fetched_at REAL NOT NULL, content BLOB NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS response_medal_name '
+                                    'ON response (medal_name, fetched_at)')
+
+    def add(self, medal_name, content, fetched_at=None):
+        """Saves the raw content (bytes) of a response for the medal name"""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO response (medal_name, fetched_at, content) VALUES (?, ?, ?)',
+                                    (medal_name, fetched_at, zlib.compress(content)))
+
+    def responses(self, medal_name):
+        """Returns a list with the (fetched_at, JSON) tuples of the responses of
+        the medal name, from oldest to newest"""
+        with self.lock:
+            rows = self.connection.execute('SELECT fetched_at, content FROM response WHERE medal_name = ? '
+                                           'ORDER BY fetched_at, id', (medal_name,)).fetchall()
+
+        return [(fetched_at, self.decode(content)) for fetched_at, content in rows]
+
+    def latest(self):
+        """Yields a (medal_name, JSON) tuple with the newest response of each name"""
+        with self.lock:
+            rows = self.connection.execute('SELECT medal_name, content FROM response WHERE id IN '
+                                           '(SELECT MAX(id) FROM response GROUP BY medal_name) '
+                                           'ORDER BY medal_name').fetchall()
+
+        for medal_name, content in rows:
+            yield medal_name, self.decode(content)
+
+    def decode(self, content):
+        return json.loads(zlib.decompress(content).decode('utf-8'))
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM response').fetchone()[0]
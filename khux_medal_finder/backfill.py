@@ -0,0 +1,202 @@
+"""Backfill of the medals using several processes, for scrapes too big for a
+single one: parsing the responses and the medals is CPU-bound, so the threads
+of the Scrapper can't use more than one core.
+
+The names are split in shards, and each shard is scraped by its own process,
+with its own HTTP client and DB connection, upserting the medals in batches.
+The names of each shard already saved are written to its progress file, so an
+interrupted backfill resumes where every shard stopped"""
+import os
+import zlib
+from multiprocessing import Pool
+
+import requests
+
+from khux_medal_finder.api import HttpClient, Scrapper
+from khux_medal_finder.factories import MedalFactory, UpsertResult
+from khux_medal_finder.models import close_connections, init_db
+
+
+def shard_of(medal_name, shards):
+    """Returns the shard of a name. It only depends on the name, so a name stays
+    in the same shard even if the list of names changes between runs"""
+    return zlib.crc32(medal_name.encode('utf-8')) % shards
+
+
+def shard_names(medal_names, shards):
+    """Splits the names in `shards` lists"""
+    sharded_names = [[] for _ in range(shards)]
+    for medal_name in medal_names:
+        sharded_names[shard_of(medal_name, shards)].append(medal_name)
+
+    return sharded_names
+
+
+def sum_results(results):
+    return UpsertResult(created=sum(result.created for result in results),
+                        updated=sum(result.updated for result in results),
+                        invalid=sum(result.invalid for result in results))
+
+
+class ShardProgress:
+    """Names of a shard whose medals are already saved, one per line. Lines are
+    only appended, so a crash can at most lose the last batch"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+
+        if os.path.exists(path):
+            with open(path) as progress_file:
+                self.done = set(line.rstrip('\n') for line in progress_file if line.strip())
+
+    def save(self, medal_names):
+        with open(self.path, 'a') as progress_file:
+            progress_file.writelines(f'{medal_name}\n' for medal_name in medal_names)
+            progress_file.flush()
+            os.fsync(progress_file.fileno())
+
+        self.done.update(medal_names)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        self.done = set()
+
+
+def progress_path(progress_dir, shard):
+    return os.path.join(progress_dir, f'shard_{shard}.txt')
+
+
+def backfill_shard(shard, medal_names, progress_dir, requests_per_second=None, batch_size=50, workers=1):
+    """Downloads and upserts the medals of the names of a shard that aren't in
+    its progress file yet. Returns an UpsertResult and the names that couldn't
+    be downloaded, which aren't marked as done so the next run tries them again"""
+    progress = ShardProgress(progress_path(progress_dir, shard))
+    pending_names = [medal_name for medal_name in medal_names if medal_name not in progress.done]
+    scrapper = Scrapper(requests_per_second=requests_per_second, http_client=HttpClient(pool_size=max(workers, 1)))
+
+    def download(medal_name):
+        try:
+            return scrapper.fetch_medals(medal_name)
+
+        except (requests.RequestException, ValueError) as e:
+            print(f"Shard {shard}: couldn't download medal {medal_name}: {repr(e)}")
+            return None
+
+    batch = []
+    batch_names = []
+    failed_names = []
+    results = []
+
+    for medal_name, medals in scrapper.run_concurrently(download, pending_names, workers=workers):
+        if medals is None:
+            failed_names.append(medal_name)
+            continue
+
+        batch += medals
+        batch_names.append(medal_name)
+
+        if len(batch) >= batch_size:
+            results.append(MedalFactory.upsert_medals(batch))
+            progress.save(batch_names)
+            batch, batch_names = [], []
+
+    if batch:
+        results.append(MedalFactory.upsert_medals(batch))
+    if batch_names:
+        progress.save(batch_names)
+
+    return sum_results(results), failed_names
+
+
+class Backfill:
+    """Scrapes the medals of a list of names with `processes` processes, each one
+    of them downloading with `workers` threads. The rate limit is shared among
+    the processes.
+
+    Every process connects to the DB calling `initializer(*initargs)`, by default
+    init_db with the environment variables. With a single process the backfill
+    runs in this one, using its DB. Names are sharded by the amount of processes,
+    so resuming a backfill needs the same amount of them"""
+
+    def __init__(self, progress_dir, processes=None, requests_per_second=None, batch_size=50, workers=1,
+                 report_interval=10, initializer=init_db, initargs=()):
+        self.progress_dir = progress_dir
+        self.processes = processes or os.cpu_count() or 1
+        self.requests_per_second = requests_per_second
+        self.batch_size = batch_size
+        self.workers = workers
+        self.report_interval = report_interval
+        self.initializer = initializer
+        self.initargs = initargs
+
+        # Functions to call after a backfill creates or updates medals
+        self.post_scrape_hooks = []
+
+        os.makedirs(progress_dir, exist_ok=True)
+
+    def shard_arguments(self, sharded_names):
+        requests_per_second = self.requests_per_second and self.requests_per_second / self.processes
+
+        return [(shard, medal_names, self.progress_dir, requests_per_second, self.batch_size, self.workers)
+                for shard, medal_names in enumerate(sharded_names)]
+
+    def run(self, medal_names):
+        """Saves the medals of the names. Returns an UpsertResult and the names
+        that couldn't be downloaded"""
+        sharded_names = shard_names(medal_names, self.processes)
+        print(f'Backfilling {len(medal_names)} medal names in {self.processes} shards')
+
+        if self.processes <= 1:
+            shard_results = [backfill_shard(*arguments) for arguments in self.shard_arguments(sharded_names)]
+        else:
+            # Each process creates its own DB instead of using the connections inherited
+            # from this one. They are closed first, as a process closing its copy would break them
+            close_connections()
+
+            with Pool(self.processes, initializer=self.initializer, initargs=self.initargs) as pool:
+                pending = [pool.apply_async(backfill_shard, arguments)
+                           for arguments in self.shard_arguments(sharded_names)]
+
+                for shard_result in pending:
+                    shard_result.wait(self.report_interval)
+                    while not shard_result.ready():
+                        self.report(sharded_names)
+                        shard_result.wait(self.report_interval)
+
+                shard_results = [shard_result.get() for shard_result in pending]
+
+        self.report(sharded_names)
+
+        result = sum_results([shard_result for shard_result, _ in shard_results])
+        failed_names = [medal_name for _, shard_failed_names in shard_results for medal_name in shard_failed_names]
+        print(f"{result.created} medals created, {result.updated} updated, {result.invalid} invalid "
+              f"and {len(failed_names)} names failed")
+
+        # Once every name is done the progress isn't needed anymore, and keeping it
+        # would skip the names on the next backfill
+        if not failed_names:
+            for shard in range(len(sharded_names)):
+                ShardProgress(progress_path(self.progress_dir, shard)).clear()
+
+        if result.created or result.updated:
+            for hook in self.post_scrape_hooks:
+                hook()
+
+        return result, failed_names
+
+    def progress(self, sharded_names):
+        """Returns a (done, total) tuple with the names of each shard"""
+        return [(len(ShardProgress(progress_path(self.progress_dir, shard)).done), len(medal_names))
+                for shard, medal_names in enumerate(sharded_names)]
+
+    def report(self, sharded_names):
+        progress = self.progress(sharded_names)
+        done = sum(shard_done for shard_done, _ in progress)
+        total = sum(shard_total for _, shard_total in progress) or 1
+
+        print(f'Backfill progress: {done / total:.1%} ' +
+              ' '.join(f'[{shard}: {shard_done}/{shard_total}]'
+                       for shard, (shard_done, shard_total) in enumerate(progress)))
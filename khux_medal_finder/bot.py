@@ -0,0 +1,188 @@
+import os
+import time
+from collections import OrderedDict
+
+from khux_medal_finder import helpers
+from khux_medal_finder.api import Search
+from khux_medal_finder.comment import RequirementExtractor
+from khux_medal_finder.metrics import count
+from khux_medal_finder.models import Comment
+
+
+class BoundedSet:
+    """Set that only remembers the last `max_size` items added to it"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def add(self, item):
+        self.items[item] = None
+        self.items.move_to_end(item)
+
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Checkpoint:
+    """Keeps in a file the id of the newest comment processed, so we don't need
+    to process again the old ones when the bot is restarted"""
+
+    def __init__(self, path):
+        self.path = path
+        self.comment_id = None
+
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                self.comment_id = checkpoint_file.read().strip() or None
+
+    def is_newer(self, comment_id):
+        # Reddit ids are base 36 numbers that grow with every new comment
+        return self.comment_id is None or int(comment_id, 36) > int(self.comment_id, 36)
+
+    def save(self, comment_id):
+        if not self.is_newer(comment_id):
+            return
+
+        # Writing to a temporary file first, so a crash can't leave the checkpoint half-written
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            checkpoint_file.write(comment_id)
+        os.replace(temporary_path, self.path)
+
+        self.comment_id = comment_id
+
+
+class MedalFinderBot:
+    """Long-running process that reads the comments of a subreddit as they're posted
+    and replies to the ones that mention the bot with the medals they're asking for.
+
+    `search` can be any object with a `combine_searches(filters_list, limit)` method
+    returning objects with the attributes of a medal, such as a MedalIndex or a
+    PrecomputedSearch. An api.Search can be used too, as it's asked for MedalRecords.
+    If there's a ReplyScheduler, replies are queued and sent by it instead of immediately.
+
+    A comment that can't be answered (e.g. because it has been deleted or Reddit
+    rate limits us) is logged and skipped, so it doesn't stop the bot"""
+    RETRY_DELAY = 30
+    # Most comments read from the stream before looking them up on the DB
+    LOOKUP_SIZE = 100
+
+    def __init__(self, reddit_service, search, subreddit_name, bot_name, checkpoint_path, seen_size=10000,
+                 scheduler=None):
+        self.reddit_service = reddit_service
+        self.scheduler = scheduler
+        self.search = search
+        self.subreddit_name = subreddit_name
+        self.bot_name = bot_name.lower()
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.seen = BoundedSet(seen_size)
+
+    def run(self):
+        """Processes comments forever. If Reddit fails the stream is opened again"""
+        import prawcore
+
+        while True:
+            try:
+                # The stream pauses when there aren't new comments, so the ones read can
+                # be looked up on the DB and the queued replies can be sent
+                self.process(self.reddit_service.subreddit_comments_stream(self.subreddit_name, pause_after=0))
+
+            except prawcore.PrawcoreException as exception:
+                print(f"Error while reading the comments: {repr(exception)}")
+                time.sleep(self.RETRY_DELAY)
+
+    def process(self, comments):
+        for comment, filters in self.requests(self.new_comments(comments)):
+            self.answer(comment, filters)
+
+    def new_comments(self, comments):
+        """Filters out the comments that have already been processed, as well as
+        the ones written by the bot itself.
+
+        Comments are looked up on the DB with a single query for each page read
+        from the stream (up to LOOKUP_SIZE comments), instead of one per comment"""
+        page = []
+
+        for comment in comments:
+            # The stream yields None when it's paused, after reading a page
+            if comment is None:
+                yield from self.unprocessed(page)
+                page = []
+
+                self.send_replies()
+                continue
+
+            if comment.id in self.seen:
+                continue
+
+            self.seen.add(comment.id)
+            count('comments_read')
+
+            if not self.checkpoint.is_newer(comment.id) or str(comment.author).lower() == self.bot_name:
+                continue
+
+            page.append(comment)
+            if len(page) >= self.LOOKUP_SIZE:
+                yield from self.unprocessed(page)
+                page = []
+
+        yield from self.unprocessed(page)
+
+    def unprocessed(self, comments):
+        """Returns the comments that aren't on the DB yet"""
+        if not comments:
+            return []
+
+        processed_ids = Comment.processed_ids([comment.id for comment in comments])
+
+        return [comment for comment in comments if comment.id not in processed_ids]
+
+    def requests(self, comments):
+        """Yields a (comment, filters) tuple for every comment mentioning the bot"""
+        for comment in comments:
+            if f'u/{self.bot_name}' not in comment.body.lower():
+                self.save_checkpoint(comment.id)
+                continue
+
+            extractor = RequirementExtractor(comment.body)
+            extractor.extract_requirements()
+
+            yield comment, extractor.filters()
+
+    def answer(self, comment, filters):
+        try:
+            medals = self.search_medals(filters) if filters else []
+
+            if self.scheduler is not None:
+                self.scheduler.enqueue(comment, medals)
+            else:
+                self.reddit_service.reply(comment, medals)
+
+        except Exception as exception:
+            print(f"Error while answering comment {comment.id}: {repr(exception)}")
+            count('answer_errors')
+
+        self.save_checkpoint(comment.id)
+        self.send_replies()
+
+    def search_medals(self, filters):
+        # api.Search returns dicts unless it's asked for records
+        if isinstance(self.search, Search):
+            return self.search.combine_searches(filters, limit=helpers.REPLY_MAX_MEDALS, records=True)
+
+        return self.search.combine_searches(filters, limit=helpers.REPLY_MAX_MEDALS)
+
+    def save_checkpoint(self, comment_id):
+        """Called once we're done with a comment"""
+        self.checkpoint.save(comment_id)
+
+    def send_replies(self):
+        if self.scheduler is not None:
+            self.scheduler.send_pending()
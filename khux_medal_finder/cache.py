@@ -0,0 +1,118 @@
+import shelve
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """LRU cache holding at most `max_size` entries, each one of them expiring
+    `ttl` seconds after being set.
+
+    If a path is specified the entries are also saved in a shelve file there,
+    so they survive restarts.
+
+    The cache can also have a version of the data its entries were obtained from,
+    see validate"""
+    # Key of the store where the version is saved
+    VERSION_KEY = '__version__'
+
+    def __init__(self, max_size=256, ttl=3600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        self.lock = threading.Lock()
+        self.version = None
+
+        self.store = shelve.open(path) if path else None
+        if self.store is not None:
+            self.load_store()
+
+    def load_store(self):
+        """Loads the version and the entries saved in the store that haven't expired yet"""
+        self.version = self.store.get(self.VERSION_KEY)
+
+        now = time.time()
+        stored_entries = sorted((entry for entry in self.store.items()
+                                 if entry[0] != self.VERSION_KEY and entry[1][0] > now),
+                                key=lambda entry: entry[1][0])
+
+        for key in set(self.store.keys()) - set(key for key, _ in stored_entries) - {self.VERSION_KEY}:
+            del self.store[key]
+
+        for key, entry in stored_entries:
+            self.entries[key] = entry
+
+        self.evict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] <= time.time():
+                self.delete(key)
+                self.stats['expirations'] += 1
+                entry = None
+
+            if entry is None:
+                self.stats['misses'] += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            entry = (time.time() + self.ttl, value)
+
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if self.store is not None:
+                self.store[key] = entry
+
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in its size"""
+        while len(self.entries) > self.max_size:
+            key, _ = self.entries.popitem(last=False)
+            if self.store is not None:
+                del self.store[key]
+            self.stats['evictions'] += 1
+
+    def delete(self, key):
+        del self.entries[key]
+        if self.store is not None:
+            del self.store[key]
+
+    def clear(self):
+        """Removes every entry"""
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.entries.clear()
+        if self.store is not None:
+            self.store.clear()
+            if self.version is not None:
+                self.store[self.VERSION_KEY] = self.version
+
+    def validate(self, version):
+        """Removes every entry if they were obtained from another version of the
+        data than `version`, which becomes the version of the cache. Returns
+        whether the entries have been removed"""
+        with self.lock:
+            if version == self.version:
+                return False
+
+            self.version = version
+            self._clear()
+            return True
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    def __len__(self):
+        return len(self.entries)
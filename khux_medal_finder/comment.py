@@ -1,52 +1,187 @@
-class RequirementExtractor:
+import re
+import string
+from collections import namedtuple
+from itertools import product
+
+from khux_medal_finder.metrics import timed
+
+# Translation replacing by a space every byte that can't be part of a word: the
+# ones that aren't \w on ASCII. Bytes of non-ASCII characters are kept
+WORD_SEPARATORS = bytes(byte if chr(byte) in string.ascii_letters + string.digits + '_' or byte > 127 else ord(' ')
+                        for byte in range(256))
+NO_KEYWORDS = frozenset()
+
+
+class KeywordTokenizer:
+    """Finds all the keywords of a comment that express a requirement. Keywords
+    must be whole words, so 'powerful' doesn't match 'power'.
+
+    The comment is split in words by translating its bytes, which is much faster
+    than scanning it with a regex. Only keywords of several words use one, so
+    unlike a single regex, a keyword that is also a word of a longer one is found
+    as well, e.g. 'single' in 'single target'"""
+
+    # Most combinations of keywords whose requirements are kept, see requirements
+    CACHE_SIZE = 4096
+
+    def __init__(self, keywords):
+        self.keywords = {}
+        self.word_keywords = {}
+        self.words = frozenset()
+        self.phrases_pattern = None
+        self.requirements_cache = {}
+        self.add_keywords(keywords)
+
+    def add_keywords(self, keywords):
+        """Adds new keywords. `keywords` is a dict with the (requirement, value)
+        tuples that each keyword stands for"""
+        self.keywords.update({keyword.lower(): tuple(values) for keyword, values in keywords.items()})
+
+        encoded_keywords = {keyword: keyword.encode() for keyword in self.keywords}
+        self.word_keywords = {encoded: keyword for keyword, encoded in encoded_keywords.items()
+                              if encoded.translate(WORD_SEPARATORS).split() == [encoded]}
+        self.words = frozenset(self.word_keywords)
+
+        # Longer phrases go first, so they take precedence over their prefixes
+        phrases = sorted((keyword for keyword in self.keywords if encoded_keywords[keyword] not in self.word_keywords),
+                         key=len, reverse=True)
+        self.phrases_pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, phrases)) + r')\b') if phrases else None
+        self.requirements_cache.clear()
+
+    def find(self, comment):
+        """Returns a frozenset with the keywords found on an already lowercased comment"""
+        words = self.words.intersection(comment.encode().translate(WORD_SEPARATORS).split())
+        # Most comments don't have any keyword
+        keywords = frozenset(map(self.word_keywords.__getitem__, words)) if words else NO_KEYWORDS
 
-    def __init__(self, comment):
-        self.comment = comment.lower()
-        self.requirements = {}
+        if self.phrases_pattern is not None:
+            keywords |= frozenset(self.phrases_pattern.findall(comment))
 
-    def extract_requirements(self):
-        self.requirements['elements'] = self.parse_element()
-        self.requirements['targets'] = self.parse_targets()
-        self.requirements['direction'] = self.parse_direction()
+        return keywords
 
-    def parse_element(self):
-        elements = []
+    def tokenize(self, comment):
+        """Returns a set with the (requirement, value) tuples found on the comment"""
+        return set(value for keyword in self.find(comment.lower()) for value in self.keywords[keyword])
 
-        if 'power' in self.comment:
-            elements.append('Power')
+    def requirements(self, keywords):
+        """Returns the Requirements expressed by the keywords found on a comment.
+        Comments repeat the same few combinations of keywords, so the results are
+        cached and the same instance is returned for the same keywords"""
+        requirements = self.requirements_cache.get(keywords)
 
-        if 'speed' in self.comment:
-            elements.append('Speed')
+        if requirements is None:
+            values = set(value for keyword in keywords for value in self.keywords[keyword])
+            requirements = Requirements(*(tuple(value for value in REQUIREMENT_VALUES[requirement]
+                                                if (requirement, value) in values)
+                                          for requirement in Requirements._fields))
 
-        if 'magic' in self.comment:
-            elements.append('Magic')
+            if len(self.requirements_cache) >= self.CACHE_SIZE:
+                self.requirements_cache.clear()
+            self.requirements_cache[keywords] = requirements
 
-        if 'psm' in self.comment:
-            elements = ['Power', 'Magic', 'Speed']
+        return requirements
 
-        return elements
 
-    def parse_targets(self):
-        targets = []
+# Possible values of each requirement, in the order they're returned
+REQUIREMENT_VALUES = {
+    'elements': ('Power', 'Speed', 'Magic'),
+    'targets': ('Single', 'Random', 'All'),
+    'direction': ('Upright', 'Reversed'),
+}
 
-        if 'single' in self.comment:
-            targets.append('Single')
+KEYWORDS = {
+    'power': [('elements', 'Power')],
+    'speed': [('elements', 'Speed')],
+    'magic': [('elements', 'Magic')],
+    'psm': [('elements', 'Power'), ('elements', 'Speed'), ('elements', 'Magic')],
+    'single': [('targets', 'Single')],
+    'random': [('targets', 'Random')],
+    'aoe': [('targets', 'All')],
+    'multi': [('targets', 'All')],
+    'upright': [('direction', 'Upright')],
+    'reversed': [('direction', 'Reversed')],
+}
 
-        if 'random' in self.comment:
-            targets.append('Random')
+TOKENIZER = KeywordTokenizer(KEYWORDS)
 
-        if any(word in self.comment for word in ['aoe', 'multi']):
-            targets.append('All')
+# Name of the search filter used for each one of the requirements
+FILTER_NAMES = {'elements': 'element', 'targets': 'targets', 'direction': 'direction'}
 
-        return targets
 
-    def parse_direction(self):
-        direction = []
+def keyword_requirements(keywords, tokenizer=TOKENIZER):
+    """Returns the Requirements expressed by the keywords found by the tokenizer,
+    see KeywordTokenizer.requirements"""
+    return tokenizer.requirements(keywords)
+
+
+def combine_filters(requirements):
+    """Given a dict with the values of each requirement, returns a list with every
+    combination of filters that has to be searched to find the matching medals"""
+    options = [[(FILTER_NAMES[requirement], value) for value in values]
+               for requirement, values in requirements.items() if values]
+
+    if not options:
+        return []
+
+    return [dict(combination) for combination in product(*options)]
+
+
+class Requirements(namedtuple('Requirements', ['elements', 'targets', 'direction'])):
+    """Immutable requirements of a comment. Each field is a tuple with the
+    requested values, sorted as in REQUIREMENT_VALUES"""
+    __slots__ = ()
+
+    def filters(self):
+        return combine_filters(self._asdict())
+
+    def search_filters(self):
+        """Returns a single set of filters matching the same medals as all the
+        combinations returned by `filters`, as used by Medal.search"""
+        return {FILTER_NAMES[requirement]: sorted(getattr(self, requirement))
+                for requirement in self._fields if getattr(self, requirement)}
+
+
+def requirements_batch(comments, key=None, tokenizer=TOKENIZER):
+    """Yields a (comment, Requirements) tuple for each comment mentioning any
+    requirement, skipping the rest. `key` is the function used to obtain the text
+    of each comment, e.g. `lambda comment: comment.body` for praw comments.
+
+    Comments with the same keywords share the same Requirements instance"""
+    for comment in comments:
+        keywords = tokenizer.find((key(comment) if key else comment).lower())
+        if keywords:
+            yield comment, keyword_requirements(keywords, tokenizer)
 
-        if 'upright' in self.comment:
-            direction.append('Upright')
 
-        if 'reversed' in self.comment:
-            direction.append('Reversed')
+class RequirementExtractor:
+
+    def __init__(self, comment, tokenizer=TOKENIZER):
+        self.comment = comment.lower()
+        self.requirements = {}
+        self.tokenizer = tokenizer
+
+    @timed('requirements_extraction')
+    def extract_requirements(self):
+        requirements = self.tokenizer.requirements(self.tokenizer.find(self.comment))
+        for requirement, values in zip(requirements._fields, requirements):
+            self.requirements[requirement] = list(values)
+
+    def filters(self):
+        """Returns a list with every combination of filters that has to be searched
+        to find the medals matching the requirements"""
+        return combine_filters(self.requirements)
 
-        return direction
\ No newline at end of file
+    def parse_requirement(self, requirement):
+        if not self.requirements:
+            self.extract_requirements()
+
+        return list(self.requirements[requirement])
+
+    def parse_element(self):
+        return self.parse_requirement('elements')
+
+    def parse_targets(self):
+        return self.parse_requirement('targets')
+
+    def parse_direction(self):
+        return self.parse_requirement('direction')
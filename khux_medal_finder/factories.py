@@ -1,26 +1,128 @@
+from collections import namedtuple
+
 from khux_medal_finder import helpers
 from khux_medal_finder.exceptions import ParseMultiplierError
-from khux_medal_finder.models import Medal
+from khux_medal_finder.metrics import timed
+from khux_medal_finder.models import Medal, SyncState, unit_of_work
+
+BulkInsertResult = namedtuple('BulkInsertResult', ['created', 'skipped', 'invalid'])
+UpsertResult = namedtuple('UpsertResult', ['created', 'updated', 'invalid'])
 
 
 class MedalFactory:
+    # Small enough to stay under SQLite's limit of 999 variables per query
+    BATCH_SIZE = 50
 
     @classmethod
     def parse_multiplier(cls, multiplier_string):
-        try:
-            processed_multiplier_string = helpers.prepare_multiplier_string(multiplier_string)
-            multipliers = processed_multiplier_string.split('-')
+        return helpers.parse_multiplier(multiplier_string)
+
+    @classmethod
+    def medal(cls, medal_json):
+        created_medal = cls.build(medal_json)
+
+        if created_medal and created_medal.save(force_insert=True):
+            return created_medal
+
+    @classmethod
+    @timed('db_save_medals')
+    def medals(cls, medals_json, batch_size=BATCH_SIZE):
+        """Creates the medals of a list of JSONs using a single transaction, inserting
+        them in batches. Medals that already exist or aren't combat medals are skipped.
+
+        Returns a BulkInsertResult with the amount of created, skipped and invalid medals"""
+        rows, skipped, invalid = cls.rows(medals_json)
+        created = 0
+
+        with unit_of_work(Medal._meta.database):
+            for batch in cls.batches(rows, batch_size):
+                existing_ids = cls.existing_ids(batch)
+
+                new_rows = [row for row in batch if row['medal_id'] not in existing_ids]
+                if new_rows:
+                    Medal.insert_many(new_rows).on_conflict_ignore().execute()
 
-            if len(multipliers) == 1:
-                multipliers = [multipliers[0]] * 2
+                created += len(new_rows)
 
-            return list(map(float, multipliers))
+            if created:
+                SyncState.touch_catalogue()
 
-        except Exception:
-            raise ParseMultiplierError(f"The value {multiplier_string} couldn't be parsed")
+        return BulkInsertResult(created=created, skipped=skipped + len(rows) - created, invalid=invalid)
 
     @classmethod
-    def medal(cls, medal_json):
+    @timed('db_upsert_medals')
+    def upsert_medals(cls, medals_json, batch_size=BATCH_SIZE):
+        """Same as `medals`, but updating the medals that already exist instead of
+        skipping them.
+
+        Returns an UpsertResult with the amount of created, updated and invalid medals"""
+        rows, _, invalid = cls.rows(medals_json)
+        created = updated = 0
+        updated_fields = [field for field in Medal._meta.sorted_fields if field is not Medal.medal_id]
+
+        with unit_of_work(Medal._meta.database):
+            for batch in cls.batches(rows, batch_size):
+                existing_ids = cls.existing_ids(batch)
+
+                (Medal.insert_many(batch)
+                 .on_conflict(conflict_target=[Medal.medal_id], preserve=updated_fields)
+                 .execute())
+
+                updated += len(existing_ids)
+                created += len(batch) - len(existing_ids)
+
+            if created or updated:
+                SyncState.touch_catalogue()
+
+        return UpsertResult(created=created, updated=updated, invalid=invalid)
+
+    @classmethod
+    def rows(cls, medals_json):
+        """Builds the DB rows of the combat medals of a list of JSONs.
+
+        Returns a tuple with the rows, the amount of medals skipped because they
+        aren't combat medals or are repeated, and the amount of invalid medals"""
+        rows = {}
+        combat_medals = [medal_json for medal_json in medals_json if medal_json.get('type', None) == 'Combat']
+        skipped = len(medals_json) - len(combat_medals)
+        invalid = 0
+
+        # The multipliers of all the medals are parsed at once. The ones that
+        # fail are parsed again by build, so it can report the error
+        minimums, maximums, errors = helpers.parse_multipliers([medal_json.get('multiplier', None)
+                                                                for medal_json in combat_medals])
+
+        for position, medal_json in enumerate(combat_medals):
+            multiplier = None if errors[position] else (minimums[position], maximums[position])
+
+            medal = cls.build(medal_json, multiplier)
+            if medal is None:
+                invalid += 1
+            elif medal.medal_id in rows:
+                skipped += 1
+            else:
+                rows[medal.medal_id] = medal.__data__
+
+        return list(rows.values()), skipped, invalid
+
+    @staticmethod
+    def batches(rows, batch_size):
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+    @staticmethod
+    def existing_ids(rows):
+        """Returns which ones of the rows already exist on the DB"""
+        query = Medal.select(Medal.medal_id).where(Medal.medal_id.in_([row['medal_id'] for row in rows]))
+        return set(medal_id for medal_id, in query.tuples())
+
+    @classmethod
+    def build(cls, medal_json, multiplier=None):
+        """Returns the (unsaved) Medal represented by the JSON, or None if it isn't
+        a combat medal or any of its required attributes is missing.
+
+        `multiplier` is the (min, max) tuple of multipliers, if they've already
+        been parsed"""
         created_medal = Medal()
 
         # We only care about combat medals
@@ -34,7 +136,8 @@ class MedalFactory:
             created_medal.element = medal_json['element']
             created_medal.hits = medal_json['hits']
             created_medal.medal_id = medal_json['id']
-            created_medal.multiplier_min, created_medal.multiplier_max = cls.parse_multiplier(medal_json['multiplier'])
+            created_medal.multiplier_min, created_medal.multiplier_max = (multiplier or
+                                                                          cls.parse_multiplier(medal_json['multiplier']))
             created_medal.name = medal_json['name']
             created_medal.rarity = medal_json['rarity']
             created_medal.targets = medal_json['targets']
@@ -55,5 +158,4 @@ class MedalFactory:
         created_medal.strength = medal_json.get('strength', None)
         created_medal.voice_link = medal_json.get('voice_link', None)
 
-        if created_medal.save(force_insert=True):
-            return created_medal
\ No newline at end of file
+        return created_medal
@@ -1,24 +1,78 @@
-def prepare_reply_body(medals):
+import json
+import re
+from array import array
+
+from khux_medal_finder.exceptions import ParseMultiplierError
+from khux_medal_finder.metrics import timed
+
+# Maximum amount of medals shown on a reply, to avoid generating a huge
+# comment if the requirements are generic
+REPLY_MAX_MEDALS = 10
+
+REPLY_FIELDS = ('Medal', 'Direction', 'Element', 'Targets', 'Multiplier', 'Tier', 'Hits', 'Notes')
+
+
+class ReplyFormat:
+    """Way of rendering the medals of a reply: the text placed before and after
+    the rows, the separator between them and the function rendering each row
+    from the cells of a medal"""
+
+    def __init__(self, render_row, header='', separator='\n', footer=''):
+        self.render_row = render_row
+        self.header = header
+        self.separator = separator
+        self.footer = footer
+
+    def body(self, rows):
+        return self.header + self.separator.join(rows) + self.footer
+
+
+REPLY_FORMATS = {
+    'markdown': ReplyFormat(render_row='|'.join,
+                            header='|'.join(REPLY_FIELDS) + '\n' + ':--|' * len(REPLY_FIELDS) + '\n'),
+    'list': ReplyFormat(render_row=lambda cells: '* **{}**: {} {} {}, {}, tier {}, {} hits. {}'.format(*cells)),
+    'json': ReplyFormat(render_row=lambda cells: json.dumps(dict(zip(REPLY_FIELDS, cells))),
+                        header='[', separator=',', footer=']'),
+}
+
+# Rendered medals by medal_id. Each entry keeps the attributes used to render
+# the medal, its cells and its rows in each format already requested
+_rendered_medals = {}
+
+
+@timed('reply_rendering')
+def prepare_reply_body(medals, reply_format='markdown'):
     """Given a list of medals, returns a text string containing a comment
     reply with a table adequately formatted"""
     if not medals:
         raise ValueError("The medal list is empty")
 
-    header_fields = ('Medal', 'Direction', 'Element', 'Targets', 'Multiplier', 'Tier', 'Hits', 'Notes')
-    header = '|'.join(header_fields)
+    rows = [rendered_row(medal, reply_format) for medal in medals[:REPLY_MAX_MEDALS]]
+
+    return REPLY_FORMATS[reply_format].body(rows)
 
-    header_separator = ':--|' * len(header_fields)
+def rendered_row(medal, reply_format):
+    """Returns the row of the medal in the specified format, rendering it only if
+    the medal hasn't been rendered before or it has changed since then"""
+    attributes = (medal.name, medal.direction, medal.element, medal.targets, medal.multiplier_min,
+                  medal.multiplier_max, medal.tier, medal.hits, medal.notes)
 
-    rows = []
-    # Include only 10 medals, to avoid generating a huge comment if the
-    # requirements are generic
-    for medal in medals[:10]:
-        attributes = [medal.name, medal.direction, medal.element, medal.targets,
-                      prepare_multiplier(medal), medal.tier, medal.hits, medal.notes]
-        row = '|'.join(str(attribute) for attribute in attributes)
-        rows.append(row)
+    rendered_medal = _rendered_medals.get(medal.medal_id)
+    if rendered_medal is None or rendered_medal[0] != attributes:
+        cells = [medal.name, medal.direction, medal.element, medal.targets,
+                 prepare_multiplier(medal), medal.tier, medal.hits, medal.notes]
+        rendered_medal = (attributes, tuple(str(cell) for cell in cells), {})
+        _rendered_medals[medal.medal_id] = rendered_medal
 
-    return '\n'.join((header, header_separator, *rows))
+    _, cells, rows = rendered_medal
+    if reply_format not in rows:
+        rows[reply_format] = REPLY_FORMATS[reply_format].render_row(cells)
+
+    return rows[reply_format]
+
+def clear_rendered_medals():
+    """Forgets every rendered medal. It can be used as a post scrape hook"""
+    _rendered_medals.clear()
 
 def prepare_multiplier(medal):
     if medal.multiplier_min == medal.multiplier_max:
@@ -35,4 +89,43 @@ def prepare_multiplier_string(input_multiplier_string):
     if '~' in processed_multiplier_string:
         processed_multiplier_string = processed_multiplier_string.replace('~', '-')
 
-    return processed_multiplier_string
\ No newline at end of file
+    return processed_multiplier_string
+
+
+def parse_multiplier(multiplier_string):
+    """Returns a list with the min and max multipliers of a multiplier string.
+    Raises a ParseMultiplierError if it isn't valid"""
+    try:
+        processed_multiplier_string = prepare_multiplier_string(multiplier_string)
+        multipliers = processed_multiplier_string.split('-')
+
+        if len(multipliers) == 1:
+            multipliers = [multipliers[0]] * 2
+
+        return list(map(float, multipliers))
+
+    except Exception:
+        raise ParseMultiplierError(f"The value {multiplier_string} couldn't be parsed")
+
+# One line per multiplier: 'x1.5', '1.2~2.4', 'x3.0-4.5'... Lines with any other
+# content still match, through the last alternative, but without any group
+_number = r'(\d+(?:\.\d*)?|\.\d+)'
+MULTIPLIERS_PATTERN = re.compile(r'^(?:[ \t]*[xX]?[ \t]*' + _number + r'[ \t]*(?:[-~][ \t]*' + _number +
+                                 r')?[ \t]*|.*)$', re.MULTILINE)
+
+def parse_multipliers(multiplier_strings):
+    """Batch version of parse_multiplier, parsing a whole column of
+    multiplier strings with a single regex pass.
+
+    Returns a tuple with two arrays, with the min and max multipliers, and a
+    bytearray with a 1 on the positions of the strings that couldn't be parsed
+    (their multipliers are NaN)"""
+    # Values that aren't strings, or would span several lines, can't be parsed
+    lines = [string if isinstance(string, str) and '\n' not in string else '' for string in multiplier_strings]
+
+    multipliers = MULTIPLIERS_PATTERN.findall('\n'.join(lines)) if lines else []
+    minimums = [minimum or 'nan' for minimum, _ in multipliers]
+    maximums = [maximum or minimum for (_, maximum), minimum in zip(multipliers, minimums)]
+
+    return (array('d', map(float, minimums)), array('d', map(float, maximums)),
+            bytearray(minimum == 'nan' for minimum in minimums))
@@ -0,0 +1,123 @@
+import time
+from collections import defaultdict
+
+from khux_medal_finder.models import Medal, MedalRecord, SyncState
+
+
+class MedalIndex:
+    """In-memory copy of the rarity 6 combat medals of the DB, as MedalRecords,
+    used to answer searches locally instead of asking khuxbot for each one of them.
+
+    Medals are kept sorted by their max multiplier. For every value of the indexed
+    attributes there is a bitmap (stored as an int) with a bit set on the positions
+    of the medals having that value, so a search is just a few bitwise operations.
+
+    The medals are loaded from the DB on the first search, unless they're loaded
+    by hand. After that, searches check every `check_interval` seconds whether the
+    catalogue version on the DB has changed (e.g. because the scrapper has saved
+    new medals from another process), and reload them if so"""
+    INDEXED_ATTRIBUTES = ('element', 'targets', 'direction', 'tier')
+
+    def __init__(self, check_interval=60):
+        self.catalogue = []
+        self.bitmaps = {}
+        self.all_medals = 0
+        self.loaded = False
+
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = None
+
+    def refresh(self):
+        """Reloads the medals from the DB"""
+        # The version is read first, so medals saved while loading cause another reload
+        self.version = SyncState.catalogue_version()
+        self.checked_at = time.monotonic()
+
+        query = (Medal.select(*MedalRecord.columns())
+                 .where((Medal.rarity == 6) & (Medal.type == 'Combat'))
+                 .order_by(Medal.multiplier_max.desc(), Medal.medal_id))
+
+        self.load(MedalRecord.from_row(row) for row in query.tuples())
+
+    def refresh_if_stale(self):
+        """Loads the medals if they haven't been loaded yet, or reloads them if their
+        version on the DB has changed since then. Returns whether they've been loaded"""
+        if not self.loaded:
+            self.refresh()
+            return True
+
+        # Medals loaded by hand don't come from the DB, so they're never reloaded
+        if self.checked_at is None or time.monotonic() - self.checked_at < self.check_interval:
+            return False
+
+        self.checked_at = time.monotonic()
+        if SyncState.catalogue_version() == self.version:
+            return False
+
+        self.refresh()
+        return True
+
+    def load(self, medals):
+        """Replaces the indexed medals. They must be already sorted"""
+        catalogue = list(medals)
+        bitmaps = defaultdict(int)
+
+        for position, medal in enumerate(catalogue):
+            for attribute in self.INDEXED_ATTRIBUTES:
+                bitmaps[(attribute, str(getattr(medal, attribute)))] |= 1 << position
+
+        self.catalogue, self.bitmaps, self.all_medals = catalogue, dict(bitmaps), (1 << len(catalogue)) - 1
+        self.loaded = True
+
+    def bitmap(self, filters):
+        """Returns the bitmap of the medals matching all the filters. The value of
+        each filter can also be a list, matching any of its values"""
+        bitmap = self.all_medals
+
+        for attribute, values in filters.items():
+            if not isinstance(values, (list, tuple, set, frozenset)):
+                values = [values]
+
+            attribute_bitmap = 0
+            for value in values:
+                attribute_bitmap |= self.value_bitmap(attribute, str(value))
+
+            bitmap &= attribute_bitmap
+
+        return bitmap
+
+    def value_bitmap(self, attribute, value):
+        if attribute not in self.INDEXED_ATTRIBUTES and (attribute, value) not in self.bitmaps:
+            # Attributes that aren't indexed are only scanned the first time they're used
+            self.bitmaps[(attribute, value)] = sum(1 << position for position, medal in enumerate(self.catalogue)
+                                                   if str(getattr(medal, attribute)) == value)
+
+        return self.bitmaps.get((attribute, value), 0)
+
+    def select(self, bitmap, limit=None):
+        """Returns the medals whose bit is set in the bitmap, sorted by max multiplier"""
+        medals = []
+
+        while bitmap and (limit is None or len(medals) < limit):
+            lowest_bit = bitmap & -bitmap
+            medals.append(self.catalogue[lowest_bit.bit_length() - 1])
+            bitmap ^= lowest_bit
+
+        return medals
+
+    def medals(self, filters, limit=None):
+        """Given the filters to search, returns a list with the matching medals"""
+        self.refresh_if_stale()
+        return self.select(self.bitmap(filters), limit)
+
+    def combine_searches(self, filters_list, limit=None):
+        """Given a list containing sets of filters, returns the medals matching
+        any of them, without repetitions"""
+        self.refresh_if_stale()
+
+        bitmap = 0
+        for filters in filters_list:
+            bitmap |= self.bitmap(filters)
+
+        return self.select(bitmap, limit)
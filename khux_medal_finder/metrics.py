@@ -0,0 +1,255 @@
+"""Lightweight instrumentation of the bot: counters and timers, exported in
+the Prometheus text format from a local HTTP endpoint and, optionally, to
+StatsD.
+
+Timers keep the last `Timer.SAMPLES` durations to compute the percentiles, so
+their memory doesn't grow with the time the bot has been running"""
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter as Occurrences, deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+PREFIX = 'khux_medal_finder'
+
+
+class Counter:
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Timer:
+    """Durations of an operation, in seconds"""
+    SAMPLES = 1024
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=self.SAMPLES)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def percentile(self, percentile):
+        """Returns the percentile (between 0 and 100) of the last durations"""
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+class Registry:
+    """Keeps the counters and timers by name. Every observation is also sent to
+    the listeners, such as a StatsdExporter"""
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.listeners = []
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = Counter()
+            counter.inc(amount)
+
+        for listener in self.listeners:
+            listener.count(name, amount)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = Timer()
+            timer.observe(seconds)
+
+        for listener in self.listeners:
+            listener.observe(name, seconds)
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def prometheus_text(self):
+        """Returns the metrics in the Prometheus text format. Timers are exported
+        as summaries with their p50 and p99; their throughput is the rate of
+        their `_count`"""
+        lines = [f'# TYPE {PREFIX}_uptime_seconds gauge',
+                 f'{PREFIX}_uptime_seconds {time.time() - self.started_at:.3f}']
+
+        with self.lock:
+            for name, counter in sorted(self.counters.items()):
+                lines += [f'# TYPE {PREFIX}_{name}_total counter',
+                          f'{PREFIX}_{name}_total {counter.value}']
+
+            for name, timer in sorted(self.timers.items()):
+                lines += [f'# TYPE {PREFIX}_{name}_seconds summary',
+                          f'{PREFIX}_{name}_seconds{{quantile="0.5"}} {timer.percentile(50):.6f}',
+                          f'{PREFIX}_{name}_seconds{{quantile="0.99"}} {timer.percentile(99):.6f}',
+                          f'{PREFIX}_{name}_seconds_sum {timer.total:.6f}',
+                          f'{PREFIX}_{name}_seconds_count {timer.count}']
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+
+
+REGISTRY = Registry()
+
+
+def count(name, amount=1, registry=None):
+    (registry or REGISTRY).count(name, amount)
+
+
+def timed(name, registry=None):
+    """Decorator timing every call of the function"""
+    def decorator(function):
+        # It's used on hot paths, so it doesn't use Registry.time, which is a slower generator
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                (registry or REGISTRY).observe(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class StatsdExporter:
+    """Sends every observation to StatsD, using UDP so it never blocks the bot"""
+
+    def __init__(self, host='localhost', port=8125, prefix=PREFIX):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def count(self, name, amount):
+        self.send(f'{self.prefix}.{name}:{amount}|c')
+
+    def observe(self, name, seconds):
+        self.send(f'{self.prefix}.{name}:{seconds * 1000:.3f}|ms')
+
+    def send(self, metric):
+        try:
+            self.socket.sendto(metric.encode('ascii'), self.address)
+        except OSError:
+            # Losing a metric is better than stopping the bot
+            pass
+
+
+class SamplingProfiler:
+    """Samples every `interval` seconds the function each thread is running, so
+    we can see where the time goes without the overhead of a tracing profiler"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = Occurrences()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def sample(self):
+        own_id = threading.get_ident()
+
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    code = frame.f_code
+                    self.samples[(code.co_filename, frame.f_lineno, code.co_name)] += 1
+
+            time.sleep(self.interval)
+
+    def report(self, limit=20):
+        """Returns the lines where most samples have been taken, with the share of
+        samples of each one"""
+        total = sum(self.samples.values()) or 1
+        return '\n'.join(f'{samples / total:7.2%}  {function} ({filename}:{line})'
+                         for (filename, line, function), samples in self.samples.most_common(limit)) + '\n'
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve_metrics(port=9100, host='127.0.0.1', registry=None, profiler=None):
+    """Serves the metrics on http://host:port/metrics from a background thread.
+    If there's a profiler, its report is served on /profile"""
+    registry = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = registry.prometheus_text()
+            elif self.path == '/profile' and profiler is not None:
+                body = profiler.report()
+            else:
+                self.send_error(404)
+                return
+
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes would fill the output of the bot otherwise
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+
+    return server
+
+
+def init_metrics():
+    """Starts exporting the metrics as configured by the environment variables:
+    METRICS_PORT for the HTTP endpoint, STATSD_HOST and STATSD_PORT for StatsD,
+    and METRICS_PROFILER to also run the sampling profiler"""
+    profiler = None
+    if os.environ.get('METRICS_PROFILER'):
+        profiler = SamplingProfiler(interval=float(os.environ.get('METRICS_PROFILER_INTERVAL', 0.01)))
+        profiler.start()
+
+    if os.environ.get('STATSD_HOST'):
+        REGISTRY.listeners.append(StatsdExporter(os.environ['STATSD_HOST'], int(os.environ.get('STATSD_PORT', 8125))))
+
+    if os.environ.get('METRICS_PORT'):
+        serve_metrics(int(os.environ['METRICS_PORT']), host=os.environ.get('METRICS_HOST', '127.0.0.1'),
+                      profiler=profiler)
@@ -1,12 +1,84 @@
 import os
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
 from peewee import *
 
-db = PostgresqlDatabase(database=os.environ['DB_DATABASE'],
-                        user=os.environ['DB_USERNAME'],
-                        password=os.environ['DB_PASSWORD'],
-                        host=os.environ['DB_HOST'],
-                        port=os.environ['DB_PORT'],
-                        autorollback=True)
+from khux_medal_finder import helpers
+from khux_medal_finder.exceptions import ParseMultiplierError
+
+# The real database is only created when init_db is called, so the modules
+# using the models can be imported without the DB settings
+db = DatabaseProxy()
+
+
+def init_db(config=None):
+    """Creates the database the models use. `config` is a dict with the arguments
+    of PooledPostgresqlDatabase; if it's not specified they're read from the
+    environment variables"""
+    if config is None:
+        config = {'database': os.environ['DB_DATABASE'],
+                  'user': os.environ['DB_USERNAME'],
+                  'password': os.environ['DB_PASSWORD'],
+                  'host': os.environ['DB_HOST'],
+                  'port': os.environ['DB_PORT'],
+                  'max_connections': int(os.environ.get('DB_MAX_CONNECTIONS', 8)),
+                  'stale_timeout': int(os.environ.get('DB_STALE_TIMEOUT', 300))}
+
+    # Only needed by the processes that use the DB
+    from playhouse.pool import PooledPostgresqlDatabase
+
+    database = PooledPostgresqlDatabase(autorollback=True, **config)
+    db.initialize(database)
+
+    return database
+
+
+@contextmanager
+def unit_of_work(database=None):
+    """Scopes a connection and a transaction to a unit of work, such as replying
+    to a comment or saving a batch of medals. If the connection wasn't open yet,
+    it's given back to the pool at the end. It can also be used as a decorator"""
+    database = database or db
+    opened_connection = database.connect(reuse_if_open=True)
+
+    try:
+        with database.atomic():
+            yield database
+
+    finally:
+        if opened_connection:
+            database.close()
+
+
+def pool_stats(database=None):
+    """Returns how many connections of the pool are being used and how many are
+    open but idle"""
+    database = database or db
+    return {'max_connections': database._max_connections,
+            'in_use': len(database._in_use),
+            'idle': len(database._connections)}
+
+
+def is_initialized(database):
+    """Returns whether a database can be used: it's a real one, or a proxy that
+    has already been initialized"""
+    return not isinstance(database, Proxy) or database.obj is not None
+
+
+def close_connections(database=None):
+    """Closes every connection of the database, including the ones of the pool in
+    use. Forked processes must not use the connections of their parent, so it's
+    called before forking"""
+    database = database or db.obj
+    if database is None:
+        return
+
+    if hasattr(database, 'close_all'):
+        database.close_all()
+    else:
+        database.close()
 
 
 class BaseModel(Model):
@@ -36,15 +108,192 @@ class Medal(BaseModel):
     type = CharField(max_length=10)
     voice_link = TextField(null=True)
 
+    @classmethod
+    def search(cls, requirements, limit=10):
+        """Returns the rarity 6 combat medals matching the requirements with the
+        highest max multiplier, as MedalRecords. `requirements` is a dict with the
+        value of each attribute, or a list of values if any of them is valid.
+
+        Only the columns of the records are selected"""
+        query = (cls.select(*MedalRecord.columns())
+                 .where((cls.type == 'Combat') & (cls.rarity == 6)))
+
+        for attribute, values in requirements.items():
+            if attribute not in MedalRecord._fields:
+                raise ValueError(f"Medals can't be searched by {attribute}")
+
+            field = getattr(cls, attribute)
+            if isinstance(values, (list, tuple, set, frozenset)):
+                query = query.where(field.in_(list(values)))
+            else:
+                query = query.where(field == values)
+
+        query = query.order_by(cls.multiplier_max.desc(), cls.medal_id).limit(limit)
+        return [MedalRecord._make(row) for row in query.tuples()]
+
+
+# Used to compare the names of the medals case-insensitively
+Medal.add_index(Medal.index(fn.LOWER(Medal.name), name='medal_lower_name'))
+
+# Used by the searches of the bot, which only care about combat medals
+Medal.add_index(Medal.index(Medal.rarity, Medal.element, Medal.targets, Medal.direction, Medal.multiplier_max.desc(),
+                            where=(Medal.type == 'Combat'), name='medal_combat_search'))
+
+
+class MedalRecord(namedtuple('MedalRecord', ['medal_id', 'name', 'rarity', 'tier', 'cost', 'element', 'targets',
+                                             'direction', 'multiplier_min', 'multiplier_max', 'hits', 'notes'])):
+    """Immutable medal with only the attributes that can be searched or are
+    shown in the replies. It's used instead of Medal where medals are only
+    read, as it takes a fraction of its memory"""
+    __slots__ = ()
+
+    @staticmethod
+    def columns():
+        """Returns the fields of Medal to select to build the records from rows"""
+        return [getattr(Medal, field) for field in MedalRecord._fields]
+
+    @classmethod
+    def from_row(cls, row):
+        """Builds a record from a tuple with the values of `columns`"""
+        return cls._make(row)
+
+    @classmethod
+    def from_medal(cls, medal):
+        return cls._make(getattr(medal, field) for field in cls._fields)
+
+    @classmethod
+    def from_json(cls, medal_json):
+        """Builds a record from the JSON of a medal returned by khuxbot. Raises a
+        ParseMultiplierError if its multiplier isn't valid"""
+        records = cls.from_json_list([medal_json])
+        if not records:
+            raise ParseMultiplierError(f"The value {medal_json.get('multiplier')} couldn't be parsed")
+
+        return records[0]
+
+    @classmethod
+    def from_json_list(cls, medals_json):
+        """Builds the records of a list of JSONs, parsing all their multipliers at
+        once. Medals whose multiplier isn't valid are logged and skipped"""
+        minimums, maximums, errors = helpers.parse_multipliers([medal_json.get('multiplier')
+                                                                for medal_json in medals_json])
+        records = []
+
+        for position, medal_json in enumerate(medals_json):
+            multiplier = minimums[position], maximums[position]
+
+            # The batch parser only knows the usual formats, so the multipliers it
+            # rejects are parsed again one by one, as MedalFactory does
+            if errors[position]:
+                try:
+                    multiplier = helpers.parse_multiplier(medal_json.get('multiplier'))
+                except ParseMultiplierError as e:
+                    print(f"Skipping medal {medal_json.get('id')}: {repr(e)}")
+                    continue
+
+            records.append(cls(medal_json['id'], medal_json['name'], medal_json.get('rarity'), medal_json['tier'],
+                               medal_json['cost'], medal_json['element'], medal_json['targets'],
+                               medal_json['direction'], multiplier[0], multiplier[1], medal_json['hits'],
+                               medal_json.get('notes')))
+
+        return records
+
+
+class SyncState(BaseModel):
+    """Validators of the last khuxbot response obtained for a resource (the list
+    of names or the data of a medal name), used to sync only what has changed.
+
+    The `catalogue` resource holds a version of the medals in the DB instead,
+    which changes every time they're saved, so the processes keeping a copy of
+    them know when they have to reload it"""
+    CATALOGUE = 'catalogue'
+
+    resource = TextField(primary_key=True)
+    content_hash = CharField(max_length=64, null=True)
+    etag = TextField(null=True)
+    last_modified = TextField(null=True)
+    synced_at = DateTimeField(default=datetime.now, index=True)
+
+    @classmethod
+    def touch_catalogue(cls):
+        """Gives the medals a new version"""
+        (cls.insert(resource=cls.CATALOGUE, content_hash=uuid.uuid4().hex, synced_at=datetime.now())
+         .on_conflict(conflict_target=[cls.resource], preserve=[cls.content_hash, cls.synced_at])
+         .execute())
+
+    @classmethod
+    def catalogue_version(cls):
+        """Returns the version of the medals, or None if they've never been saved"""
+        return (cls.select(cls.content_hash)
+                .where(cls.resource == cls.CATALOGUE)
+                .scalar())
+
+    @classmethod
+    def save_states(cls, states):
+        """Inserts or updates the states, using a single query"""
+        if not states:
+            return
+
+        for state in states:
+            state.synced_at = datetime.now()
+
+        (cls.insert_many([state.__data__ for state in states])
+         .on_conflict(conflict_target=[cls.resource],
+                      preserve=[cls.content_hash, cls.etag, cls.last_modified, cls.synced_at])
+         .execute())
+
+
+class SearchCombination(BaseModel):
+    """Best medals for a combination of element, targets and direction, where
+    any of them can be '*' to match every value. They're precomputed after
+    scraping, so answering a comment doesn't need to rank the medals"""
+    key = CharField(primary_key=True)
+    medals = TextField()
+    computed_at = DateTimeField(default=datetime.now)
+
 
 class Comment(BaseModel):
     """Comment posted by a user on Reddit"""
     author = CharField()
-    comment_id = CharField()
+    comment_id = CharField(unique=True)
     text = TextField()
     timestamp = TimestampField()
     url = CharField(max_length=400)
 
+    @classmethod
+    def processed_ids(cls, comment_ids):
+        """Given some Reddit comment ids, returns a set with the ones that are
+        already on the DB, using a single query"""
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return set()
+
+        query = cls.select(cls.comment_id).where(cls.comment_id.in_(comment_ids))
+        return set(comment_id for comment_id, in query.tuples())
+
+    @classmethod
+    def delete_duplicates(cls):
+        """Deletes the rows repeating the comment_id of an older one, which could
+        be saved before comment_id was unique. Rows referencing a deleted one are
+        moved to the one that's kept. Returns the amount of deleted rows"""
+        duplicated = (cls.select(cls.comment_id, fn.MIN(cls.id))
+                      .group_by(cls.comment_id)
+                      .having(fn.COUNT(cls.id) > 1))
+        kept_ids = dict(duplicated.tuples())
+        if not kept_ids:
+            return 0
+
+        rows = cls.select(cls.id, cls.comment_id).where(cls.comment_id.in_(list(kept_ids)))
+        duplicate_ids = {row_id: kept_ids[comment_id] for row_id, comment_id in rows.tuples()
+                         if row_id != kept_ids[comment_id]}
+
+        with unit_of_work(cls._meta.database):
+            for duplicate_id, kept_id in duplicate_ids.items():
+                for field in cls._meta.backrefs:
+                    field.model.update({field: kept_id}).where(field == duplicate_id).execute()
+
+            return cls.delete().where(cls.id.in_(list(duplicate_ids))).execute()
+
 
 class Reply(Comment):
     """Reply made by the bot to one Reddit comment. Though it could be modelled
@@ -52,3 +301,41 @@ class Reply(Comment):
     author = CharField(default=lambda: 'khux_medal_finder')
     original_comment = ForeignKeyField(Comment)
     success = BooleanField()
+
+
+# Reply of the bot on Reddit, with the same attributes as the praw Comment
+SentReply = namedtuple('SentReply', ['id', 'created', 'permalink'])
+
+
+class PendingReply(BaseModel):
+    """Reply to a Reddit comment waiting to be sent. Keeping them on the DB
+    ensures they aren't lost if Reddit rate-limits the bot or it's restarted"""
+    comment_id = CharField(unique=True)
+    author = CharField()
+    text = TextField()
+    timestamp = TimestampField()
+    url = CharField(max_length=400)
+    reply_text = TextField()
+    success = BooleanField()
+    attempts = IntegerField(default=0)
+    next_attempt_at = DateTimeField(default=datetime.now, index=True)
+    # Reply already sent to Reddit, but not saved as a Reply yet
+    reply_id = CharField(null=True)
+    reply_timestamp = TimestampField(null=True)
+    reply_url = CharField(max_length=400, null=True)
+
+    def comment_fields(self):
+        """Returns the fields of the Comment to create once the reply is sent"""
+        return {'author': self.author, 'comment_id': self.comment_id, 'text': self.text,
+                'timestamp': self.timestamp, 'url': self.url}
+
+    def sent_reply(self):
+        """Returns the reply sent to Reddit, or None if it hasn't been sent yet"""
+        if self.reply_id is None:
+            return None
+
+        return SentReply(id=self.reply_id, created=self.reply_timestamp, permalink=self.reply_url)
+
+    def mark_as_sent(self, sent_reply):
+        self.reply_id, self.reply_timestamp, self.reply_url = sent_reply
+        self.save()
@@ -0,0 +1,94 @@
+import heapq
+import json
+from itertools import product
+
+from khux_medal_finder import helpers
+from khux_medal_finder.models import Medal, MedalRecord, SearchCombination, unit_of_work
+
+# Attributes a comment can ask for, and the values of each one of them
+COMBINATION_ATTRIBUTES = (
+    ('element', ('Power', 'Speed', 'Magic')),
+    ('targets', ('Single', 'Random', 'All')),
+    ('direction', ('Upright', 'Reversed')),
+)
+
+# Value of an attribute matching any medal
+WILDCARD = '*'
+
+
+def combination_key(filters):
+    """Returns the key of the combination matching the filters. Attributes
+    missing from the filters match any value"""
+    unknown_attributes = set(filters) - set(attribute for attribute, _ in COMBINATION_ATTRIBUTES)
+    if unknown_attributes:
+        raise ValueError(f"Searches by {', '.join(sorted(unknown_attributes))} aren't precomputed")
+
+    return '|'.join(str(filters.get(attribute, WILDCARD)) for attribute, _ in COMBINATION_ATTRIBUTES)
+
+
+def ranking(medal):
+    """Order of the medals in the replies: highest max multiplier first"""
+    return -medal.multiplier_max, medal.medal_id
+
+
+def precompute_search_combinations(top=helpers.REPLY_MAX_MEDALS):
+    """Computes the `top` best rarity 6 combat medals of every combination of
+    element, targets and direction (including the wildcard) with a single pass
+    over the medals, and replaces the stored combinations with them"""
+    combinations = {'|'.join(values): [] for values in product(*((WILDCARD,) + values
+                                                                   for _, values in COMBINATION_ATTRIBUTES))}
+
+    query = (Medal.select(*MedalRecord.columns())
+             .where((Medal.rarity == 6) & (Medal.type == 'Combat'))
+             .order_by(Medal.multiplier_max.desc(), Medal.medal_id))
+
+    for medal in map(MedalRecord.from_row, query.tuples().iterator()):
+        # Every medal belongs to the combinations of its own values and the wildcard
+        for values in product(*((str(getattr(medal, attribute)), WILDCARD) for attribute, _ in COMBINATION_ATTRIBUTES)):
+            medals = combinations.get('|'.join(values))
+            if medals is not None and len(medals) < top:
+                medals.append(medal)
+
+    rows = [{'key': key, 'medals': json.dumps(medals)} for key, medals in combinations.items()]
+    with unit_of_work(SearchCombination._meta.database):
+        SearchCombination.delete().execute()
+        SearchCombination.insert_many(rows).execute()
+
+    print(f'{len(rows)} search combinations precomputed')
+    return len(rows)
+
+
+class PrecomputedSearch:
+    """Answers the searches of the bot from the precomputed combinations, with
+    a single keyed query, returning MedalRecords. Combinations are updated by precompute_search_combinations,
+    so they can only be searched by element, targets and direction"""
+
+    def medals(self, filters, limit=None):
+        """Given the filters to search, returns a list with the matching medals"""
+        return self.combine_searches([filters], limit=limit)
+
+    def combine_searches(self, filters_list, limit=None):
+        """Given a list containing sets of filters, returns the medals matching
+        any of them, without repetitions"""
+        keys = [combination_key(filters) for filters in filters_list]
+        if not keys:
+            return []
+
+        query = SearchCombination.select(SearchCombination.medals).where(SearchCombination.key.in_(keys))
+        medals_lists = [[MedalRecord.from_row(row) for row in json.loads(medals)] for medals, in query.tuples()]
+
+        # Each list is already sorted, so they only need to be merged
+        medals = []
+        medal_ids = set()
+        for medal in heapq.merge(*medals_lists, key=ranking):
+            if medal.medal_id not in medal_ids:
+                medal_ids.add(medal.medal_id)
+                medals.append(medal)
+
+            if limit is not None and len(medals) >= limit:
+                break
+
+        return medals
+
+    def is_empty(self):
+        return not SearchCombination.select().exists()
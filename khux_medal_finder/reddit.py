@@ -1,9 +1,12 @@
 import os
-import praw
-import prawcore
+import time
+from datetime import datetime, timedelta
+
+from peewee import DatabaseError
 
 from khux_medal_finder import helpers
-from khux_medal_finder.models import Comment, Reply
+from khux_medal_finder.metrics import count, timed
+from khux_medal_finder.models import Comment, PendingReply, Reply, SentReply, unit_of_work
 
 
 class RedditService:
@@ -11,6 +14,10 @@ class RedditService:
     REPLY_NO_MEDALS = "I'm sorry, I couldn't find any medal that match your requirements." + REPLY_BOT_DESCRIPTION
 
     def __init__(self):
+        # praw is imported here because it's slow to import and most of the
+        # modules that use this one don't need it
+        import praw
+
         self.reddit = praw.Reddit(user_agent='Medal finder bot by /u/Pawah/',
                                   client_id=os.environ.get('REDDIT_BOT_TOKEN'),
                                   client_secret=os.environ.get('REDDIT_BOT_SECRET'),
@@ -25,6 +32,8 @@ class RedditService:
 
         This is necessary because praw.Reddit returns us Reddit and Subreddit instances as if there hadn't been any
         problem even when the authentication is invalid, and therefore we won't realize if it happens."""
+        import prawcore
+
         try:
             self.reddit.user.me()
             self.valid = True
@@ -51,19 +60,182 @@ class RedditService:
         subreddit = self.reddit.subreddit(subreddit_name)
         return subreddit.comments(limit=amount)
 
+    def subreddit_comments_stream(self, subreddit_name, pause_after=None):
+        """Yields the new comments of the subreddit as they're posted. Before that, it
+        yields up to 100 historical comments"""
+        subreddit = self.reddit.subreddit(subreddit_name)
+        return subreddit.stream.comments(pause_after=pause_after)
+
+    @timed('reddit_reply')
     def reply(self, comment, medals):
+        reply_body, success = self.reply_body(medals)
+        reply = comment.reply(reply_body)
+
+        return self.save_reply(self.comment_fields(comment), reply, reply_body, success)
+
+    def reply_body(self, medals):
+        """Returns the text of the reply to a comment asking for the medals, and
+        whether any medal was found"""
         if medals:
-            success = True
-            reply_body = helpers.prepare_reply_body(medals) + self.REPLY_BOT_DESCRIPTION
+            return helpers.prepare_reply_body(medals) + self.REPLY_BOT_DESCRIPTION, True
         else:
-            success = False
-            reply_body = self.REPLY_NO_MEDALS
+            return self.REPLY_NO_MEDALS, False
+
+    def comment_fields(self, comment):
+        return {'author': comment.author, 'comment_id': comment.id, 'text': comment.body,
+                'timestamp': comment.created, 'url': comment.permalink}
+
+    @timed('db_save_reply')
+    def save_reply(self, comment_fields, reply, reply_body, success):
+        """Saves a sent reply, and the comment it answers, using a single transaction"""
+        with unit_of_work(Comment._meta.database):
+            comment_object = Comment.create(**comment_fields)
+            reply_object = Reply.create(original_comment=comment_object, success=success, comment_id=reply.id,
+                                        text=reply_body, timestamp=reply.created, url=reply.permalink)
+
+        count('replies_sent')
+        return reply_object
+
+
+class TokenBucket:
+    """Allows on average `rate` actions per second, with bursts of up to
+    `capacity` actions"""
+    # Time we wait if Reddit says there are no requests left, but not when they'll be available again
+    RESET_DELAY = 60
+
+    def __init__(self, rate=0.5, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.time()
+        self.blocked_until = 0
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self):
+        """Takes a token, if there's any available. Returns whether it could"""
+        self.refill()
+        if self.updated_at < self.blocked_until or self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+    def update(self, limits):
+        """Adjusts the bucket to the rate limit headers of the last response of
+        Reddit, as exposed by praw on `reddit.auth.limits`"""
+        remaining = limits.get('remaining')
+        if remaining is None:
+            return
+
+        self.refill()
+        self.tokens = min(self.tokens, remaining)
+        if remaining < 1:
+            self.blocked_until = limits.get('reset_timestamp') or self.updated_at + self.RESET_DELAY
+
+
+class ReplyScheduler:
+    """Queue of the replies the bot has to send, stored on the DB.
+
+    Replies are sent while the token bucket allows it, so the bot never blocks
+    waiting for Reddit's rate limit. If sending a reply fails it's retried later,
+    with an exponential backoff, up to `max_attempts` times. Replies that reach
+    it are reported and kept on the table, see `failed`.
+
+    A reply is marked as sent as soon as Reddit accepts it, so if saving it
+    fails only saving it is retried: the comment is never answered twice"""
+
+    def __init__(self, reddit_service, bucket=None, max_attempts=5, backoff=30):
+        self.reddit_service = reddit_service
+        self.bucket = bucket or TokenBucket()
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        # Replies sent whose pending reply couldn't be marked as sent, by comment id
+        self.sent_replies = {}
+
+    def enqueue(self, comment, medals):
+        """Adds the reply to the comment to the queue. A comment that is already
+        queued isn't added again, so it can't be answered twice"""
+        reply_body, success = self.reddit_service.reply_body(medals)
+
+        (PendingReply.insert(reply_text=reply_body, success=success, **self.reddit_service.comment_fields(comment))
+         .on_conflict_ignore()
+         .execute())
+
+    def pending(self):
+        return (PendingReply.select()
+                .where((PendingReply.next_attempt_at <= datetime.now()) &
+                       (PendingReply.attempts < self.max_attempts))
+                .order_by(PendingReply.next_attempt_at))
+
+    def failed(self):
+        """Returns the replies that won't be retried anymore"""
+        return PendingReply.select().where(PendingReply.attempts >= self.max_attempts)
+
+    def send_pending(self):
+        """Sends the queued replies until there are no more or the rate limit is
+        reached. Returns how many have been sent"""
+        # praw is already imported by RedditService
+        from praw.exceptions import PRAWException
+        from prawcore import PrawcoreException
+
+        sent = 0
+        for pending_reply in self.pending():
+            if not self.bucket.take():
+                break
+
+            try:
+                self.send(pending_reply)
+                sent += 1
+
+            except (PRAWException, PrawcoreException, DatabaseError) as exception:
+                self.retry_later(pending_reply, exception)
+
+            finally:
+                self.bucket.update(self.reddit_service.reddit.auth.limits)
+
+        return sent
+
+    def send(self, pending_reply):
+        """Sends the reply, unless it was already sent, and saves it"""
+        sent_reply = pending_reply.sent_reply() or self.sent_replies.get(pending_reply.comment_id)
+
+        if sent_reply is None:
+            comment = self.reddit_service.reddit.comment(id=pending_reply.comment_id)
+            reply = comment.reply(pending_reply.reply_text)
+            sent_reply = SentReply(id=reply.id, created=reply.created, permalink=reply.permalink)
+
+            self.sent_replies[pending_reply.comment_id] = sent_reply
+            pending_reply.mark_as_sent(sent_reply)
+
+        with unit_of_work(PendingReply._meta.database):
+            self.reddit_service.save_reply(pending_reply.comment_fields(), sent_reply, pending_reply.reply_text,
+                                           pending_reply.success)
+            pending_reply.delete_instance()
+
+        self.sent_replies.pop(pending_reply.comment_id, None)
 
-        reply = comment.reply(reply_body)
+    def retry_later(self, pending_reply, exception):
+        pending_reply.attempts += 1
+        pending_reply.next_attempt_at = datetime.now() + timedelta(seconds=self.backoff * 2 ** pending_reply.attempts)
 
-        comment_object = Comment.create(author=comment.author, comment_id=comment.id, text=comment.body,
-                                        timestamp=comment.created, url=comment.permalink)
-        reply_object = Reply.create(original_comment=comment_object, success=success, comment_id=reply.id,
-                                    text=reply_body, timestamp=reply.created, url=reply.permalink)
+        action = 'reply' if pending_reply.reply_id is None else 'save the reply'
+        print(f"Couldn't {action} to comment {pending_reply.comment_id} "
+              f"(attempt {pending_reply.attempts}): {repr(exception)}")
+
+        if pending_reply.attempts >= self.max_attempts:
+            print(f"Giving up on the reply to comment {pending_reply.comment_id} after {pending_reply.attempts} "
+                  f"attempts. It's kept on the pendingreply table")
+            count('replies_failed')
+
+        try:
+            pending_reply.save()
 
-        return reply_object
\ No newline at end of file
+        # The DB may be down as well, in which case the reply is retried on the next call
+        except DatabaseError as save_exception:
+            print(f"Couldn't save the attempts of the reply to comment {pending_reply.comment_id}: "
+                  f"{repr(save_exception)}")
@@ -0,0 +1,25 @@
+import os
+
+from khux_medal_finder.index import MedalIndex
+from khux_medal_finder.precomputed import PrecomputedSearch, precompute_search_combinations
+
+
+def bot_search():
+    """Returns the search used by the bots, chosen by the BOT_SEARCH environment
+    variable: 'precomputed' (the default) reads the combinations precomputed on
+    the DB, and 'index' keeps the medals in memory, reloading them when the
+    scrapper saves new ones"""
+    search_name = os.environ.get('BOT_SEARCH', 'precomputed')
+
+    if search_name == 'index':
+        return MedalIndex()
+
+    if search_name != 'precomputed':
+        raise ValueError(f"Unknown BOT_SEARCH: {search_name}")
+
+    # The combinations are updated by the scrapper, so they only have to be computed the first time
+    search = PrecomputedSearch()
+    if search.is_empty():
+        precompute_search_combinations()
+
+    return search
@@ -1,3 +1,4 @@
-from khux_medal_finder.models import Comment
+from khux_medal_finder.models import Comment, init_db
 
+init_db()
 Comment.create_table()
\ No newline at end of file
@@ -1,3 +1,4 @@
-from khux_medal_finder.models import Medal
+from khux_medal_finder.models import Medal, init_db
 
+init_db()
 Medal.create_table()
\ No newline at end of file
@@ -1,4 +1,5 @@
-from khux_medal_finder.models import Reply
+from khux_medal_finder.models import Reply, init_db
 
+init_db()
 Reply.create_table()
 
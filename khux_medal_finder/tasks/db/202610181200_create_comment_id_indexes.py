@@ -0,0 +1,12 @@
+from khux_medal_finder.models import Comment, Reply, init_db
+
+init_db()
+
+# The unique indexes can't be created while there are repeated comment ids,
+# so the repeated rows are deleted first, keeping the oldest one of each id
+print(f'{Comment.delete_duplicates()} repeated comments and {Reply.delete_duplicates()} repeated replies deleted')
+
+# Creates the indexes declared on the models that are missing in tables created
+# before them: the unique ones on comment_id and the one on original_comment
+Comment._schema.create_indexes(safe=True)
+Reply._schema.create_indexes(safe=True)
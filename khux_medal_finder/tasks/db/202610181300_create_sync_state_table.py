@@ -0,0 +1,4 @@
+from khux_medal_finder.models import SyncState, init_db
+
+init_db()
+SyncState.create_table()
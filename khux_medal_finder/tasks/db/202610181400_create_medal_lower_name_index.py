@@ -0,0 +1,10 @@
+from peewee import fn
+
+from khux_medal_finder.models import Medal, init_db
+
+database = init_db()
+
+# Creates the index on lower(name) used to find the missing medals. It's defined
+# here instead of taken from the model, so the migration doesn't change with it
+index = Medal.index(fn.LOWER(Medal.name), name='medal_lower_name')
+database.execute(Medal._schema._create_index(index, safe=True))
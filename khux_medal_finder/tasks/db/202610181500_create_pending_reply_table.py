@@ -0,0 +1,4 @@
+from khux_medal_finder.models import PendingReply, init_db
+
+init_db()
+PendingReply.create_table()
@@ -0,0 +1,4 @@
+from khux_medal_finder.models import SearchCombination, init_db
+
+init_db()
+SearchCombination.create_table()
@@ -0,0 +1,9 @@
+from khux_medal_finder.models import Medal, init_db
+
+database = init_db()
+
+# Creates the partial index on the combat medals used by Medal.search. It's
+# defined here instead of taken from the model, so the migration doesn't change with it
+index = Medal.index(Medal.rarity, Medal.element, Medal.targets, Medal.direction, Medal.multiplier_max.desc(),
+                    where=(Medal.type == 'Combat'), name='medal_combat_search')
+database.execute(Medal._schema._create_index(index, safe=True))
@@ -0,0 +1,15 @@
+from playhouse.migrate import SchemaMigrator, migrate
+
+from khux_medal_finder.models import PendingReply, init_db
+
+database = init_db()
+migrator = SchemaMigrator.from_database(database)
+
+# The table created by 202610181500 on a fresh install already has the columns,
+# as it's created from the current model. Only the missing ones are added
+existing_columns = set(column.name for column in database.get_columns('pendingreply'))
+missing_fields = [field for field in (PendingReply.reply_id, PendingReply.reply_timestamp, PendingReply.reply_url)
+                  if field.column_name not in existing_columns]
+
+with database.atomic():
+    migrate(*[migrator.add_column('pendingreply', field.column_name, field) for field in missing_fields])
@@ -0,0 +1,11 @@
+import os
+
+from khux_medal_finder import helpers
+from khux_medal_finder.models import init_db
+from khux_medal_finder.precomputed import precompute_search_combinations
+
+
+if __name__ == '__main__':
+    init_db()
+
+    precompute_search_combinations(top=int(os.environ.get('PRECOMPUTE_TOP_MEDALS', helpers.REPLY_MAX_MEDALS)))
@@ -0,0 +1,14 @@
+import os
+
+from khux_medal_finder.api import Scrapper
+from khux_medal_finder.archive import MedalArchive
+from khux_medal_finder.models import init_db
+
+
+if __name__ == '__main__':
+    init_db()
+
+    # Rebuilds the medals from the responses archived while scraping, without using the network
+    archive = MedalArchive(os.environ.get('SCRAPPER_ARCHIVE_PATH', 'khuxbot_archive.sqlite3'))
+    Scrapper(archive=archive).replay_archive()
+    archive.close()
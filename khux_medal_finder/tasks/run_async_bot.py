@@ -0,0 +1,33 @@
+import asyncio
+import os
+
+from khux_medal_finder.aio import AsyncMedalFinderBot, AsyncRedditService
+from khux_medal_finder.metrics import init_metrics
+from khux_medal_finder.models import init_db
+from khux_medal_finder.tasks import bot_search
+
+
+async def main():
+    search = bot_search()
+
+    reddit_service = AsyncRedditService()
+    await reddit_service.validate_authentication()
+
+    bot = AsyncMedalFinderBot(reddit_service, search,
+                              subreddit_name=os.environ['REDDIT_SUBREDDIT'],
+                              bot_name=os.environ['REDDIT_BOT_NAME'],
+                              checkpoint_path=os.environ.get('BOT_CHECKPOINT_PATH', 'bot_checkpoint.txt'),
+                              concurrency=int(os.environ.get('BOT_CONCURRENCY', 8)),
+                              executor=reddit_service.executor)
+
+    try:
+        await bot.run()
+    finally:
+        await reddit_service.close()
+
+
+if __name__ == '__main__':
+    init_db()
+    init_metrics()
+
+    asyncio.run(main())
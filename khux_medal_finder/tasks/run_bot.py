@@ -0,0 +1,22 @@
+import os
+
+from khux_medal_finder.bot import MedalFinderBot
+from khux_medal_finder.metrics import init_metrics
+from khux_medal_finder.models import init_db
+from khux_medal_finder.reddit import RedditService, ReplyScheduler
+from khux_medal_finder.tasks import bot_search
+
+
+if __name__ == '__main__':
+    init_db()
+    init_metrics()
+
+    search = bot_search()
+
+    reddit_service = RedditService()
+    bot = MedalFinderBot(reddit_service, search,
+                         subreddit_name=os.environ['REDDIT_SUBREDDIT'],
+                         bot_name=os.environ['REDDIT_BOT_NAME'],
+                         checkpoint_path=os.environ.get('BOT_CHECKPOINT_PATH', 'bot_checkpoint.txt'),
+                         scheduler=ReplyScheduler(reddit_service))
+    bot.run()
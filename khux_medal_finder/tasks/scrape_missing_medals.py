@@ -1,6 +1,34 @@
-from khux_medal_finder.api import Scrapper
+import os
+
+from khux_medal_finder.api import HttpClient, Scrapper
+from khux_medal_finder.archive import MedalArchive
+from khux_medal_finder.backfill import Backfill
+from khux_medal_finder.models import init_db
+from khux_medal_finder.precomputed import precompute_search_combinations
 
 
 if __name__ == '__main__':
-    scrapper = Scrapper()
-    scrapper.scrape_missing_medals()
+    init_db()
+
+    workers = int(os.environ.get('SCRAPPER_WORKERS', 1))
+    requests_per_second = float(os.environ.get('SCRAPPER_REQUESTS_PER_SECOND', 10))
+    archive_path = os.environ.get('SCRAPPER_ARCHIVE_PATH')
+    archive = MedalArchive(archive_path) if archive_path else None
+
+    # Every worker needs its own connection, otherwise they'd have to wait for each other
+    scrapper = Scrapper(requests_per_second=requests_per_second, http_client=HttpClient(pool_size=max(workers, 10)),
+                        archive=archive)
+    scrapper.post_scrape_hooks.append(precompute_search_combinations)
+
+    # Big scrapes, such as rebuilding the whole catalogue, can be spread among
+    # several processes. The responses aren't archived then
+    backfill_processes = os.environ.get('SCRAPPER_BACKFILL_PROCESSES')
+    if backfill_processes is not None:
+        backfill = Backfill(os.environ.get('SCRAPPER_BACKFILL_PROGRESS_DIR', 'backfill_progress'),
+                            processes=int(backfill_processes) or None, requests_per_second=requests_per_second,
+                            workers=workers)
+        backfill.post_scrape_hooks.append(precompute_search_combinations)
+        backfill.run(scrapper.missing_medals())
+    else:
+        scrapper.scrape_missing_medals(workers=workers)
+        print(f'HTTP connections: {scrapper.http_client.stats()}')
@@ -0,0 +1,20 @@
+import os
+
+from khux_medal_finder.api import HttpClient, Scrapper
+from khux_medal_finder.archive import MedalArchive
+from khux_medal_finder.models import init_db
+from khux_medal_finder.precomputed import precompute_search_combinations
+
+
+if __name__ == '__main__':
+    init_db()
+
+    workers = int(os.environ.get('SCRAPPER_WORKERS', 1))
+    requests_per_second = float(os.environ.get('SCRAPPER_REQUESTS_PER_SECOND', 10))
+    archive_path = os.environ.get('SCRAPPER_ARCHIVE_PATH')
+    archive = MedalArchive(archive_path) if archive_path else None
+
+    scrapper = Scrapper(requests_per_second=requests_per_second, http_client=HttpClient(pool_size=max(workers, 10)),
+                        archive=archive)
+    scrapper.post_scrape_hooks.append(precompute_search_combinations)
+    scrapper.sync_medals(recheck_limit=int(os.environ.get('SYNC_RECHECK_LIMIT', 50)), workers=workers)
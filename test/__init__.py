@@ -1,9 +0,0 @@
-import os
-
-os.environ = {
-            'DB_DATABASE': 'db',
-            'DB_USERNAME': 'user',
-            'DB_PASSWORD': 'pass',
-            'DB_HOST': 'host',
-            'DB_PORT': 'port'
-        }
\ No newline at end of file
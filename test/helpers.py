@@ -1,9 +1,11 @@
+import json
 import unittest
 import peewee
-from khux_medal_finder.models import BaseModel, Medal, Comment, Reply
+from khux_medal_finder.factories import MedalFactory
+from khux_medal_finder.models import BaseModel, Medal, SyncState, SearchCombination, Comment, Reply, PendingReply
 
 test_db = peewee.SqliteDatabase(':memory:')
-MODELS = [BaseModel, Medal, Comment, Reply]
+MODELS = [BaseModel, Medal, SyncState, SearchCombination, Comment, Reply, PendingReply]
 
 class BaseDBTestCase(unittest.TestCase):
     """TestCase class to use in the test cases where we need to query a DB.
@@ -29,3 +31,25 @@ class BaseDBTestCase(unittest.TestCase):
 
         super(BaseDBTestCase, self).tearDown()
 
+
+# Medal fixtures loaded by the tests of the searches
+SEARCH_FIXTURES = ['test/fixtures/search/medals_upright_power_c4_t6.json',
+                   'test/fixtures/search/medals_upright_power_c4_t7.json',
+                   'test/fixtures/scrapper/medals_data.json',
+                   'test/fixtures/scrapper/medal_with_symbol_in_name_1.json',
+                   'test/fixtures/scrapper/medal_with_symbol_in_name_2.json']
+
+class SearchFixturesTestCase(BaseDBTestCase):
+    """BaseDBTestCase whose DB already has the medals of SEARCH_FIXTURES"""
+    def setUp(self):
+        super(SearchFixturesTestCase, self).setUp()
+
+        medals_json = []
+        for fixture_file in SEARCH_FIXTURES:
+            with open(fixture_file) as fixture:
+                medals_json += json.loads(fixture.read())['medal'].values()
+
+        MedalFactory.medals(medals_json)
+
+    def names(self, medals):
+        return [medal.name for medal in medals]
@@ -0,0 +1,281 @@
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+import requests_mock
+from concurrent.futures import Executor, Future
+from unittest import mock
+from unittest.mock import patch
+
+from khux_medal_finder.aio import AsyncMedalFinderBot, AsyncRedditService, AsyncSearch
+from khux_medal_finder.api import Search
+from khux_medal_finder.models import Comment, Reply
+from khux_medal_finder.reddit import RedditService
+
+from test.helpers import BaseDBTestCase
+from test.test_reddit_reddit_service import ENV_MOCK
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class InlineExecutor(Executor):
+    """Runs the functions in the calling thread, as the test DB only exists
+    on the connection of this thread"""
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        future.set_result(function(*args, **kwargs))
+        return future
+
+
+class FakeResponse:
+    """Response of an aiohttp session, as an async context manager"""
+
+    def __init__(self, response_json):
+        self.response_json = response_json
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exception_info):
+        return False
+
+    async def json(self, content_type='application/json'):
+        return self.response_json
+
+
+async def async_iterator(items):
+    for item in items:
+        yield item
+
+
+def mock_comment(comment_id, body, author='Francisco Umbral'):
+    comment = mock.Mock()
+    comment.id = comment_id
+    comment.body = body
+    comment.author = author
+    comment.created = 1
+    comment.permalink = f'/r/KHUX/comments/{comment_id}/'
+    return comment
+
+
+class TestAsyncSearch(unittest.TestCase):
+    API_URL = 'http://www.khuxbot.com/api/v1/medal?q=data&filter=%7B%22rarity%22:%206,%22direction%22:%22Upright%22,%22element%22:%22Power%22,%22cost%22:%224%22,%22tier%22:%226%22%7D'
+    FILTERS = {"direction": "Upright", "element": "Power", "cost": 4, "tier": 6}
+
+    def setUp(self):
+        # The requests are sent with the blocking client, so they can be mocked
+        aiohttp_patcher = patch('khux_medal_finder.aio.aiohttp', None)
+        aiohttp_patcher.start()
+        self.addCleanup(aiohttp_patcher.stop)
+
+        self.search = AsyncSearch(Search())
+
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            self.api_response = json.loads(fixture.read())
+
+    @requests_mock.Mocker()
+    def test_medals_returns_the_same_medals_as_search(self, mock_requests):
+        mock_requests.get(self.API_URL, json=self.api_response)
+
+        medals = run(self.search.medals(self.FILTERS))
+
+        self.assertEqual([medal['id'] for medal in medals], [943, 982])
+        self.assertEqual(medals, Search().medals(self.FILTERS))
+
+    @requests_mock.Mocker()
+    def test_medals_share_the_search_cache(self, mock_requests):
+        mock_requests.get(self.API_URL, json=self.api_response)
+
+        run(self.search.medals(self.FILTERS))
+        self.search.search.medals(self.FILTERS)
+
+        self.assertEqual(mock_requests.call_count, 1)
+
+    def test_medals_are_requested_with_the_session(self):
+        session = mock.Mock()
+        session.get.return_value = FakeResponse(self.api_response)
+        self.search.session = session
+
+        medals = run(self.search.medals(self.FILTERS))
+
+        session.get.assert_called_once_with(self.search.search.endpoint(self.FILTERS))
+        self.assertEqual([medal['id'] for medal in medals], [943, 982])
+
+    def test_combine_searches_runs_searches_concurrently_in_order(self):
+        def slow_get(url):
+            time.sleep(0.2)
+            tier = json.loads(url[url.index('filter=') + len('filter='):])['tier']
+            return mock.Mock(json=lambda: {'medal': {'0': {'id': int(tier)}}})
+
+        with patch.object(self.search.search.http_client, 'get', side_effect=slow_get):
+            start = time.monotonic()
+            medals = run(self.search.combine_searches([{'tier': 3}, {'tier': 1}, {'tier': 2}]))
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(medals, [{'id': 3}, {'id': 1}, {'id': 2}])
+
+    def test_combine_searches_doesnt_repeat_medals_and_respects_the_limit(self):
+        search_results = {1: [{'id': 1}, {'id': 2}], 2: [{'id': 2}, {'id': 3}], 3: [{'id': 4}]}
+
+        async def medals(filters):
+            return search_results[filters['tier']]
+
+        with patch.object(self.search, 'medals', side_effect=medals):
+            found_medals = run(self.search.combine_searches([{'tier': 1}, {'tier': 2}, {'tier': 3}], limit=3))
+
+        self.assertEqual(found_medals, [{'id': 1}, {'id': 2}, {'id': 3}])
+
+
+class TestAsyncRedditService(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestAsyncRedditService, self).setUp()
+
+        with patch.dict(sys.modules, {'asyncpraw': mock.Mock()}):
+            self.reddit_service = AsyncRedditService(executor=InlineExecutor())
+
+    def test_reply_sends_the_reply_and_saves_it(self):
+        comment = mock_comment('a1', 'u/khux_medal_finder power')
+
+        async def reply(body):
+            return mock.Mock(id='r1', created=2, permalink='/r/KHUX/comments/r1/')
+        comment.reply = reply
+
+        run(self.reddit_service.reply(comment, []))
+
+        self.assertEqual(Reply.get().text, AsyncRedditService.REPLY_NO_MEDALS)
+        self.assertEqual(Reply.get().original_comment, Comment.get(Comment.comment_id == 'a1'))
+
+
+@unittest.skipIf(importlib.util.find_spec('asyncpraw') is None, 'asyncpraw is not installed')
+class TestAsyncRedditServiceWithAsyncpraw(unittest.TestCase):
+
+    def test_uses_the_asyncpraw_api(self):
+        import asyncpraw
+
+        with patch.dict(os.environ, ENV_MOCK):
+            reddit_service = AsyncRedditService(executor=InlineExecutor())
+
+        async def subreddit():
+            try:
+                return await reddit_service.subreddit('KHUX')
+            finally:
+                await reddit_service.close()
+
+        self.assertIsInstance(reddit_service.reddit, asyncpraw.Reddit)
+        self.assertEqual(run(subreddit()).display_name, 'KHUX')
+
+
+class TestAsyncMedalFinderBot(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestAsyncMedalFinderBot, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.replies = []
+        self.reply_delays = {}
+
+        async def reply(comment, medals):
+            await asyncio.sleep(self.reply_delays.get(comment.id, 0))
+            self.replies.append((comment.id, medals))
+
+        self.reddit_service = mock.Mock(reply=reply)
+        self.search = mock.Mock()
+        self.search.combine_searches.return_value = ['medal']
+        self.bot = AsyncMedalFinderBot(self.reddit_service, self.search, 'KHUX', 'khux_medal_finder',
+                                       checkpoint_path=os.path.join(self.directory.name, 'checkpoint.txt'),
+                                       executor=InlineExecutor())
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super(TestAsyncMedalFinderBot, self).tearDown()
+
+    def test_replies_to_comments_mentioning_the_bot(self):
+        run(self.bot.process(async_iterator([mock_comment('a1', 'u/khux_medal_finder power aoe'),
+                                             mock_comment('a2', 'power aoe')])))
+
+        self.search.combine_searches.assert_called_once_with([{'element': 'Power', 'targets': 'All'}], limit=10)
+        self.assertEqual(self.replies, [('a1', ['medal'])])
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a2')
+
+    def test_comments_are_looked_up_a_page_at_a_time(self):
+        comments = [mock_comment(f'a{number}', 'power aoe') for number in range(3)]
+
+        with patch.object(Comment, 'processed_ids', wraps=Comment.processed_ids) as processed_ids:
+            run(self.bot.process(async_iterator(comments + [None, mock_comment('a3', 'power aoe')])))
+
+        self.assertEqual(processed_ids.call_count, 2)
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a3')
+
+    def test_awaits_async_searches(self):
+        async def combine_searches(filters, limit=None):
+            return ['async medal']
+        self.bot.search = mock.Mock(combine_searches=combine_searches)
+
+        run(self.bot.process(async_iterator([mock_comment('a1', 'u/khux_medal_finder power')])))
+
+        self.assertEqual(self.replies, [('a1', ['async medal'])])
+
+    def test_asks_async_searches_for_medal_records(self):
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            session = mock.Mock(get=mock.Mock(return_value=FakeResponse(json.loads(fixture.read()))))
+        self.bot.search = AsyncSearch(Search(), executor=InlineExecutor(), session=session)
+
+        reply_bodies = []
+        async def reply(comment, medals):
+            reply_bodies.append(RedditService.reply_body(RedditService.__new__(RedditService), medals))
+        self.reddit_service.reply = reply
+
+        run(self.bot.process(async_iterator([mock_comment('a1', 'u/khux_medal_finder power aoe')])))
+
+        reply_body, success = reply_bodies[0]
+        self.assertTrue(success)
+        self.assertIn('Kings Roar', reply_body)
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a1')
+
+    def test_comments_that_cant_be_answered_are_skipped(self):
+        self.search.combine_searches.side_effect = [ValueError('khuxbot is down'), ['medal']]
+        comments = [mock_comment('a1', 'u/khux_medal_finder power'), mock_comment('a2', 'u/khux_medal_finder speed')]
+
+        run(self.bot.process(async_iterator(comments)))
+
+        self.assertEqual(self.replies, [('a2', ['medal'])])
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a2')
+        self.assertEqual(self.bot.answering, {})
+
+    def test_answers_comments_concurrently(self):
+        self.reply_delays = {'a1': 0.2, 'a2': 0.2, 'a3': 0.2}
+        comments = [mock_comment(comment_id, 'u/khux_medal_finder power') for comment_id in ('a1', 'a2', 'a3')]
+
+        start = time.monotonic()
+        run(self.bot.process(async_iterator(comments)))
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(self.replies), 3)
+
+    def test_checkpoint_doesnt_skip_comments_still_being_answered(self):
+        self.reply_delays = {'a1': 0.2}
+        comments = [mock_comment('a1', 'u/khux_medal_finder power'), mock_comment('a2', 'u/khux_medal_finder speed')]
+        checkpoints = []
+        original_save = self.bot.checkpoint.save
+        self.bot.checkpoint.save = lambda comment_id: (checkpoints.append(comment_id), original_save(comment_id))
+
+        run(self.bot.process(async_iterator(comments)))
+
+        self.assertEqual([comment_id for comment_id, _ in self.replies], ['a2', 'a1'])
+        self.assertEqual(checkpoints, ['a2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
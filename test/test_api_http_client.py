@@ -0,0 +1,86 @@
+import unittest
+import requests_mock
+from unittest.mock import Mock
+
+from khux_medal_finder.api import HttpClient, Scrapper, Search, default_http_client
+
+
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.http_client = HttpClient(pool_size=4, timeout=(1, 5))
+
+    @requests_mock.Mocker()
+    def test_get_sends_keep_alive_and_gzip_headers(self, mock_requests):
+        mock_requests.get('https://www.khuxbot.com/api/v1/medal', json={})
+
+        self.http_client.get('https://www.khuxbot.com/api/v1/medal')
+
+        headers = mock_requests.request_history[0].headers
+        self.assertEqual(headers['Connection'], 'keep-alive')
+        self.assertIn('gzip', headers['Accept-Encoding'])
+
+    @requests_mock.Mocker()
+    def test_get_uses_the_configured_timeout(self, mock_requests):
+        mock_requests.get('https://www.khuxbot.com/api/v1/medal', json={})
+
+        self.http_client.get('https://www.khuxbot.com/api/v1/medal')
+
+        self.assertEqual(mock_requests.request_history[0].timeout, (1, 5))
+
+    @requests_mock.Mocker()
+    def test_get_encodes_params(self, mock_requests):
+        mock_requests.get('https://www.khuxbot.com/api/v1/medal?q=names', json={})
+
+        self.http_client.get('https://www.khuxbot.com/api/v1/medal', params={'q': 'names'})
+
+        self.assertEqual(mock_requests.request_history[0].url, 'https://www.khuxbot.com/api/v1/medal?q=names')
+
+    @requests_mock.Mocker()
+    def test_get_doesnt_reencode_the_encoded_query(self, mock_requests):
+        mock_requests.get('https://www.khuxbot.com/api/v1/medal', json={})
+
+        self.http_client.get('https://www.khuxbot.com/api/v1/medal', encoded_query='q=data&medal=key%20art%20%233')
+
+        self.assertEqual(mock_requests.request_history[0].url,
+                         'https://www.khuxbot.com/api/v1/medal?q=data&medal=key%20art%20%233')
+
+    def test_adapter_pool_has_the_configured_size(self):
+        self.assertEqual(self.http_client.adapter._pool_maxsize, 4)
+        self.assertIs(self.http_client.session.get_adapter('https://www.khuxbot.com'), self.http_client.adapter)
+
+    @requests_mock.Mocker()
+    def test_stats_count_requests(self, mock_requests):
+        mock_requests.get('https://www.khuxbot.com/api/v1/medal', json={})
+
+        self.http_client.get('https://www.khuxbot.com/api/v1/medal')
+        self.http_client.get('https://www.khuxbot.com/api/v1/medal')
+
+        self.assertEqual(self.http_client.stats()['requests'], 2)
+
+    def test_stats_count_reused_connections(self):
+        pool = Mock(num_connections=1)
+        self.http_client.adapter.poolmanager.pools['khuxbot'] = pool
+        self.http_client.requests = 5
+
+        stats = self.http_client.stats()
+
+        self.assertEqual(stats['new_connections'], 1)
+        self.assertEqual(stats['reused_connections'], 4)
+
+
+class TestDefaultHttpClient(unittest.TestCase):
+
+    def test_default_http_client_is_shared(self):
+        self.assertIs(default_http_client(), default_http_client())
+        self.assertIs(Search().http_client, Scrapper().http_client)
+
+    def test_http_client_can_be_overridden(self):
+        http_client = HttpClient()
+
+        self.assertIs(Search(http_client=http_client).http_client, http_client)
+        self.assertIs(Scrapper(http_client=http_client).http_client, http_client)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,14 @@
 import unittest
 import json
+import time
+import requests
 import requests_mock
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from khux_medal_finder.api import Scrapper
-from khux_medal_finder.models import Medal
-from khux_medal_finder.factories import MedalFactory
+from khux_medal_finder.api import RateLimiter, Scrapper
+from khux_medal_finder.archive import MedalArchive
+from khux_medal_finder.models import Medal, SyncState
+from khux_medal_finder.factories import BulkInsertResult, MedalFactory
 
 from test.helpers import BaseDBTestCase
 
@@ -107,32 +110,40 @@ class TestScrapper(BaseDBTestCase):
         with self.requests_mock:
             self.assertCountEqual(self.scrapper.get_medal_names(), expected_names)
 
-    @patch.object(Medal, 'select', create=True)
-    def test_missing_medals_when_there_are_missing_medals(self, mock_select):
+    def create_medals_named(self, names):
+        Medal.insert_many([{'medal_id': medal_id, 'name': name, 'cost': 0, 'direction': 'Upright', 'element': 'Power',
+                            'hits': 1, 'multiplier_min': 1, 'multiplier_max': 1, 'targets': 'Single', 'tier': 1,
+                            'type': 'Combat'}
+                           for medal_id, name in enumerate(names)]).execute()
+
+    def test_missing_medals_when_there_are_missing_medals(self):
         all_medals_file = 'test/fixtures/scrapper/medal_names.txt'
         with open(all_medals_file) as content:
-            medals = [Medal(name=name.strip()) for name in content.readlines()]
-            mock_select.return_value = medals[:-3]
+            self.create_medals_named([name.strip().title() for name in content.readlines()][:-3])
 
         expected_missing_medals = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy']
         with self.requests_mock:
             missing_medals = self.scrapper.missing_medals()
 
         self.assertCountEqual(expected_missing_medals, missing_medals)
-        mock_select.assert_called_once()
 
-    @patch.object(Medal, 'select', create=True)
-    def test_missing_medals_when_there_arent_missing_medals(self, mock_select):
+    def test_missing_medals_when_there_arent_missing_medals(self):
         all_medals_file = 'test/fixtures/scrapper/medal_names.txt'
         with open(all_medals_file) as content:
-            medals = [Medal(name=name.strip()) for name in content.readlines()]
-            mock_select.return_value = medals
+            self.create_medals_named([name.strip().title() for name in content.readlines()])
 
         with self.requests_mock:
             missing_medals = self.scrapper.missing_medals()
 
         self.assertCountEqual(missing_medals, [])
-        mock_select.assert_called_once()
+
+    def test_missing_medals_only_selects_the_lowercased_names(self):
+        with patch.object(Medal, 'select', wraps=Medal.select) as mocked_select:
+            with self.requests_mock:
+                self.scrapper.missing_medals()
+
+        self.assertEqual(mocked_select.call_count, 1)
+        self.assertEqual(mocked_select.call_args[0][0].name.upper(), 'LOWER')
 
     @patch.object(Scrapper, 'get_medal_names')
     def test_missing_medals_stop_being_missing_when_we_create_them(self, mock_get_medal_names):
@@ -147,41 +158,301 @@ class TestScrapper(BaseDBTestCase):
 
         self.assertEqual(len(self.scrapper.missing_medals()), number_of_missing_medals - 1)
 
-    @patch.object(Medal, 'get_or_none', return_value=None)
     @patch.object(Scrapper, 'missing_medals')
-    def test_scrape_missing_medals_when_medals_are_not_in_DB(self, mock_missing_medals, mock_get_or_none):
+    def test_scrape_missing_medals_when_medals_are_not_in_DB(self, mock_missing_medals):
         missing_medals = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy']
         mock_missing_medals.return_value = missing_medals
 
-        with patch.object(MedalFactory, 'medal') as mocked_medalfactory:
-            with self.requests_mock:
-                self.scrapper.scrape_missing_medals()
+        with self.requests_mock:
+            self.scrapper.scrape_missing_medals()
 
-            # Despite there are only 3 medals in missing_medals, the method is
-            # called 4 times because Axel B has two versions: 5 and 6 stars.
-            self.assertEqual(mocked_medalfactory.call_count, 4)
+        # Despite there are only 3 medals in missing_medals, 4 medals are
+        # created because Axel B has two versions: 5 and 6 stars.
+        self.assertEqual(Medal.select().count(), 4)
 
-    @patch.object(Medal, 'get_or_none', return_value=True)
     @patch.object(Scrapper, 'missing_medals')
-    def test_scrape_missing_medals_when_medals_are_in_DB(self, mock_missing_medals, mock_get_or_none):
+    def test_scrape_missing_medals_when_medals_are_in_DB(self, mock_missing_medals):
         mock_missing_medals.return_value = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy']
 
-        with patch.object(MedalFactory, 'medal') as mocked_medalfactory:
-            with self.requests_mock:
-                self.scrapper.scrape_missing_medals()
+        with self.requests_mock:
+            self.scrapper.scrape_missing_medals()
+            result = self.scrapper.save_medals(self.scrapper.get_medals('axel b'))
 
-            mocked_medalfactory.assert_not_called()
+        self.assertEqual(Medal.select().count(), 4)
+        self.assertEqual(result.created, 0)
+        self.assertEqual(result.skipped, 2)
 
     @patch.object(Scrapper, 'missing_medals')
     def test_scrape_missing_medals_doesnt_stop_if_a_medal_cant_be_created(self, mock_missing_medals):
         mock_missing_medals.return_value = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy']
 
-        with patch.object(MedalFactory, 'medal') as mocked_medalfactory:
-            mocked_medalfactory.return_value = None
+        with patch.object(MedalFactory, 'build') as mocked_build:
+            mocked_build.return_value = None
 
             with self.requests_mock:
                 self.scrapper.scrape_missing_medals()
 
             # Despite there are only 3 medals in missing_medals, the method is
             # called 4 times because Axel B has two versions: 5 and 6 stars.
-            self.assertEqual(mocked_medalfactory.call_count, 4)
+            self.assertEqual(mocked_build.call_count, 4)
+
+        self.assertEqual(Medal.select().count(), 0)
+
+    @patch.object(Scrapper, 'missing_medals')
+    def test_scrape_missing_medals_with_several_workers(self, mock_missing_medals):
+        mock_missing_medals.return_value = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy', 'Illustrated Pence HD']
+
+        with self.requests_mock:
+            self.scrapper.scrape_missing_medals(workers=3)
+
+        self.assertEqual(Medal.select().count(), 4)
+
+    def test_scrape_medals_saves_medals_in_batches(self):
+        medal_names = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy']
+
+        with patch.object(Scrapper, 'save_medals', return_value=BulkInsertResult(0, 0, 0)) as mocked_save_medals:
+            with self.requests_mock:
+                self.scrapper.scrape_medals(medal_names, workers=2, batch_size=2)
+
+            saved_medals = [medal for call in mocked_save_medals.call_args_list for medal in call[0][0]]
+            self.assertEqual(mocked_save_medals.call_count, 2)
+            self.assertCountEqual([medal['id'] for medal in saved_medals], [1014, 986, 987, 1051])
+
+    def test_download_medals_yields_every_name(self):
+        medal_names = ['hd invi [ex]', 'axel b', 'illustrated halloween goofy', 'Illustrated Pence HD']
+
+        with self.requests_mock:
+            downloaded = dict(self.scrapper.download_medals(medal_names, workers=2))
+
+        self.assertCountEqual(downloaded.keys(), medal_names)
+        self.assertEqual(len(downloaded['axel b']), 2)
+        self.assertEqual(downloaded['Illustrated Pence HD'], [])
+
+    def test_fetch_medals_retries_if_the_request_fails(self):
+        scrapper = Scrapper(retries=2, backoff=0)
+        endpoint = 'https://www.khuxbot.com/api/v1/medal?q=data&medal=axel%20b'
+
+        with requests_mock.Mocker() as mock:
+            with open('test/fixtures/scrapper/medals_data.json') as fixture:
+                response = json.loads(fixture.read())
+            mock.get(endpoint, [{'exc': requests.exceptions.ConnectTimeout}, {'text': '<html>'}, {'json': response}])
+
+            medals = scrapper.fetch_medals('axel b')
+
+        self.assertEqual(len(medals), 2)
+        self.assertEqual(mock.call_count, 3)
+
+    def test_fetch_medals_raises_exception_if_retries_are_exhausted(self):
+        scrapper = Scrapper(retries=1, backoff=0)
+        endpoint = 'https://www.khuxbot.com/api/v1/medal?q=data&medal=axel%20b'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(endpoint, exc=requests.exceptions.ConnectionError)
+
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                scrapper.fetch_medals('axel b')
+
+        self.assertEqual(mock.call_count, 2)
+
+    def test_download_medals_doesnt_stop_if_a_medal_cant_be_downloaded(self):
+        scrapper = Scrapper(retries=0)
+        endpoint = 'https://www.khuxbot.com/api/v1/medal?q=data&medal=axel%20b'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(endpoint, exc=requests.exceptions.ConnectionError)
+
+            self.assertEqual(list(scrapper.download_medals(['axel b'])), [('axel b', [])])
+
+
+    @patch.object(Scrapper, 'missing_medals')
+    def test_scrape_missing_medals_runs_post_scrape_hooks_if_medals_are_created(self, mock_missing_medals):
+        mock_missing_medals.return_value = ['axel b']
+        hook = Mock()
+        self.scrapper.post_scrape_hooks.append(hook)
+
+        with self.requests_mock:
+            result = self.scrapper.scrape_missing_medals()
+            self.scrapper.scrape_missing_medals()
+
+        self.assertEqual(result.created, 2)
+        hook.assert_called_once_with()
+
+class TestScrapperSync(BaseDBTestCase):
+    NAMES_ENDPOINT = 'https://www.khuxbot.com/api/v1/medal?q=names'
+    AXEL_ENDPOINT = 'https://www.khuxbot.com/api/v1/medal?q=data&medal=axel%20b'
+    GOOFY_ENDPOINT = 'https://www.khuxbot.com/api/v1/medal?q=data&medal=illustrated%20halloween%20goofy'
+
+    def setUp(self):
+        super(TestScrapperSync, self).setUp()
+        self.scrapper = Scrapper()
+
+        with open('test/fixtures/scrapper/medals_data.json') as fixture:
+            self.axel_response = json.loads(fixture.read())
+
+        with open('test/fixtures/scrapper/medal_data.json') as fixture:
+            self.goofy_response = json.loads(fixture.read())
+
+    def mock_endpoints(self, mock, names_response=None):
+        mock.get(self.NAMES_ENDPOINT, **(names_response or {'json': {'names': ['axel b', 'illustrated halloween goofy']}}))
+        mock.get(self.AXEL_ENDPOINT, json=self.axel_response)
+        mock.get(self.GOOFY_ENDPOINT, json=self.goofy_response)
+
+    def test_first_sync_downloads_every_medal(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock)
+            result = self.scrapper.sync_medals()
+
+        self.assertEqual(result.created, 3)
+        self.assertEqual(Medal.select().count(), 3)
+        self.assertCountEqual([state.resource for state in SyncState.select()
+                               .where(SyncState.resource != SyncState.CATALOGUE)],
+                              ['names', 'medal:axel b', 'medal:illustrated halloween goofy'])
+
+    def test_sync_only_requests_names_list_if_nothing_has_to_be_rechecked(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock)
+            self.scrapper.sync_medals()
+
+            mock.reset_mock()
+            result = self.scrapper.sync_medals(recheck_limit=0)
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(result, (0, 0, 0))
+
+    def test_sync_only_downloads_new_names(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock, {'json': {'names': ['axel b']}})
+            self.scrapper.sync_medals()
+
+            self.mock_endpoints(mock)
+            mock.reset_mock()
+            result = self.scrapper.sync_medals(recheck_limit=0)
+
+        self.assertEqual([request.url for request in mock.request_history], [self.NAMES_ENDPOINT, self.GOOFY_ENDPOINT])
+        self.assertEqual(result.created, 1)
+
+    def test_sync_sends_validators_and_respects_not_modified(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock, {'json': {'names': ['axel b']}, 'headers': {'ETag': '"v1"'}})
+            self.scrapper.sync_medals()
+
+            self.mock_endpoints(mock, {'status_code': 304})
+            mock.reset_mock()
+            self.scrapper.sync_medals(recheck_limit=0)
+
+        self.assertEqual(mock.request_history[0].headers['If-None-Match'], '"v1"')
+        self.assertEqual(mock.call_count, 1)
+
+    def test_sync_updates_changed_medals(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock)
+            self.scrapper.sync_medals()
+
+            self.axel_response['medal']['1']['multiplier'] = 'x1.90-3.50'
+            self.mock_endpoints(mock)
+            result = self.scrapper.sync_medals()
+
+        self.assertEqual(result, (0, 2, 0))
+        self.assertEqual(Medal.get(Medal.medal_id == 987).multiplier_max, 3.5)
+
+    def test_sync_doesnt_update_medals_that_havent_changed(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock)
+            self.scrapper.sync_medals()
+
+            with patch.object(MedalFactory, 'upsert_medals') as mocked_upsert_medals:
+                self.scrapper.sync_medals()
+
+        mocked_upsert_medals.assert_not_called()
+
+    def test_sync_processes_names_again_if_a_medal_cant_be_downloaded(self):
+        with requests_mock.Mocker() as mock:
+            self.mock_endpoints(mock)
+            mock.get(self.GOOFY_ENDPOINT, exc=requests.exceptions.ConnectionError)
+            self.scrapper.sync_medals()
+
+            self.mock_endpoints(mock)
+            result = self.scrapper.sync_medals(recheck_limit=0)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Medal.select().count(), 3)
+
+
+class TestScrapperArchive(BaseDBTestCase):
+    AXEL_ENDPOINT = 'https://www.khuxbot.com/api/v1/medal?q=data&medal=axel%20b'
+
+    def setUp(self):
+        super(TestScrapperArchive, self).setUp()
+        self.archive = MedalArchive(':memory:')
+        self.scrapper = Scrapper(archive=self.archive)
+
+        with open('test/fixtures/scrapper/medals_data.json') as fixture:
+            self.axel_response = json.loads(fixture.read())
+
+    def tearDown(self):
+        self.archive.close()
+        super(TestScrapperArchive, self).tearDown()
+
+    def test_downloaded_responses_are_archived(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.AXEL_ENDPOINT, json=self.axel_response)
+            self.scrapper.get_medals('axel b')
+
+        self.assertEqual(list(self.archive.latest()), [('axel b', self.axel_response)])
+
+    def test_replay_archive_creates_medals_without_requests(self):
+        self.archive.add('axel b', json.dumps(self.axel_response).encode('utf-8'))
+
+        with requests_mock.Mocker() as mock:
+            result = self.scrapper.replay_archive()
+
+        self.assertEqual(mock.call_count, 0)
+        self.assertEqual(result, (2, 0, 0))
+        self.assertEqual(Medal.select().count(), 2)
+
+    def test_replay_archive_updates_existing_medals_with_the_newest_response(self):
+        self.archive.add('axel b', json.dumps(self.axel_response).encode('utf-8'))
+        self.scrapper.replay_archive()
+
+        medal_json = self.axel_response['medal']['0']
+        medal_json['multiplier'] = 'x9.99'
+        self.archive.add('axel b', json.dumps(self.axel_response).encode('utf-8'))
+        result = self.scrapper.replay_archive()
+
+        self.assertEqual(result.updated, 2)
+        self.assertEqual(Medal.get(Medal.medal_id == medal_json['id']).multiplier_max, 9.99)
+
+    def test_replay_archive_needs_an_archive(self):
+        with self.assertRaises(ValueError):
+            Scrapper().replay_archive()
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_doesnt_wait_if_there_is_no_limit(self):
+        rate_limiter = RateLimiter()
+
+        start = time.monotonic()
+        for _ in range(100):
+            rate_limiter.wait('https://www.khuxbot.com/api/v1/medal')
+
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_spaces_requests_to_the_same_host(self):
+        rate_limiter = RateLimiter(requests_per_second=50)
+
+        start = time.monotonic()
+        for _ in range(6):
+            rate_limiter.wait('https://www.khuxbot.com/api/v1/medal')
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_hosts_are_limited_independently(self):
+        rate_limiter = RateLimiter(requests_per_second=1)
+
+        start = time.monotonic()
+        rate_limiter.wait('https://www.khuxbot.com/api/v1/medal')
+        rate_limiter.wait('https://www.reddit.com/r/KHUX')
+
+        self.assertLess(time.monotonic() - start, 0.5)
+
@@ -1,8 +1,16 @@
+import peewee
 import unittest
 import requests_mock
 import json
+import time
+from unittest.mock import patch
 
 from khux_medal_finder.api import Search
+from khux_medal_finder.cache import ResponseCache
+from khux_medal_finder.factories import MedalFactory
+from khux_medal_finder.models import MedalRecord, SyncState
+
+from test.helpers import BaseDBTestCase
 
 
 class TestSearch(unittest.TestCase):
@@ -58,6 +66,158 @@ class TestSearch(unittest.TestCase):
 
         self.assertListEqual(expected_medals, self.search.combine_searches(filters))
 
+    @requests_mock.Mocker()
+    def test_combine_searches_doesnt_repeat_medals(self, mock_requests):
+        api_url_t6 = 'http://www.khuxbot.com/api/v1/medal?q=data&filter=%7B%22rarity%22:%206,%22direction%22:%22Upright%22,%22element%22:%22Power%22,%22cost%22:%224%22,%22tier%22:%226%22%7D'
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            api_response = json.loads(fixture.read())
+        mock_requests.get(api_url_t6, json=api_response)
+
+        filters_t6 = {"direction": "Upright", "element": "Power", "cost": 4, "tier": 6}
+        medals = self.search.combine_searches([filters_t6, filters_t6])
+
+        self.assertEqual([medal['id'] for medal in medals], [943, 982])
+
+    @requests_mock.Mocker()
+    def test_combine_searches_returning_records(self, mock_requests):
+        api_url_t6 = 'http://www.khuxbot.com/api/v1/medal?q=data&filter=%7B%22rarity%22:%206,%22direction%22:%22Upright%22,%22element%22:%22Power%22,%22cost%22:%224%22,%22tier%22:%226%22%7D'
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            api_response = json.loads(fixture.read())
+        mock_requests.get(api_url_t6, json=api_response)
+
+        filters_t6 = {"direction": "Upright", "element": "Power", "cost": 4, "tier": 6}
+        medals = self.search.combine_searches([filters_t6, filters_t6], records=True)
+
+        self.assertTrue(all(isinstance(medal, MedalRecord) for medal in medals))
+        self.assertEqual([(medal.medal_id, medal.multiplier_min, medal.multiplier_max) for medal in medals],
+                         [(943, 2.10, 3.28), (982, 1.99, 3.35)])
+
+    def test_combine_searches_stops_when_the_limit_is_reached(self):
+        search_results = {1: [{'id': 1}, {'id': 2}], 2: [{'id': 3}], 3: [{'id': 4}]}
+
+        with patch.object(Search, 'medals', side_effect=lambda filters: search_results[filters['tier']]):
+            medals = self.search.combine_searches([{'tier': 1}, {'tier': 2}, {'tier': 3}], limit=3)
+
+        self.assertEqual(medals, [{'id': 1}, {'id': 2}, {'id': 3}])
+
+    def test_combine_searches_runs_searches_concurrently(self):
+        def slow_search(filters):
+            time.sleep(0.2)
+            return [{'id': filters['tier']}]
+
+        start = time.monotonic()
+        with patch.object(Search, 'medals', side_effect=slow_search):
+            medals = self.search.combine_searches([{'tier': 1}, {'tier': 2}, {'tier': 3}], workers=3)
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(medals, [{'id': 1}, {'id': 2}, {'id': 3}])
+
+    def test_combine_searches_without_filters(self):
+        self.assertEqual(self.search.combine_searches([]), [])
+
+    def test_cache_key_doesnt_depend_on_filters_order_or_types(self):
+        filters_1 = {"direction": "Upright", "element": "Power", "tier": 6}
+        filters_2 = {"tier": "6", "element": "Power", "direction": "Upright"}
+
+        self.assertEqual(self.search.cache_key(filters_1), self.search.cache_key(filters_2))
+
+    @requests_mock.Mocker()
+    def test_medals_are_cached(self, mock_requests):
+        api_url = 'http://www.khuxbot.com/api/v1/medal?q=data&filter=%7B%22rarity%22:%206,%22direction%22:%22Upright%22,%22element%22:%22Power%22,%22cost%22:%224%22,%22tier%22:%226%22%7D'
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            api_response = json.loads(fixture.read())
+        mock_requests.get(api_url, json=api_response)
+
+        filters = {"direction": "Upright", "element": "Power", "cost": 4, "tier": 6}
+        first_medals = self.search.medals(filters)
+        second_medals = self.search.medals(filters)
+
+        self.assertEqual(first_medals, second_medals)
+        self.assertEqual(mock_requests.call_count, 1)
+        self.assertEqual(self.search.cache.stats['hits'], 1)
+
+    @requests_mock.Mocker()
+    def test_cleared_cache_searches_again(self, mock_requests):
+        api_url = 'http://www.khuxbot.com/api/v1/medal?q=data&filter=%7B%22rarity%22:%206,%22direction%22:%22Upright%22,%22element%22:%22Power%22,%22cost%22:%224%22,%22tier%22:%226%22%7D'
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            api_response = json.loads(fixture.read())
+        mock_requests.get(api_url, json=api_response)
+
+        search = Search(cache=ResponseCache(max_size=1))
+        filters = {"direction": "Upright", "element": "Power", "cost": 4, "tier": 6}
+        search.medals(filters)
+        search.cache.clear()
+        search.medals(filters)
+
+        self.assertEqual(mock_requests.call_count, 2)
+
+
+class TestSearchCacheInvalidation(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestSearchCacheInvalidation, self).setUp()
+
+        with open('test/fixtures/models/combat_medal_data.json') as fixture:
+            self.medal_json = json.loads(fixture.read())
+
+        self.search = Search(check_interval=0)
+        self.filters = {"direction": "Upright", "element": "Power", "cost": 4, "tier": 6}
+        self.api_url = 'http://www.khuxbot.com/api/v1/medal?q=data&filter=%7B%22rarity%22:%206,%22direction%22:%22Upright%22,%22element%22:%22Power%22,%22cost%22:%224%22,%22tier%22:%226%22%7D'
+
+    @requests_mock.Mocker()
+    def test_cache_is_kept_while_the_medals_dont_change(self, mock_requests):
+        mock_requests.get(self.api_url, json={'medal': {}})
+
+        self.search.medals(self.filters)
+        self.search.medals(self.filters)
+
+        self.assertEqual(mock_requests.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_cache_is_cleared_when_medals_are_saved(self, mock_requests):
+        mock_requests.get(self.api_url, json={'medal': {}})
+
+        self.search.medals(self.filters)
+        MedalFactory.medals([self.medal_json])
+        self.search.medals(self.filters)
+
+        self.assertEqual(mock_requests.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_version_isnt_checked_before_the_check_interval(self, mock_requests):
+        mock_requests.get(self.api_url, json={'medal': {}})
+        self.search.check_interval = 60
+
+        self.search.medals(self.filters)
+        MedalFactory.medals([self.medal_json])
+        self.search.medals(self.filters)
+
+        self.assertEqual(mock_requests.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_version_is_checked_by_default(self, mock_requests):
+        mock_requests.get(self.api_url, json={'medal': {}})
+        MedalFactory.medals([self.medal_json])
+
+        search = Search()
+        search.medals(self.filters)
+
+        self.assertEqual(search.check_interval, Search.CHECK_INTERVAL)
+        self.assertEqual(search.cache.version, SyncState.catalogue_version())
+
+    def test_version_isnt_checked_without_a_db(self):
+        search = Search()
+
+        with patch('khux_medal_finder.api.is_initialized', return_value=False), \
+                patch.object(SyncState, 'catalogue_version') as catalogue_version:
+            self.assertFalse(search.validate_cache())
+
+        catalogue_version.assert_not_called()
+
+    def test_searches_still_work_if_the_version_cant_be_checked(self):
+        with patch.object(SyncState, 'catalogue_version', side_effect=peewee.OperationalError('no such table')):
+            self.assertFalse(self.search.validate_cache())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import json
+import os
+import tempfile
+
+from khux_medal_finder.archive import MedalArchive
+
+
+class TestMedalArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.archive = MedalArchive(':memory:')
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_responses_are_returned_from_oldest_to_newest(self):
+        self.archive.add('axel b', b'{"medal": {"0": {"id": 2}}}', fetched_at=2)
+        self.archive.add('axel b', b'{"medal": {"0": {"id": 1}}}', fetched_at=1)
+
+        self.assertEqual(self.archive.responses('axel b'),
+                         [(1, {'medal': {'0': {'id': 1}}}), (2, {'medal': {'0': {'id': 2}}})])
+
+    def test_latest_returns_the_newest_response_of_each_name(self):
+        self.archive.add('axel b', b'{"version": 1}')
+        self.archive.add('wakka', b'{"version": 1}')
+        self.archive.add('axel b', b'{"version": 2}')
+
+        self.assertEqual(list(self.archive.latest()), [('axel b', {'version': 2}), ('wakka', {'version': 1})])
+
+    def test_len_counts_every_response(self):
+        self.archive.add('axel b', b'{}')
+        self.archive.add('axel b', b'{}')
+
+        self.assertEqual(len(self.archive), 2)
+
+    def test_responses_are_stored_compressed(self):
+        content = json.dumps({'notes': 'Deals more damage ' * 100}).encode('utf-8')
+        self.archive.add('axel b', content)
+
+        stored_size = self.archive.connection.execute('SELECT LENGTH(content) FROM response').fetchone()[0]
+        self.assertLess(stored_size, len(content))
+
+    def test_responses_survive_reopening_the_archive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.sqlite3')
+            archive = MedalArchive(path)
+            archive.add('axel b', b'{"version": 1}')
+            archive.close()
+
+            archive = MedalArchive(path)
+            self.assertEqual(list(archive.latest()), [('axel b', {'version': 1})])
+            archive.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+import requests_mock
+from peewee import SqliteDatabase
+
+from khux_medal_finder.backfill import Backfill, ShardProgress, backfill_shard, progress_path, shard_names
+from khux_medal_finder.factories import UpsertResult
+from khux_medal_finder.models import Medal, close_connections, db
+
+from test.helpers import MODELS, BaseDBTestCase
+
+
+def mock_khuxbot(mocker):
+    for medal_query, fixture_file in [('axel%20b', 'test/fixtures/scrapper/medals_data.json'),
+                                      ('illustrated%20halloween%20goofy', 'test/fixtures/scrapper/medal_data.json')]:
+        with open(fixture_file) as fixture:
+            mocker.get(f'https://www.khuxbot.com/api/v1/medal?q=data&medal={medal_query}',
+                       json=json.loads(fixture.read()))
+
+    mocker.get('https://www.khuxbot.com/api/v1/medal?q=data&medal=broken', text='<html></html>')
+    return mocker
+
+
+def init_test_process(database_path):
+    """Initializer of the backfill processes of the tests. They use a SQLite file,
+    taking its write lock when the transactions begin so they wait for each
+    other, and khuxbot is mocked again, as the mock of the test isn't inherited
+    by every kind of process"""
+    db.initialize(SqliteDatabase(database_path, lock_type='IMMEDIATE', timeout=30))
+    mock_khuxbot(requests_mock.Mocker()).start()
+
+
+class TestShardNames(unittest.TestCase):
+
+    def test_every_name_is_in_one_shard(self):
+        names = [f'medal {number}' for number in range(100)]
+        sharded_names = shard_names(names, 4)
+
+        self.assertEqual(len(sharded_names), 4)
+        self.assertEqual(sorted(name for names in sharded_names for name in names), sorted(names))
+
+    def test_shards_dont_depend_on_the_other_names(self):
+        sharded_names = shard_names(['axel b', 'illustrated halloween goofy', 'key art #3'], 3)
+        shard = next(shard for shard, names in enumerate(sharded_names) if 'axel b' in names)
+
+        self.assertIn('axel b', shard_names(['axel b'], 3)[shard])
+
+
+class TestShardProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'shard_0.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_saved_names_are_loaded_again(self):
+        ShardProgress(self.path).save(['axel b', 'key art #3'])
+        ShardProgress(self.path).save(['illustrated halloween goofy'])
+
+        self.assertEqual(ShardProgress(self.path).done, {'axel b', 'key art #3', 'illustrated halloween goofy'})
+
+    def test_clear(self):
+        progress = ShardProgress(self.path)
+        progress.save(['axel b'])
+        progress.clear()
+
+        self.assertEqual(progress.done, set())
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestBackfill(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestBackfill, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.requests_mock = mock_khuxbot(requests_mock.Mocker())
+        self.requests_mock.start()
+
+    def tearDown(self):
+        self.requests_mock.stop()
+        self.directory.cleanup()
+
+        super(TestBackfill, self).tearDown()
+
+    def requested_medals(self):
+        return [request.qs['medal'][0] for request in self.requests_mock.request_history]
+
+    def test_backfill_shard_saves_the_medals_and_the_progress(self):
+        result, failed_names = backfill_shard(0, ['axel b', 'illustrated halloween goofy'], self.directory.name,
+                                              batch_size=1)
+
+        self.assertEqual(result, UpsertResult(created=3, updated=0, invalid=0))
+        self.assertEqual(failed_names, [])
+        self.assertEqual(Medal.select().count(), 3)
+        self.assertEqual(ShardProgress(progress_path(self.directory.name, 0)).done,
+                         {'axel b', 'illustrated halloween goofy'})
+
+    def test_backfill_shard_resumes_from_its_progress(self):
+        ShardProgress(progress_path(self.directory.name, 0)).save(['axel b'])
+
+        backfill_shard(0, ['axel b', 'illustrated halloween goofy'], self.directory.name)
+
+        self.assertEqual(self.requested_medals(), ['illustrated halloween goofy'])
+
+    @patch('khux_medal_finder.api.time.sleep')
+    def test_backfill_shard_doesnt_mark_failed_names_as_done(self, _):
+        shard_results = backfill_shard(0, ['broken', 'axel b'], self.directory.name, workers=2)
+
+        self.assertEqual(shard_results[1], ['broken'])
+        self.assertEqual(ShardProgress(progress_path(self.directory.name, 0)).done, {'axel b'})
+
+    def test_run_with_a_single_process(self):
+        backfill = Backfill(self.directory.name, processes=1)
+        hook = Mock()
+        backfill.post_scrape_hooks.append(hook)
+
+        result, failed_names = backfill.run(['axel b', 'illustrated halloween goofy'])
+
+        self.assertEqual(result, UpsertResult(created=3, updated=0, invalid=0))
+        self.assertEqual(failed_names, [])
+        hook.assert_called_once_with()
+
+    def test_run_clears_the_progress_once_every_name_is_done(self):
+        Backfill(self.directory.name, processes=1).run(['axel b'])
+
+        self.assertFalse(os.path.exists(progress_path(self.directory.name, 0)))
+
+    @patch('khux_medal_finder.api.time.sleep')
+    def test_run_keeps_the_progress_if_some_names_failed(self, _):
+        _, failed_names = Backfill(self.directory.name, processes=1).run(['broken', 'axel b'])
+
+        self.assertEqual(failed_names, ['broken'])
+        self.assertEqual(ShardProgress(progress_path(self.directory.name, 0)).done, {'axel b'})
+
+    def test_rate_limit_is_shared_among_the_processes(self):
+        backfill = Backfill(self.directory.name, processes=4, requests_per_second=10)
+        arguments = backfill.shard_arguments(shard_names(['axel b'], 4))
+
+        self.assertEqual([shard_arguments[3] for shard_arguments in arguments], [2.5] * 4)
+
+
+class TestBackfillProcesses(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = SqliteDatabase(os.path.join(self.directory.name, 'medals.db'))
+
+        with self.database.bind_ctx(MODELS):
+            self.database.create_tables(MODELS)
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_run_with_several_processes(self):
+        progress_dir = os.path.join(self.directory.name, 'progress')
+        backfill = Backfill(progress_dir, processes=2, batch_size=1, report_interval=0.1,
+                            initializer=init_test_process, initargs=(self.database.database,))
+
+        with patch('khux_medal_finder.backfill.close_connections', wraps=close_connections) as close_connections_mock:
+            result, failed_names = backfill.run(['axel b', 'illustrated halloween goofy'])
+
+        close_connections_mock.assert_called_once_with()
+        self.assertEqual(result, UpsertResult(created=3, updated=0, invalid=0))
+        self.assertEqual(failed_names, [])
+        self.assertEqual(os.listdir(progress_dir), [])
+
+        with self.database.bind_ctx(MODELS):
+            self.assertEqual(Medal.select().count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+import requests_mock
+from praw.exceptions import RedditAPIException
+
+from khux_medal_finder.api import Search
+from khux_medal_finder.bot import BoundedSet, Checkpoint, MedalFinderBot
+from khux_medal_finder.models import Comment
+from khux_medal_finder.reddit import RedditService
+
+from test.helpers import BaseDBTestCase
+
+
+def mock_comment(comment_id, body, author='Francisco Umbral'):
+    comment = mock.Mock()
+    comment.id = comment_id
+    comment.body = body
+    comment.author = author
+    return comment
+
+
+class TestBoundedSet(unittest.TestCase):
+
+    def test_contains_added_items(self):
+        bounded_set = BoundedSet(2)
+        bounded_set.add('a')
+
+        self.assertIn('a', bounded_set)
+        self.assertNotIn('b', bounded_set)
+
+    def test_forgets_oldest_items(self):
+        bounded_set = BoundedSet(2)
+        for item in ['a', 'b', 'c']:
+            bounded_set.add(item)
+
+        self.assertNotIn('a', bounded_set)
+        self.assertEqual(len(bounded_set), 2)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'checkpoint.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_every_comment_is_newer_if_there_isnt_checkpoint(self):
+        self.assertTrue(Checkpoint(self.path).is_newer('abc'))
+
+    def test_checkpoint_survives_restarts(self):
+        Checkpoint(self.path).save('dxyz12')
+
+        checkpoint = Checkpoint(self.path)
+        self.assertEqual(checkpoint.comment_id, 'dxyz12')
+        self.assertFalse(checkpoint.is_newer('dxyz11'))
+        self.assertTrue(checkpoint.is_newer('dxyz13'))
+
+    def test_older_comments_dont_move_the_checkpoint(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.save('dxyz12')
+        checkpoint.save('dxyz11')
+
+        self.assertEqual(Checkpoint(self.path).comment_id, 'dxyz12')
+
+
+class TestMedalFinderBot(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestMedalFinderBot, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.reddit_service = mock.Mock()
+        self.search = mock.Mock()
+        self.search.combine_searches.return_value = ['medal']
+        self.bot = MedalFinderBot(self.reddit_service, self.search, 'KHUX', 'khux_medal_finder',
+                                  checkpoint_path=os.path.join(self.directory.name, 'checkpoint.txt'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super(TestMedalFinderBot, self).tearDown()
+
+    def test_replies_to_comments_mentioning_the_bot(self):
+        comment = mock_comment('a1', 'u/khux_medal_finder power aoe')
+
+        self.bot.process([comment])
+
+        self.search.combine_searches.assert_called_once_with([{'element': 'Power', 'targets': 'All'}], limit=10)
+        self.reddit_service.reply.assert_called_once_with(comment, ['medal'])
+
+    def test_replies_without_medals_if_there_are_no_requirements(self):
+        comment = mock_comment('a1', 'Hi u/khux_medal_finder!')
+
+        self.bot.process([comment])
+
+        self.search.combine_searches.assert_not_called()
+        self.reddit_service.reply.assert_called_once_with(comment, [])
+
+    def test_ignores_comments_not_mentioning_the_bot(self):
+        self.bot.process([mock_comment('a1', 'power aoe')])
+
+        self.reddit_service.reply.assert_not_called()
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a1')
+
+    def test_ignores_comments_written_by_the_bot(self):
+        self.bot.process([mock_comment('a1', 'u/khux_medal_finder power', author='khux_medal_finder')])
+
+        self.reddit_service.reply.assert_not_called()
+
+    def test_ignores_repeated_comments(self):
+        comment = mock_comment('a1', 'u/khux_medal_finder power')
+
+        self.bot.process([comment, comment, None])
+
+        self.reddit_service.reply.assert_called_once()
+
+    def test_ignores_comments_already_in_the_DB(self):
+        Comment.create(author='Francisco Umbral', comment_id='a1', text='u/khux_medal_finder power', timestamp=1, url='')
+
+        self.bot.process([mock_comment('a1', 'u/khux_medal_finder power')])
+
+        self.reddit_service.reply.assert_not_called()
+
+    def test_ignores_comments_older_than_the_checkpoint(self):
+        self.bot.checkpoint.save('a5')
+
+        self.bot.process([mock_comment('a1', 'u/khux_medal_finder power')])
+
+        self.reddit_service.reply.assert_not_called()
+
+    def test_checkpoint_is_moved_after_replying(self):
+        self.bot.process([mock_comment('a1', 'u/khux_medal_finder power'),
+                          mock_comment('a2', 'u/khux_medal_finder speed')])
+
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a2')
+
+    def test_replies_are_queued_if_there_is_a_scheduler(self):
+        scheduler = mock.Mock()
+        self.bot.scheduler = scheduler
+        comment = mock_comment('a1', 'u/khux_medal_finder power aoe')
+
+        self.bot.process([comment, None])
+
+        scheduler.enqueue.assert_called_once_with(comment, ['medal'])
+        self.assertEqual(scheduler.send_pending.call_count, 2)
+        self.reddit_service.reply.assert_not_called()
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a1')
+
+    def test_comments_are_looked_up_a_page_at_a_time(self):
+        comments = [mock_comment(f'a{number}', 'power aoe') for number in range(3)]
+
+        with mock.patch.object(Comment, 'processed_ids', wraps=Comment.processed_ids) as processed_ids:
+            self.bot.process(comments + [None] + [mock_comment('a3', 'power aoe')])
+
+        self.assertEqual(processed_ids.call_count, 2)
+        self.assertEqual(sorted(processed_ids.call_args_list[0][0][0]), ['a0', 'a1', 'a2'])
+
+    def test_pages_are_limited_to_the_lookup_size(self):
+        self.bot.LOOKUP_SIZE = 2
+        comments = [mock_comment(f'a{number}', 'power aoe') for number in range(5)]
+
+        with mock.patch.object(Comment, 'processed_ids', wraps=Comment.processed_ids) as processed_ids:
+            self.bot.process(comments)
+
+        self.assertEqual(processed_ids.call_count, 3)
+
+    def test_reddit_errors_dont_stop_the_bot(self):
+        self.reddit_service.reply.side_effect = [RedditAPIException([['RATELIMIT', 'Take a break', None]]), None]
+        comments = [mock_comment('a1', 'u/khux_medal_finder power'), mock_comment('a2', 'u/khux_medal_finder speed')]
+
+        self.bot.process(comments)
+
+        self.assertEqual(self.reddit_service.reply.call_count, 2)
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a2')
+
+    def test_search_errors_dont_stop_the_bot(self):
+        self.search.combine_searches.side_effect = requests.ConnectionError('khuxbot is down')
+
+        self.bot.process([mock_comment('a1', 'u/khux_medal_finder power')])
+
+        self.reddit_service.reply.assert_not_called()
+        self.assertEqual(self.bot.checkpoint.comment_id, 'a1')
+
+    @requests_mock.Mocker()
+    def test_replies_with_the_medals_of_a_khuxbot_search(self, mock_requests):
+        with open('test/fixtures/search/medals_upright_power_c4_t6.json') as fixture:
+            mock_requests.get(requests_mock.ANY, json=json.loads(fixture.read()))
+
+        reddit_service = RedditService.__new__(RedditService)
+        self.bot.reddit_service = reddit_service
+        self.bot.search = Search()
+        comment = mock_comment('a1', 'u/khux_medal_finder power aoe')
+        comment.created, comment.permalink = 1, '/r/KHUX/a1'
+        comment.reply.return_value = mock.Mock(id='b1', created=2, permalink='/r/KHUX/b1')
+
+        self.bot.process([comment])
+
+        reply_body = comment.reply.call_args[0][0]
+        self.assertIn('Kings Roar|Upright|Power|All|x2.1 - 3.28', reply_body)
+        self.assertTrue(Comment.processed_ids(['a1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from khux_medal_finder.cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(max_size=2, ttl=60)
+
+    def test_get_returns_the_value_set(self):
+        self.cache.set('key', [1, 2])
+        self.assertEqual(self.cache.get('key'), [1, 2])
+
+    def test_get_returns_default_if_key_isnt_cached(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('key', []), [])
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set('key', [1, 2])
+
+        with patch('time.time', return_value=9999999999):
+            self.assertIsNone(self.cache.get('key'))
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats['expirations'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('first', 1)
+        self.cache.set('second', 2)
+        self.cache.get('first')
+        self.cache.set('third', 3)
+
+        self.assertEqual(self.cache.get('first'), 1)
+        self.assertIsNone(self.cache.get('second'))
+        self.assertEqual(self.cache.get('third'), 3)
+        self.assertEqual(self.cache.stats['evictions'], 1)
+
+    def test_stats_count_hits_and_misses(self):
+        self.cache.set('key', 1)
+        self.cache.get('key')
+        self.cache.get('key')
+        self.cache.get('missing key')
+
+        self.assertEqual(self.cache.stats['hits'], 2)
+        self.assertEqual(self.cache.stats['misses'], 1)
+
+    def test_clear_removes_every_entry(self):
+        self.cache.set('first', 1)
+        self.cache.set('second', 2)
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNone(self.cache.get('first'))
+
+    def test_validate_keeps_the_entries_of_the_same_version(self):
+        self.cache.validate('v1')
+        self.cache.set('key', 1)
+
+        self.assertFalse(self.cache.validate('v1'))
+        self.assertEqual(self.cache.get('key'), 1)
+
+    def test_validate_removes_the_entries_of_another_version(self):
+        self.cache.validate('v1')
+        self.cache.set('key', 1)
+
+        self.assertTrue(self.cache.validate('v2'))
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.version, 'v2')
+
+
+class TestResponseCacheWithStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_entries_survive_restarts(self):
+        cache = ResponseCache(path=self.path)
+        cache.set('key', [1, 2])
+        cache.close()
+
+        cache = ResponseCache(path=self.path)
+        self.assertEqual(cache.get('key'), [1, 2])
+        cache.close()
+
+    def test_expired_entries_arent_loaded(self):
+        cache = ResponseCache(ttl=-1, path=self.path)
+        cache.set('key', [1, 2])
+        cache.close()
+
+        cache = ResponseCache(path=self.path)
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_cleared_entries_dont_survive_restarts(self):
+        cache = ResponseCache(path=self.path)
+        cache.set('key', [1, 2])
+        cache.clear()
+        cache.close()
+
+        cache = ResponseCache(path=self.path)
+        self.assertIsNone(cache.get('key'))
+        cache.close()
+
+    def test_version_survives_restarts(self):
+        cache = ResponseCache(path=self.path)
+        cache.validate('v1')
+        cache.set('key', [1, 2])
+        cache.close()
+
+        cache = ResponseCache(path=self.path)
+        self.assertFalse(cache.validate('v1'))
+        self.assertEqual(cache.get('key'), [1, 2])
+        cache.close()
+
+    def test_entries_of_another_version_dont_survive_restarts(self):
+        cache = ResponseCache(path=self.path)
+        cache.validate('v1')
+        cache.set('key', [1, 2])
+        cache.close()
+
+        cache = ResponseCache(path=self.path)
+        cache.validate('v2')
+        cache.close()
+
+        cache = ResponseCache(path=self.path)
+        self.assertEqual(cache.version, 'v2')
+        self.assertIsNone(cache.get('key'))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
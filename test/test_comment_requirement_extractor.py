@@ -1,6 +1,7 @@
 import unittest
 
-from khux_medal_finder.comment import RequirementExtractor
+from khux_medal_finder.comment import (KEYWORDS, KeywordTokenizer, RequirementExtractor, Requirements,
+                                      keyword_requirements, requirements_batch)
 
 
 class TestCommentParser(unittest.TestCase):
@@ -165,3 +166,136 @@ class TestCommentParser(unittest.TestCase):
 
         self.assertCountEqual(extractor.requirements['direction'], ['Upright', 'Reversed'])
 
+
+
+    # KEYWORDS CHECK
+    def test_keywords_must_be_whole_words(self):
+        comment = "blabla powerful multiple randomly blabla"
+
+        extractor = RequirementExtractor(comment)
+        extractor.extract_requirements()
+
+        self.assertEqual(extractor.requirements, {'elements': [], 'targets': [], 'direction': []})
+
+    def test_keywords_next_to_punctuation_are_found(self):
+        comment = "Any (power) medal? Upright, AOE!"
+
+        extractor = RequirementExtractor(comment)
+        extractor.extract_requirements()
+
+        self.assertEqual(extractor.requirements, {'elements': ['Power'], 'targets': ['All'], 'direction': ['Upright']})
+
+    def test_new_keywords_can_be_added(self):
+        tokenizer = KeywordTokenizer(KEYWORDS)
+        tokenizer.add_keywords({'st': [('targets', 'Single')]})
+
+        extractor = RequirementExtractor("blabla ST upright blabla", tokenizer=tokenizer)
+        extractor.extract_requirements()
+
+        self.assertEqual(extractor.requirements['targets'], ['Single'])
+        self.assertEqual(extractor.requirements['direction'], ['Upright'])
+
+    def test_keywords_of_several_words_can_be_added(self):
+        tokenizer = KeywordTokenizer(KEYWORDS)
+        tokenizer.add_keywords({'single target': [('targets', 'Single')], 'all-in': [('targets', 'All')]})
+
+        self.assertEqual(tokenizer.find('power single target, all-in'), {'power', 'single', 'single target', 'all-in'})
+        self.assertEqual(tokenizer.find('single targets'), {'single'})
+
+    def test_requirements_are_parsed_without_extracting_them_first(self):
+        extractor = RequirementExtractor("psm reversed")
+
+        self.assertEqual(extractor.parse_element(), ['Power', 'Speed', 'Magic'])
+        self.assertEqual(extractor.parse_direction(), ['Reversed'])
+
+    def test_requirements_of_the_same_keywords_are_cached(self):
+        tokenizer = KeywordTokenizer(KEYWORDS)
+        keywords = tokenizer.find('speed aoe power')
+
+        self.assertIs(keyword_requirements(keywords, tokenizer), keyword_requirements(keywords, tokenizer))
+        self.assertEqual(keyword_requirements(keywords, tokenizer), Requirements(('Power', 'Speed'), ('All',), ()))
+
+    def test_adding_keywords_clears_the_cache(self):
+        tokenizer = KeywordTokenizer(KEYWORDS)
+        keyword_requirements(tokenizer.find('power'), tokenizer)
+
+        tokenizer.add_keywords({'power': [('elements', 'Magic')]})
+
+        self.assertEqual(keyword_requirements(tokenizer.find('power'), tokenizer).elements, ('Magic',))
+
+
+    # FILTERS
+    def test_filters_combine_all_the_requirements(self):
+        comment = "blabla power speed aoe upright blabla"
+
+        extractor = RequirementExtractor(comment)
+        extractor.extract_requirements()
+
+        self.assertCountEqual(extractor.filters(), [{'element': 'Power', 'targets': 'All', 'direction': 'Upright'},
+                                                    {'element': 'Speed', 'targets': 'All', 'direction': 'Upright'}])
+
+    def test_filters_ignore_missing_requirements(self):
+        comment = "blabla magic blabla"
+
+        extractor = RequirementExtractor(comment)
+        extractor.extract_requirements()
+
+        self.assertEqual(extractor.filters(), [{'element': 'Magic'}])
+
+    def test_filters_are_empty_if_there_are_no_requirements(self):
+        comment = "blabla blabla"
+
+        extractor = RequirementExtractor(comment)
+        extractor.extract_requirements()
+
+        self.assertEqual(extractor.filters(), [])
+
+
+class TestRequirementsBatch(unittest.TestCase):
+
+    def test_yields_requirements_of_each_comment(self):
+        comments = ["blabla power aoe", "blabla PSM reversed"]
+
+        results = list(requirements_batch(comments))
+
+        self.assertEqual(results, [
+            ("blabla power aoe", Requirements(('Power',), ('All',), ())),
+            ("blabla PSM reversed", Requirements(('Power', 'Speed', 'Magic'), (), ('Reversed',)))
+        ])
+
+    def test_skips_comments_without_requirements(self):
+        comments = ["blabla", "blabla powerful", "blabla speed"]
+
+        results = list(requirements_batch(comments))
+
+        self.assertEqual([comment for comment, _ in results], ["blabla speed"])
+
+    def test_uses_key_to_obtain_the_text(self):
+        comments = [{'body': 'blabla magic'}]
+
+        results = list(requirements_batch(comments, key=lambda comment: comment['body']))
+
+        self.assertEqual(results[0][0], {'body': 'blabla magic'})
+        self.assertEqual(results[0][1].elements, ('Magic',))
+
+    def test_comments_with_the_same_keywords_share_requirements(self):
+        results = list(requirements_batch(["power single", "single blabla power"]))
+
+        self.assertIs(results[0][1], results[1][1])
+
+    def test_requirements_are_immutable(self):
+        _, requirements = next(requirements_batch(["power"]))
+
+        with self.assertRaises(AttributeError):
+            requirements.elements = ()
+
+    def test_requirements_filters(self):
+        requirements = Requirements(('Power', 'Speed'), ('All',), ())
+
+        self.assertEqual(requirements.filters(), [{'element': 'Power', 'targets': 'All'},
+                                                  {'element': 'Speed', 'targets': 'All'}])
+
+    def test_requirements_search_filters(self):
+        requirements = Requirements(('Power', 'Speed'), ('All',), ())
+
+        self.assertEqual(requirements.search_filters(), {'element': ['Power', 'Speed'], 'targets': ['All']})
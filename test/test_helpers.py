@@ -1,10 +1,11 @@
 import json
 import unittest
 import peewee
+from unittest.mock import patch
 
-from khux_medal_finder.models import Medal
+from khux_medal_finder.models import Medal, MedalRecord
 from khux_medal_finder.factories import MedalFactory
-from khux_medal_finder.helpers import prepare_reply_body, prepare_multiplier_string
+from khux_medal_finder.helpers import clear_rendered_medals, parse_multipliers, prepare_reply_body, prepare_multiplier_string
 
 test_db = peewee.SqliteDatabase(':memory:')
 class TestPrepareReplyBody(unittest.TestCase):
@@ -50,6 +51,13 @@ class TestPrepareReplyBody(unittest.TestCase):
         obtained_table = prepare_reply_body([self.combat_medal, self.combat_medal_ranged_multiplier])
         self.assertEqual(obtained_table, expected_table)
 
+    def test_medal_records_generate_the_same_table(self):
+        medals = [self.combat_medal, self.combat_medal_ranged_multiplier]
+        expected_table = prepare_reply_body(medals)
+        clear_rendered_medals()
+
+        self.assertEqual(prepare_reply_body([MedalRecord.from_medal(medal) for medal in medals]), expected_table)
+
     def test_the_amount_of_medals_shown_is_correctly_limited(self):
         expected_table = "Medal|Direction|Element|Targets|Multiplier|Tier|Hits|Notes\n" + \
                          ":--|:--|:--|:--|:--|:--|:--|:--|\n" + \
@@ -67,6 +75,40 @@ class TestPrepareReplyBody(unittest.TestCase):
 
         self.assertEqual(obtained_table, expected_table)
 
+    def test_rows_are_rendered_again_if_the_medal_changes(self):
+        prepare_reply_body([self.combat_medal])
+        self.combat_medal.tier = 6
+        self.combat_medal.multiplier_max = 4.5
+
+        obtained_table = prepare_reply_body([self.combat_medal])
+
+        self.assertTrue(obtained_table.endswith("KH0.2 Terra & Ventus|Upright|Speed|Single|x3.4 - 4.5|6|13|Raises your power and speed attack by two steps for two turns; deals large damage"))
+
+    def test_rows_are_not_rendered_again_if_the_medal_doesnt_change(self):
+        clear_rendered_medals()
+        prepare_reply_body([self.combat_medal])
+
+        with patch('khux_medal_finder.helpers.prepare_multiplier') as mocked_prepare_multiplier:
+            prepare_reply_body([self.combat_medal])
+            prepare_reply_body([self.combat_medal], reply_format='list')
+
+        mocked_prepare_multiplier.assert_not_called()
+
+    def test_list_format(self):
+        expected_list = "* **KH0.2 Terra & Ventus**: Upright Speed Single, x3.4, tier 5, 13 hits. Raises your power and speed attack by two steps for two turns; deals large damage\n" + \
+                        "* **Final Boss Xion**: Reversed Speed All, x2.61 - 3.85, tier 6, 1 hits. Decreases enemy defense by two steps for two turns; deals more damage the more ability gauges you have remaining"
+        obtained_list = prepare_reply_body([self.combat_medal, self.combat_medal_ranged_multiplier], reply_format='list')
+
+        self.assertEqual(obtained_list, expected_list)
+
+    def test_json_format(self):
+        obtained_json = json.loads(prepare_reply_body([self.combat_medal, self.combat_medal_ranged_multiplier], reply_format='json'))
+
+        self.assertEqual(len(obtained_json), 2)
+        self.assertEqual(obtained_json[1], {'Medal': 'Final Boss Xion', 'Direction': 'Reversed', 'Element': 'Speed',
+                                            'Targets': 'All', 'Multiplier': 'x2.61 - 3.85', 'Tier': '6', 'Hits': '1',
+                                            'Notes': 'Decreases enemy defense by two steps for two turns; deals more damage the more ability gauges you have remaining'})
+
 
 class TestPrepareMultiplierString(unittest.TestCase):
 
@@ -92,4 +134,33 @@ class TestPrepareMultiplierString(unittest.TestCase):
 
     def test_raises_an_exception_if_string_is_none(self):
         with self.assertRaises(Exception):
-            prepare_multiplier_string(None)
\ No newline at end of file
+            prepare_multiplier_string(None)
+
+class TestParseMultipliers(unittest.TestCase):
+
+    def test_parses_every_format(self):
+        minimums, maximums, errors = parse_multipliers(['x1.5', '1.2~2.4', 'x3.0-4.5', '    X2.10 - 3.28  '])
+
+        self.assertEqual(list(minimums), [1.5, 1.2, 3.0, 2.10])
+        self.assertEqual(list(maximums), [1.5, 2.4, 4.5, 3.28])
+        self.assertEqual(list(errors), [0, 0, 0, 0])
+
+    def test_marks_the_values_that_cant_be_parsed(self):
+        minimums, maximums, errors = parse_multipliers(['x1.5', None, '', 'x', '1.5-', 'x1.5\nx2', 'x1.5'])
+
+        self.assertEqual(list(errors), [0, 1, 1, 1, 1, 1, 0])
+        self.assertEqual(minimums[-1], 1.5)
+
+    def test_matches_the_scalar_parser(self):
+        multiplier_strings = ['x1.5', '1.2~2.4', 'x3.0-4.5', '3.97-7.12', '       3.97-7.12      ', '    x3.97~7.12  ']
+        minimums, maximums, _ = parse_multipliers(multiplier_strings)
+
+        self.assertEqual([MedalFactory.parse_multiplier(string) for string in multiplier_strings],
+                         [[minimum, maximum] for minimum, maximum in zip(minimums, maximums)])
+
+    def test_empty_column(self):
+        self.assertEqual(tuple(map(len, parse_multipliers([]))), (0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from khux_medal_finder.factories import MedalFactory
+from khux_medal_finder.index import MedalIndex
+from khux_medal_finder.models import MedalRecord
+
+from test.helpers import SearchFixturesTestCase
+
+
+class TestMedalIndex(SearchFixturesTestCase):
+
+    def setUp(self):
+        super(TestMedalIndex, self).setUp()
+
+        self.index = MedalIndex()
+        self.index.refresh()
+
+    def test_refresh_loads_only_rarity_6_combat_medals(self):
+        self.assertEqual(len(self.index.catalogue), 6)
+        self.assertTrue(all(medal.rarity == 6 for medal in self.index.catalogue))
+
+    def test_catalogue_holds_medal_records(self):
+        self.assertTrue(all(isinstance(medal, MedalRecord) for medal in self.index.catalogue))
+
+    def test_medals_are_sorted_by_max_multiplier(self):
+        multipliers = [medal.multiplier_max for medal in self.index.catalogue]
+        self.assertEqual(multipliers, sorted(multipliers, reverse=True))
+
+    def test_medals_with_one_filter(self):
+        medals = self.index.medals({'element': 'Speed'})
+        self.assertEqual(self.names(medals), ['KH0.2 Terra & Ventus', 'Key Art #3'])
+
+    def test_medals_with_several_filters(self):
+        medals = self.index.medals({'element': 'Power', 'targets': 'All', 'direction': 'Upright'})
+        self.assertEqual(self.names(medals), ['HD KHII Leon', 'Toon Sora', 'Kings Roar'])
+
+    def test_medals_with_filter_values_that_arent_strings(self):
+        medals = self.index.medals({'element': 'Power', 'tier': 7})
+        self.assertEqual(self.names(medals), ['HD KHII Leon'])
+
+    def test_medals_with_several_values_for_a_filter(self):
+        medals = self.index.medals({'element': ['Speed', 'Power'], 'direction': 'Reversed'})
+        self.assertEqual(self.names(medals), ['Axel B', 'Key Art #3'])
+
+    def test_medals_with_a_filter_that_isnt_indexed(self):
+        medals = self.index.medals({'cost': 4, 'tier': 6})
+        self.assertEqual(self.names(medals), ['Toon Sora', 'Kings Roar'])
+
+    def test_medals_without_matches(self):
+        self.assertEqual(self.index.medals({'element': 'Magic'}), [])
+
+    def test_medals_are_limited(self):
+        medals = self.index.medals({'element': 'Power'}, limit=2)
+        self.assertEqual(self.names(medals), ['HD KHII Leon', 'Toon Sora'])
+
+    def test_combine_searches_doesnt_repeat_medals(self):
+        medals = self.index.combine_searches([{'element': 'Power', 'targets': 'All'}, {'direction': 'Upright'}])
+        self.assertEqual(self.names(medals), ['HD KHII Leon', 'KH0.2 Terra & Ventus', 'Toon Sora', 'Kings Roar'])
+
+    def test_refresh_picks_up_new_medals(self):
+        with open('test/fixtures/scrapper/medal_with_symbol_in_name_3.json') as fixture:
+            MedalFactory.medals(json.loads(fixture.read())['medal'].values())
+
+        self.assertEqual(self.index.medals({'element': 'Magic'}), [])
+        self.index.refresh()
+        self.assertEqual(self.names(self.index.medals({'element': 'Magic'})), ['HD Invi [EX]'])
+
+    def test_medals_are_reloaded_when_their_version_changes(self):
+        self.index.check_interval = 0
+        with open('test/fixtures/scrapper/medal_with_symbol_in_name_3.json') as fixture:
+            MedalFactory.medals(json.loads(fixture.read())['medal'].values())
+
+        self.assertEqual(self.names(self.index.medals({'element': 'Magic'})), ['HD Invi [EX]'])
+
+    def test_medals_arent_reloaded_if_their_version_doesnt_change(self):
+        self.index.check_interval = 0
+
+        with patch.object(self.index, 'refresh') as refresh:
+            self.index.medals({'element': 'Power'})
+
+        refresh.assert_not_called()
+
+    def test_version_isnt_checked_before_the_check_interval(self):
+        with patch('khux_medal_finder.index.SyncState.catalogue_version') as catalogue_version:
+            self.index.combine_searches([{'element': 'Power'}])
+
+        catalogue_version.assert_not_called()
+
+    def test_medals_are_loaded_on_the_first_search(self):
+        index = MedalIndex()
+
+        self.assertEqual(self.names(index.medals({'element': 'Speed'})), ['KH0.2 Terra & Ventus', 'Key Art #3'])
+
+    def test_medals_loaded_by_hand_arent_reloaded(self):
+        index = MedalIndex(check_interval=0)
+        index.load([])
+
+        self.assertFalse(index.refresh_if_stale())
+
+
+if __name__ == '__main__':
+    unittest.main()
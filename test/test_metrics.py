@@ -0,0 +1,127 @@
+import socket
+import time
+import unittest
+import requests
+from unittest.mock import Mock
+
+from khux_medal_finder.comment import RequirementExtractor
+from khux_medal_finder.metrics import REGISTRY, Registry, SamplingProfiler, StatsdExporter, Timer, serve_metrics, timed
+
+
+class TestTimer(unittest.TestCase):
+
+    def test_percentiles(self):
+        timer = Timer()
+        for milliseconds in range(1, 101):
+            timer.observe(milliseconds / 1000)
+
+        self.assertEqual(timer.percentile(50), 0.051)
+        self.assertEqual(timer.percentile(99), 0.1)
+        self.assertEqual(timer.count, 100)
+
+    def test_only_the_last_samples_are_kept(self):
+        timer = Timer()
+        for _ in range(Timer.SAMPLES + 10):
+            timer.observe(1)
+
+        self.assertEqual(len(timer.samples), Timer.SAMPLES)
+        self.assertEqual(timer.count, Timer.SAMPLES + 10)
+
+    def test_percentile_without_samples(self):
+        self.assertEqual(Timer().percentile(99), 0.0)
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_timed_observes_every_call(self):
+        @timed('operation', registry=self.registry)
+        def operation():
+            return 'result'
+
+        self.assertEqual(operation(), 'result')
+        operation()
+
+        self.assertEqual(self.registry.timers['operation'].count, 2)
+
+    def test_timed_observes_calls_raising_exceptions(self):
+        @timed('operation', registry=self.registry)
+        def operation():
+            raise ValueError('Failing on purpose')
+
+        with self.assertRaises(ValueError):
+            operation()
+
+        self.assertEqual(self.registry.timers['operation'].count, 1)
+
+    def test_prometheus_text(self):
+        self.registry.count('replies_sent', 3)
+        self.registry.observe('search_medals', 0.25)
+
+        text = self.registry.prometheus_text()
+
+        self.assertIn('khux_medal_finder_replies_sent_total 3\n', text)
+        self.assertIn('# TYPE khux_medal_finder_search_medals_seconds summary\n', text)
+        self.assertIn('khux_medal_finder_search_medals_seconds{quantile="0.99"} 0.250000\n', text)
+        self.assertIn('khux_medal_finder_search_medals_seconds_count 1\n', text)
+
+    def test_listeners_receive_every_observation(self):
+        listener = Mock()
+        self.registry.listeners.append(listener)
+
+        self.registry.count('replies_sent')
+        self.registry.observe('search_medals', 0.25)
+
+        listener.count.assert_called_once_with('replies_sent', 1)
+        listener.observe.assert_called_once_with('search_medals', 0.25)
+
+    def test_hot_paths_are_instrumented(self):
+        REGISTRY.clear()
+
+        RequirementExtractor('power aoe').extract_requirements()
+
+        self.assertEqual(REGISTRY.timers['requirements_extraction'].count, 1)
+
+
+class TestStatsdExporter(unittest.TestCase):
+
+    def test_sends_the_metrics_using_the_statsd_format(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1)
+        exporter = StatsdExporter('127.0.0.1', receiver.getsockname()[1])
+
+        exporter.count('replies_sent', 2)
+        exporter.observe('search_medals', 0.25)
+
+        self.assertEqual(receiver.recv(100), b'khux_medal_finder.replies_sent:2|c')
+        self.assertEqual(receiver.recv(100), b'khux_medal_finder.search_medals:250.000|ms')
+        receiver.close()
+
+
+class TestServeMetrics(unittest.TestCase):
+
+    def test_serves_the_metrics_and_the_profile(self):
+        registry = Registry()
+        registry.count('replies_sent')
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        time.sleep(0.05)
+        profiler.stop()
+
+        server = serve_metrics(port=0, registry=registry, profiler=profiler)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        try:
+            self.assertIn('khux_medal_finder_replies_sent_total 1', requests.get(url + '/metrics').text)
+            self.assertIn('%', requests.get(url + '/profile').text)
+            self.assertEqual(requests.get(url + '/other').status_code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
 import json
+import os
 import peewee
+import subprocess
+import sys
+import tempfile
+import unittest
+from playhouse.pool import PooledPostgresqlDatabase, PooledSqliteDatabase
 from unittest.mock import patch
 
 from khux_medal_finder.factories import MedalFactory
-from khux_medal_finder.models import BaseModel, Medal
+from khux_medal_finder.exceptions import ParseMultiplierError
+from khux_medal_finder.models import (BaseModel, Comment, Medal, MedalRecord, Reply, SyncState, close_connections, db,
+                                      init_db, is_initialized, pool_stats, unit_of_work)
 
-from test.helpers import BaseDBTestCase
+from test.helpers import BaseDBTestCase, SearchFixturesTestCase
 
 class TestModels(BaseDBTestCase):
     """Tests for the different ORM models"""
@@ -220,3 +228,367 @@ class TestMedalFactory(BaseDBTestCase):
 
         created_medal = MedalFactory.medal(combat_medal_json_faulty)
         self.assertIsInstance(created_medal, Medal)
+
+
+class TestMedalSearch(SearchFixturesTestCase):
+
+    def test_returns_the_matching_medals_sorted_by_max_multiplier(self):
+        medals = Medal.search({'element': 'Power', 'targets': 'All', 'direction': 'Upright'})
+        self.assertEqual(self.names(medals), ['HD KHII Leon', 'Toon Sora', 'Kings Roar'])
+
+    def test_lists_match_any_of_their_values(self):
+        medals = Medal.search({'element': ['Speed', 'Magic']})
+        self.assertEqual(self.names(medals), ['KH0.2 Terra & Ventus', 'Key Art #3'])
+
+    def test_only_returns_rarity_6_medals(self):
+        self.assertNotIn(986, [medal.medal_id for medal in Medal.search({})])
+        self.assertEqual(len(Medal.search({})), 6)
+
+    def test_respects_the_limit(self):
+        self.assertEqual(self.names(Medal.search({}, limit=1)), ['HD KHII Leon'])
+
+    def test_returns_medal_records(self):
+        medal = Medal.search({'element': 'Speed'})[0]
+
+        self.assertIsInstance(medal, MedalRecord)
+        self.assertEqual(medal, MedalRecord.from_medal(Medal.get(Medal.medal_id == medal.medal_id)))
+
+    def test_unknown_attributes_raise_an_error(self):
+        with self.assertRaises(ValueError):
+            Medal.search({'color': 'Red'})
+
+    def test_combat_search_index_exists(self):
+        indexes = [index.name for index in Medal._meta.database.get_indexes('medal')]
+        self.assertIn('medal_combat_search', indexes)
+
+
+class TestMedalRecord(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestMedalRecord, self).setUp()
+
+        with open('test/fixtures/models/combat_medal_with_ranged_multiplier_data.json') as fixture:
+            self.medal_json = json.loads(fixture.read())
+
+    def test_from_json(self):
+        record = MedalRecord.from_json(self.medal_json)
+
+        self.assertEqual(record.medal_id, self.medal_json['id'])
+        self.assertEqual(record.name, self.medal_json['name'])
+        self.assertEqual((record.multiplier_min, record.multiplier_max), (2.61, 3.85))
+
+    def test_from_json_with_invalid_multiplier(self):
+        self.medal_json['multiplier'] = None
+
+        with self.assertRaises(ParseMultiplierError):
+            MedalRecord.from_json(self.medal_json)
+
+    def test_from_json_list_skips_invalid_medals(self):
+        invalid_medal_json = dict(self.medal_json, id=1, multiplier='N/A')
+
+        records = MedalRecord.from_json_list([invalid_medal_json, self.medal_json])
+
+        self.assertEqual([record.medal_id for record in records], [self.medal_json['id']])
+
+    def test_from_json_list_parses_the_multipliers_the_batch_parser_rejects(self):
+        medals_json = [dict(self.medal_json, id=1, multiplier='+1.5'), dict(self.medal_json, id=2, multiplier='1e3')]
+
+        records = MedalRecord.from_json_list(medals_json)
+
+        self.assertEqual([(record.multiplier_min, record.multiplier_max) for record in records],
+                         [(1.5, 1.5), (1000.0, 1000.0)])
+        self.assertEqual(records, [MedalRecord.from_medal(MedalFactory.build(medal_json))
+                                   for medal_json in medals_json])
+
+    def test_from_json_matches_the_saved_medal(self):
+        MedalFactory.medals([self.medal_json])
+
+        self.assertEqual(MedalRecord.from_json(self.medal_json), MedalRecord.from_medal(Medal.get()))
+
+    def test_from_row(self):
+        MedalFactory.medals([self.medal_json])
+        row = Medal.select(*MedalRecord.columns()).tuples().get()
+
+        self.assertEqual(MedalRecord.from_row(row), MedalRecord.from_medal(Medal.get()))
+
+    def test_records_are_immutable_and_slotted(self):
+        record = MedalRecord.from_json(self.medal_json)
+
+        with self.assertRaises(AttributeError):
+            record.name = 'Another name'
+        self.assertFalse(hasattr(record, '__dict__'))
+
+
+class TestMedalFactoryBulk(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestMedalFactoryBulk, self).setUp()
+
+        with open('test/fixtures/models/combat_medal_data.json') as fixture:
+            self.combat_medal_json = json.loads(fixture.read())
+
+        with open('test/fixtures/models/combat_medal_with_ranged_multiplier_data.json') as fixture:
+            self.combat_medal_ranged_multiplier_json = json.loads(fixture.read())
+
+        with open('test/fixtures/models/non_combat_medal_data.json') as fixture:
+            self.non_combat_medal_json = json.loads(fixture.read())
+
+    def test_creates_all_the_medals(self):
+        result = MedalFactory.medals([self.combat_medal_json, self.combat_medal_ranged_multiplier_json])
+
+        self.assertEqual(result, (2, 0, 0))
+        self.assertEqual(Medal.select().count(), 2)
+
+    def test_sets_fields_correctly_in_medals(self):
+        MedalFactory.medals([self.combat_medal_ranged_multiplier_json])
+        medal = Medal.get()
+
+        self.assertEqual(medal.name, self.combat_medal_ranged_multiplier_json['name'])
+        self.assertEqual(medal.multiplier_min, 2.61)
+        self.assertEqual(medal.multiplier_max, 3.85)
+
+    def test_skips_medals_already_in_DB(self):
+        MedalFactory.medals([self.combat_medal_json])
+
+        result = MedalFactory.medals([self.combat_medal_json, self.combat_medal_ranged_multiplier_json])
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(Medal.select().count(), 2)
+
+    def test_skips_repeated_medals(self):
+        result = MedalFactory.medals([self.combat_medal_json, self.combat_medal_json])
+
+        self.assertEqual(result, (1, 1, 0))
+
+    def test_skips_non_combat_medals(self):
+        result = MedalFactory.medals([self.non_combat_medal_json])
+
+        self.assertEqual(result, (0, 1, 0))
+        self.assertEqual(Medal.select().count(), 0)
+
+    def test_counts_invalid_medals(self):
+        combat_medal_json_faulty = self.combat_medal_json.copy()
+        combat_medal_json_faulty['multiplier'] = None
+
+        result = MedalFactory.medals([combat_medal_json_faulty, self.combat_medal_ranged_multiplier_json])
+
+        self.assertEqual(result, (1, 0, 1))
+
+    def test_inserts_medals_in_batches(self):
+        with patch.object(Medal, 'insert_many', wraps=Medal.insert_many) as mocked_insert_many:
+            result = MedalFactory.medals([self.combat_medal_json, self.combat_medal_ranged_multiplier_json], batch_size=1)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(mocked_insert_many.call_count, 2)
+
+    def test_doesnt_create_any_medal_if_a_batch_fails(self):
+        original_insert_many = Medal.insert_many
+        calls = []
+
+        def failing_insert_many(rows):
+            calls.append(rows)
+            if len(calls) > 1:
+                raise peewee.IntegrityError('Failing on purpose')
+            return original_insert_many(rows)
+
+        with patch.object(Medal, 'insert_many', side_effect=failing_insert_many):
+            with self.assertRaises(peewee.IntegrityError):
+                MedalFactory.medals([self.combat_medal_json, self.combat_medal_ranged_multiplier_json], batch_size=1)
+
+        self.assertEqual(Medal.select().count(), 0)
+
+    def test_upsert_medals_creates_new_medals_and_updates_existing_ones(self):
+        MedalFactory.medals([self.combat_medal_json])
+        self.combat_medal_json['multiplier'] = 'x3.50-4.00'
+
+        result = MedalFactory.upsert_medals([self.combat_medal_json, self.combat_medal_ranged_multiplier_json])
+
+        self.assertEqual(result, (1, 1, 0))
+        self.assertEqual(Medal.select().count(), 2)
+        self.assertEqual(Medal.get(Medal.medal_id == self.combat_medal_json['id']).multiplier_max, 4.0)
+
+    def test_saving_medals_changes_the_catalogue_version(self):
+        self.assertIsNone(SyncState.catalogue_version())
+
+        MedalFactory.medals([self.combat_medal_json])
+        first_version = SyncState.catalogue_version()
+        MedalFactory.upsert_medals([self.combat_medal_ranged_multiplier_json])
+
+        self.assertIsNotNone(first_version)
+        self.assertNotEqual(SyncState.catalogue_version(), first_version)
+
+    def test_skipping_every_medal_keeps_the_catalogue_version(self):
+        MedalFactory.medals([self.combat_medal_json])
+        version = SyncState.catalogue_version()
+
+        MedalFactory.medals([self.combat_medal_json, self.non_combat_medal_json])
+
+        self.assertEqual(SyncState.catalogue_version(), version)
+
+
+class TestComment(BaseDBTestCase):
+
+    def create_comment(self, comment_id):
+        return Comment.create(author='Francisco Umbral', comment_id=comment_id, text='power aoe', timestamp=1, url='')
+
+    def test_comment_id_is_unique(self):
+        self.create_comment('abcdex')
+
+        with self.assertRaises(peewee.IntegrityError):
+            self.create_comment('abcdex')
+
+    def test_comment_id_and_original_comment_are_indexed(self):
+        comment_indexes = [index.columns for index in Comment._meta.database.get_indexes('comment') if index.unique]
+        reply_indexes = [index.columns for index in Reply._meta.database.get_indexes('reply')]
+
+        self.assertIn(['comment_id'], comment_indexes)
+        self.assertIn(['original_comment_id'], reply_indexes)
+
+    def test_processed_ids_returns_the_ids_in_the_DB(self):
+        self.create_comment('abcdex')
+        self.create_comment('fghijk')
+
+        self.assertEqual(Comment.processed_ids(['abcdex', 'fghijk', 'lmnopq']), {'abcdex', 'fghijk'})
+
+    def test_processed_ids_uses_a_single_query(self):
+        with patch.object(Comment, 'select', wraps=Comment.select) as mocked_select:
+            Comment.processed_ids(['abcdex', 'fghijk', 'lmnopq'])
+
+        mocked_select.assert_called_once()
+
+    def test_processed_ids_without_ids(self):
+        self.assertEqual(Comment.processed_ids([]), set())
+
+    def test_delete_duplicates_keeps_the_oldest_row_of_each_id(self):
+        # Tables created before comment_id was unique
+        for index_name in ['comment_comment_id', 'reply_comment_id']:
+            Comment._meta.database.execute_sql(f'DROP INDEX {index_name}')
+
+        comment = self.create_comment('abcdex')
+        repeated_comment = self.create_comment('abcdex')
+        self.create_comment('fghijk')
+        for original_comment in [comment, repeated_comment]:
+            Reply.create(comment_id='lmnopq', original_comment=original_comment, success=True, text='',
+                         timestamp=1, url='')
+
+        self.assertEqual(Comment.delete_duplicates(), 1)
+        self.assertEqual(Reply.delete_duplicates(), 1)
+
+        self.assertEqual([comment.id for comment in Comment.select().order_by(Comment.id)], [comment.id, 3])
+        self.assertEqual([reply.original_comment_id for reply in Reply.select()], [comment.id])
+
+    def test_delete_duplicates_without_duplicates(self):
+        self.create_comment('abcdex')
+
+        self.assertEqual(Comment.delete_duplicates(), 0)
+        self.assertEqual(Comment.select().count(), 1)
+
+
+class TestUnitOfWork(unittest.TestCase):
+
+    def run(self, result=None):
+        self.directory = tempfile.TemporaryDirectory()
+        self.pooled_db = PooledSqliteDatabase(os.path.join(self.directory.name, 'test.db'), max_connections=2)
+
+        with self.pooled_db.bind_ctx([Medal]):
+            super(TestUnitOfWork, self).run(result)
+
+    def setUp(self):
+        self.pooled_db.create_tables([Medal])
+        self.pooled_db.close()
+
+        with open('test/fixtures/models/combat_medal_data.json') as fixture:
+            self.combat_medal_json = json.loads(fixture.read())
+
+    def tearDown(self):
+        self.pooled_db.close_all()
+        self.directory.cleanup()
+
+    def test_connection_goes_back_to_the_pool(self):
+        with unit_of_work(self.pooled_db):
+            self.assertEqual(pool_stats(self.pooled_db)['in_use'], 1)
+
+        self.assertEqual(pool_stats(self.pooled_db), {'max_connections': 2, 'in_use': 0, 'idle': 1})
+
+    def test_connection_is_kept_if_it_was_already_open(self):
+        self.pooled_db.connect()
+
+        with unit_of_work(self.pooled_db):
+            pass
+
+        self.assertFalse(self.pooled_db.is_closed())
+        self.assertEqual(pool_stats(self.pooled_db)['in_use'], 1)
+
+    def test_changes_are_rolled_back_if_there_is_an_error(self):
+        with self.assertRaises(ValueError):
+            with unit_of_work(self.pooled_db):
+                MedalFactory.medal(self.combat_medal_json)
+                raise ValueError('Failing on purpose')
+
+        self.assertEqual(Medal.select().count(), 0)
+
+    def test_can_be_used_as_a_decorator(self):
+        @unit_of_work(self.pooled_db)
+        def create_medal():
+            return MedalFactory.medal(self.combat_medal_json)
+
+        create_medal()
+
+        self.assertEqual(pool_stats(self.pooled_db)['in_use'], 0)
+        self.assertEqual(Medal.select().count(), 1)
+
+    def test_close_connections_closes_the_ones_in_use_too(self):
+        self.pooled_db.connect()
+        with unit_of_work(self.pooled_db):
+            pass
+
+        close_connections(self.pooled_db)
+
+        self.assertTrue(self.pooled_db.is_closed())
+        self.assertEqual(pool_stats(self.pooled_db), {'max_connections': 2, 'in_use': 0, 'idle': 0})
+
+
+class TestInitDB(unittest.TestCase):
+
+    def tearDown(self):
+        db.initialize(None)
+
+    def test_init_db_with_config(self):
+        database = init_db({'database': 'khux', 'user': 'user', 'password': 'pass', 'host': 'host', 'port': 5432,
+                            'max_connections': 3})
+
+        self.assertIsInstance(database, PooledPostgresqlDatabase)
+        self.assertIs(BaseModel._meta.database.obj, database)
+        self.assertEqual(database.database, 'khux')
+        self.assertEqual(database._max_connections, 3)
+
+    def test_is_initialized(self):
+        self.assertFalse(is_initialized(db))
+        init_db({'database': 'khux', 'user': 'user', 'password': 'pass', 'host': 'host', 'port': 5432})
+        self.assertTrue(is_initialized(db))
+        self.assertTrue(is_initialized(peewee.SqliteDatabase(':memory:')))
+
+    def test_init_db_reads_the_environment(self):
+        environment = {'DB_DATABASE': 'db', 'DB_USERNAME': 'user', 'DB_PASSWORD': 'pass', 'DB_HOST': 'host',
+                       'DB_PORT': 'port', 'DB_MAX_CONNECTIONS': '4'}
+
+        with patch.dict(os.environ, environment):
+            database = init_db()
+
+        self.assertEqual(database.database, 'db')
+        self.assertEqual(database.connect_params['user'], 'user')
+        self.assertEqual(database._max_connections, 4)
+
+    def test_db_is_a_database_proxy(self):
+        self.assertIsInstance(db, peewee.DatabaseProxy)
+
+    def test_modules_can_be_imported_without_DB_settings_praw_or_the_pool(self):
+        environment = {key: value for key, value in os.environ.items() if not key.startswith('DB_')}
+        code = ('import sys\n'
+                'import khux_medal_finder.api, khux_medal_finder.bot, khux_medal_finder.reddit\n'
+                'print("praw" in sys.modules, "playhouse.pool" in sys.modules)')
+
+        output = subprocess.check_output([sys.executable, '-c', code], env=environment)
+
+        self.assertEqual(output.strip(), b'False False')
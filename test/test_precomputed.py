@@ -0,0 +1,69 @@
+import unittest
+
+from khux_medal_finder.index import MedalIndex
+from khux_medal_finder.models import Medal, MedalRecord, SearchCombination
+from khux_medal_finder.precomputed import PrecomputedSearch, combination_key, precompute_search_combinations
+
+from test.helpers import SearchFixturesTestCase
+
+
+class TestPrecomputedSearch(SearchFixturesTestCase):
+
+    def setUp(self):
+        super(TestPrecomputedSearch, self).setUp()
+
+        precompute_search_combinations()
+
+        self.search = PrecomputedSearch()
+
+    def test_every_combination_is_precomputed(self):
+        # 4 elements x 4 targets x 3 directions, counting the wildcard
+        self.assertEqual(SearchCombination.select().count(), 48)
+
+    def test_combination_key_uses_wildcards_for_missing_attributes(self):
+        self.assertEqual(combination_key({'element': 'Power', 'direction': 'Upright'}), 'Power|*|Upright')
+
+    def test_combination_key_rejects_attributes_that_arent_precomputed(self):
+        with self.assertRaises(ValueError):
+            combination_key({'tier': 6})
+
+    def test_medals_with_several_filters(self):
+        medals = self.search.medals({'element': 'Power', 'targets': 'All', 'direction': 'Upright'})
+        self.assertEqual(self.names(medals), ['HD KHII Leon', 'Toon Sora', 'Kings Roar'])
+
+    def test_medals_are_medal_records(self):
+        medal = self.search.medals({'element': 'Speed'})[0]
+
+        self.assertIsInstance(medal, MedalRecord)
+        self.assertEqual(medal, MedalRecord.from_medal(Medal.get(Medal.medal_id == medal.medal_id)))
+
+    def test_combine_searches_matches_the_medal_index(self):
+        index = MedalIndex()
+        index.refresh()
+        filters_list = [{'element': 'Speed'}, {'element': 'Power', 'targets': 'All'}, {'direction': 'Reversed'}]
+
+        self.assertEqual(self.names(self.search.combine_searches(filters_list)),
+                         self.names(index.combine_searches(filters_list)))
+
+    def test_combine_searches_respects_the_limit(self):
+        medals = self.search.combine_searches([{'element': 'Power'}, {'element': 'Speed'}], limit=2)
+        self.assertEqual(len(medals), 2)
+
+    def test_combine_searches_without_filters(self):
+        self.assertEqual(self.search.combine_searches([]), [])
+
+    def test_only_the_top_medals_are_stored(self):
+        precompute_search_combinations(top=1)
+
+        self.assertEqual(self.names(self.search.medals({})), ['HD KHII Leon'])
+
+    def test_is_empty(self):
+        self.assertFalse(self.search.is_empty())
+
+        SearchCombination.delete().execute()
+
+        self.assertTrue(self.search.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -134,6 +134,11 @@ class TestRedditService(BaseDBTestCase):
             self.reddit.last_subreddit_comments('test', amount=1000)
             mocked_subreddit_comments.assert_called_once_with(limit=1000)
 
+    def test_subreddit_comments_stream_streams_the_subreddit_comments(self):
+        with mock.patch('praw.models.reddit.subreddit.SubredditStream.comments', autospec=True) as mocked_stream_comments:
+            self.reddit.subreddit_comments_stream('test')
+            mocked_stream_comments.assert_called_once_with(mock.ANY, pause_after=None)
+
     def test_reply_if_there_arent_medals_responds_with_the_correct_text(self):
         self.mock_comment.reply.return_value = self.mock_reply
         expected_reply_body = "I'm sorry, I couldn't find any medal that match your requirements." + "\n\nBeeep bop. I'm a bot! I've been created by Pawah and you can find my code on Github"
@@ -0,0 +1,191 @@
+import os
+import unittest
+import praw
+import prawcore
+from datetime import datetime, timedelta
+from unittest import mock
+
+from peewee import IntegrityError, OperationalError
+
+from khux_medal_finder.models import Comment, PendingReply, Reply
+from khux_medal_finder.reddit import RedditService, ReplyScheduler, TokenBucket
+
+from test.helpers import BaseDBTestCase
+from test.test_reddit_reddit_service import ENV_MOCK
+
+
+def mock_comment(comment_id):
+    comment = mock.Mock()
+    comment.id = comment_id
+    comment.author = 'Francisco Umbral'
+    comment.body = 'u/khux_medal_finder power'
+    comment.created = 1
+    comment.permalink = f'/r/KHUX/comments/{comment_id}/'
+    return comment
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_allows_bursts_up_to_the_capacity(self):
+        bucket = TokenBucket(rate=0.001, capacity=3)
+
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_tokens_are_refilled_over_time(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        bucket.take()
+
+        bucket.updated_at -= 1
+
+        self.assertTrue(bucket.take())
+
+    def test_update_limits_the_tokens_to_the_remaining_requests(self):
+        bucket = TokenBucket(rate=0.001, capacity=5)
+
+        bucket.update({'remaining': 1, 'used': 599})
+
+        self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+
+    def test_update_blocks_until_the_limit_is_reset(self):
+        bucket = TokenBucket(rate=1000, capacity=5)
+
+        bucket.update({'remaining': 0, 'used': 600, 'reset_timestamp': bucket.updated_at + 60})
+
+        self.assertFalse(bucket.take())
+
+    def test_update_ignores_unknown_limits(self):
+        bucket = TokenBucket(rate=0.001, capacity=2)
+
+        bucket.update({'remaining': None, 'used': None})
+
+        self.assertEqual(bucket.tokens, 2)
+
+
+class TestReplyScheduler(BaseDBTestCase):
+
+    def setUp(self):
+        super(TestReplyScheduler, self).setUp()
+
+        with mock.patch.dict(os.environ, ENV_MOCK), mock.patch('praw.models.User.me', return_value=None):
+            self.reddit_service = RedditService()
+
+        self.reddit_service.reddit = mock.Mock()
+        self.reddit_service.reddit.auth.limits = {'remaining': None, 'used': None}
+        self.reddit_comment = self.reddit_service.reddit.comment.return_value
+        self.reddit_comment.reply.return_value = mock.Mock(id='r1', created=2, permalink='/r/KHUX/comments/r1/')
+
+        self.scheduler = ReplyScheduler(self.reddit_service, bucket=TokenBucket(rate=0.001, capacity=10))
+
+    def test_enqueue_saves_the_reply(self):
+        self.scheduler.enqueue(mock_comment('a1'), [])
+
+        pending_reply = PendingReply.get()
+        self.assertEqual(pending_reply.comment_id, 'a1')
+        self.assertEqual(pending_reply.reply_text, RedditService.REPLY_NO_MEDALS)
+        self.assertFalse(pending_reply.success)
+
+    def test_enqueue_doesnt_repeat_replies(self):
+        self.scheduler.enqueue(mock_comment('a1'), [])
+        self.scheduler.enqueue(mock_comment('a1'), [])
+
+        self.assertEqual(PendingReply.select().count(), 1)
+
+    def test_send_pending_sends_the_reply_and_saves_it(self):
+        self.scheduler.enqueue(mock_comment('a1'), [])
+
+        self.assertEqual(self.scheduler.send_pending(), 1)
+
+        self.reddit_service.reddit.comment.assert_called_once_with(id='a1')
+        self.reddit_comment.reply.assert_called_once_with(RedditService.REPLY_NO_MEDALS)
+        self.assertEqual(PendingReply.select().count(), 0)
+        self.assertEqual(Reply.get().original_comment, Comment.get(Comment.comment_id == 'a1'))
+
+    def test_send_pending_respects_the_rate_limit(self):
+        self.scheduler.bucket = TokenBucket(rate=0.001, capacity=1)
+        self.scheduler.enqueue(mock_comment('a1'), [])
+        self.scheduler.enqueue(mock_comment('a2'), [])
+
+        self.assertEqual(self.scheduler.send_pending(), 1)
+        self.assertEqual(PendingReply.select().count(), 1)
+
+    def test_send_pending_updates_the_bucket_with_the_reddit_limits(self):
+        self.reddit_service.reddit.auth.limits = {'remaining': 0, 'used': 600}
+        for comment_id in ('a1', 'a2'):
+            self.scheduler.enqueue(mock_comment(comment_id), [])
+
+        self.assertEqual(self.scheduler.send_pending(), 1)
+
+    def test_failed_replies_are_retried_later(self):
+        self.reddit_comment.reply.side_effect = praw.exceptions.RedditAPIException([['RATELIMIT', 'Try again', 'ratelimit']])
+        self.scheduler.enqueue(mock_comment('a1'), [])
+
+        self.assertEqual(self.scheduler.send_pending(), 0)
+
+        pending_reply = PendingReply.get()
+        self.assertEqual(pending_reply.attempts, 1)
+        self.assertGreater(pending_reply.next_attempt_at, datetime.now())
+        self.assertEqual(Comment.select().count(), 0)
+
+    def test_retried_replies_are_sent_when_reddit_recovers(self):
+        self.reddit_comment.reply.side_effect = [prawcore.exceptions.ServerError(mock.Mock(status_code=503)),
+                                                 self.reddit_comment.reply.return_value]
+        self.scheduler.enqueue(mock_comment('a1'), [])
+        self.scheduler.send_pending()
+
+        PendingReply.update(next_attempt_at=datetime.now() - timedelta(seconds=1)).execute()
+
+        self.assertEqual(self.scheduler.send_pending(), 1)
+        self.assertEqual(Reply.select().count(), 1)
+
+    def test_replies_arent_retried_after_the_max_attempts(self):
+        self.scheduler.enqueue(mock_comment('a1'), [])
+        PendingReply.update(attempts=self.scheduler.max_attempts).execute()
+
+        self.assertEqual(self.scheduler.send_pending(), 0)
+        self.reddit_comment.reply.assert_not_called()
+
+    def test_replies_that_reach_the_max_attempts_are_reported(self):
+        self.reddit_comment.reply.side_effect = prawcore.exceptions.ServerError(mock.Mock(status_code=503))
+        self.scheduler.enqueue(mock_comment('a1'), [])
+        PendingReply.update(attempts=self.scheduler.max_attempts - 1).execute()
+
+        with mock.patch('khux_medal_finder.reddit.count') as count:
+            self.scheduler.send_pending()
+
+        count.assert_called_once_with('replies_failed')
+        self.assertEqual([pending_reply.comment_id for pending_reply in self.scheduler.failed()], ['a1'])
+
+    def test_sent_replies_arent_sent_again_if_saving_them_fails(self):
+        self.scheduler.enqueue(mock_comment('a1'), [])
+
+        with mock.patch.object(self.reddit_service, 'save_reply', side_effect=IntegrityError('duplicated')):
+            self.assertEqual(self.scheduler.send_pending(), 0)
+
+        pending_reply = PendingReply.get()
+        self.assertEqual(pending_reply.attempts, 1)
+        self.assertEqual(pending_reply.reply_id, 'r1')
+
+        # Even after a restart, only saving the reply is retried
+        PendingReply.update(next_attempt_at=datetime.now() - timedelta(seconds=1)).execute()
+        scheduler = ReplyScheduler(self.reddit_service, bucket=TokenBucket(rate=0.001, capacity=10))
+
+        self.assertEqual(scheduler.send_pending(), 1)
+        self.reddit_comment.reply.assert_called_once_with(RedditService.REPLY_NO_MEDALS)
+        self.assertEqual(Reply.get().comment_id, 'r1')
+        self.assertEqual(PendingReply.select().count(), 0)
+
+    def test_sent_replies_arent_sent_again_if_marking_them_as_sent_fails(self):
+        self.scheduler.enqueue(mock_comment('a1'), [])
+
+        with mock.patch.object(PendingReply, 'mark_as_sent', side_effect=OperationalError('database is down')):
+            self.assertEqual(self.scheduler.send_pending(), 0)
+
+        PendingReply.update(next_attempt_at=datetime.now() - timedelta(seconds=1)).execute()
+
+        self.assertEqual(self.scheduler.send_pending(), 1)
+        self.reddit_comment.reply.assert_called_once_with(RedditService.REPLY_NO_MEDALS)
+        self.assertEqual(Reply.get().comment_id, 'r1')
+
+
+if __name__ == '__main__':
+    unittest.main()